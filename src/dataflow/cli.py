@@ -6,11 +6,29 @@ from .core.pipeline import run_from_config
 
 def main():
     ap = argparse.ArgumentParser()
-    ap.add_argument("cmd", choices=["run"])
+    ap.add_argument("cmd", choices=["run", "watch", "serve", "plan"])
     ap.add_argument("-c","--config", required=True)
+    ap.add_argument("--interval", type=float, default=2.0, help="watch: 轮询间隔（秒）")
+    ap.add_argument("--debounce", type=float, default=1.0, help="watch: 输入稳定多久后开始处理（秒）")
+    ap.add_argument("--host", default="127.0.0.1", help="serve: 监听地址")
+    ap.add_argument("--port", type=int, default=8600, help="serve: 端口")
+    ap.add_argument("--pool-size", type=int, default=4, help="serve: 每库只读连接数")
+    ap.add_argument("--timeout-ms", type=float, default=5000, help="serve: 默认查询超时")
+    ap.add_argument("--shared-cache", action="store_true", help="serve: 同库连接共享页缓存")
+    ap.add_argument("--json", action="store_true", help="plan: 以 JSON 输出")
     args = ap.parse_args()
     if args.cmd == "run":
         run_from_config(args.config)
+    elif args.cmd == "watch":
+        from .core.watch import Watcher
+        Watcher(args.config, interval=args.interval, debounce=args.debounce).run_forever()
+    elif args.cmd == "serve":
+        from .core.serve import serve_from_config
+        serve_from_config(args.config, host=args.host, port=args.port, pool_size=args.pool_size,
+                          timeout_ms=args.timeout_ms, shared_cache=args.shared_cache)
+    elif args.cmd == "plan":
+        from .core.plan import plan_from_config
+        print(plan_from_config(args.config, as_json=args.json))
 
 if __name__ == "__main__":
     main()
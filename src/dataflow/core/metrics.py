@@ -0,0 +1,51 @@
+"""Per-step run metrics (work units + wall time) recorded to run_metrics.jsonl."""
+
+from __future__ import annotations
+from typing import Dict, Any, List
+from pathlib import Path
+import json, time
+from .artifact import Artifact
+
+METRICS_FILE = "run_metrics.jsonl"
+
+def work_units(arts: Dict[str, Artifact]) -> Dict[str, int]:
+    """从一步的输入+输出产物统计工作量：tables / rows / clusters / dbs / iterations / llm_calls"""
+    u: Dict[str, int] = {}
+    def data(kind):
+        art = arts.get(kind)
+        return art.data if art is not None and isinstance(art.data, dict) else None
+    if (ir := data("IR")) is not None:
+        u["tables"] = len(ir.get("table_header", {}))
+        u["rows"] = sum(int(c.get("row_count") or 0) for c in ir.get("table_content", {}).values())
+    if (emb := data("Embeddings")) is not None:
+        u["tables"] = len(emb.get("ids", []))
+    if (cmap := data("ClusterMap")) is not None:
+        u["clusters"] = len(cmap)
+    for kind in ("LogicalDB", "DDLBundle", "AgentReadyMeta", "AugmentResult"):
+        if (d := data(kind)) is not None:
+            u["dbs"] = len(d)
+    if (meta := data("AgentReadyMeta")) is not None:
+        u["tables"] = sum(len(m.get("table_meta", {})) for m in meta.values())
+    if (res := data("AugmentResult")) is not None:
+        u["iterations"] = sum(int(r.get("iterations") or 0) for r in res.values())
+        u["llm_calls"] = sum(int(r.get("llm_calls") or 0) for r in res.values())
+    if (db := data("SQLiteDB")) is not None:
+        u["dbs"] = len(db.get("db_paths", []))
+    return u
+
+def record_step(workdir: str | Path, op: str, seconds: float, units: Dict[str, int], params: Dict[str, Any]):
+    line = {"ts": round(time.time(), 3), "op": op, "seconds": round(seconds, 4), "units": units,
+            "params": {k: v for k, v in params.items() if isinstance(v, (int, float, str, bool)) or v is None}}
+    with open(Path(workdir) / METRICS_FILE, "a", encoding="utf-8") as f:
+        f.write(json.dumps(line, ensure_ascii=False) + "\n")
+
+def load_history(workdir: str | Path) -> List[Dict[str, Any]]:
+    """workdir 及其分区子目录下所有历史记录"""
+    out = []
+    for p in sorted(Path(workdir).rglob(METRICS_FILE)):
+        for line in p.read_text("utf-8").splitlines():
+            try:
+                out.append(json.loads(line))
+            except ValueError:
+                continue   # 中断写入留下的半行
+    return out
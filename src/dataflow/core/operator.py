@@ -13,6 +13,10 @@ class Operator:
         """子类实现核心逻辑。inputs 的 key = kind，value = Artifact"""
         raise NotImplementedError
 
+    # 可选：逐表流式接口 stream(upstream, ir, **params)（协议见 core/stream.py）。
+    # streaming 模式下相邻的可流式步骤各占一个线程、经有界队列逐表传递
+    stream = None
+
     # 可选：统一的缓存键（基于输入 hash + params）
     @classmethod
     def cache_key(cls, inputs: Dict[str, Artifact], params: Dict[str, Any]) -> str:
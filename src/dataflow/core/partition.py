@@ -0,0 +1,82 @@
+"""Keyed partitioning of artifacts for per-cluster / per-database fan-out."""
+
+from __future__ import annotations
+from typing import Dict, Any, List, Callable
+from pathlib import Path
+from .artifact import Artifact
+
+# 可作为 partition_by 的产物：data 是 {key: ...} 的字典
+PARTITION_KINDS = ("ClusterMap", "LogicalDB", "DDLBundle", "AgentReadyMeta")
+
+def _tables_of(kind: str, part: Dict[str, Any]) -> List[str]:
+    """分区所涉及的 IR 表"""
+    if kind == "ClusterMap":
+        return [t for ts in part.values() for t in ts]
+    return [t for m in part.values() for t in m.get("source_tables", [])]
+
+def _slice_ir(art: Artifact, tables: List[str]) -> Artifact:
+    keep = set(tables)
+    data = {k: ({t: v for t, v in art.data[k].items() if t in keep}
+                if k in ("table_header", "table_schema", "table_content") else v)
+            for k, v in art.data.items()}
+    return Artifact(kind=art.kind, uri=art.uri, data=data, meta=dict(art.meta))
+
+def partition_keys(art: Artifact) -> List[str]:
+    if not isinstance(art.data, dict):
+        raise ValueError(f"cannot partition {art.kind}: data is not keyed")
+    return list(art.data)
+
+def slice_inputs(ctx: Dict[str, Artifact], kind: str, key: str) -> Dict[str, Artifact]:
+    """某个分区可见的 ctx：分区产物只保留该 key，IR 只保留该分区用到的表，其余共享 data。
+    一律给新的 Artifact 对象：同进程运行的分区落盘时会清空自己 store 里产物的 data，不能波及父 store"""
+    src = ctx[kind]
+    part = {key: src.data[key]}
+    out = {}
+    for k, art in ctx.items():
+        if k == kind:
+            out[k] = Artifact(kind=k, uri=art.uri, data=part, meta=dict(art.meta))
+        elif k == "IR" and isinstance(art.data, dict):
+            out[k] = _slice_ir(art, _tables_of(kind, part))
+        else:
+            out[k] = Artifact(kind=art.kind, uri=art.uri, data=art.data, meta=dict(art.meta))
+    return out
+
+def _merge_sqlite(parts: List[Any]) -> Any:
+    # 重跑的分区会再次给出同一路径，去重保序
+    return {"db_paths": list(dict.fromkeys(p for d in parts for p in d.get("db_paths", [])))}
+
+def _merge_default(parts: List[Any]) -> Any:
+    if all(isinstance(d, dict) for d in parts):
+        merged: Dict[str, Any] = {}
+        for d in parts:
+            merged.update(d)
+        return merged
+    if all(isinstance(d, list) for d in parts):
+        return [x for d in parts for x in d]
+    return parts
+
+MERGERS: Dict[str, Callable[[List[Any]], Any]] = {
+    "SQLiteDB": _merge_sqlite,
+}
+
+def drop_partitions(art: Artifact, names: List[str]) -> Artifact:
+    """从合并产物中去掉已不存在的分区：按 key 或库文件名（stem）匹配"""
+    gone = set(names)
+    hit = lambda k: k in gone or Path(str(k)).stem in gone
+    if art.kind == "SQLiteDB":
+        data = {"db_paths": [p for p in art.data.get("db_paths", []) if not hit(p)]}
+    elif isinstance(art.data, dict):
+        data = {k: v for k, v in art.data.items() if not hit(k)}
+    else:
+        return art
+    out = Artifact(kind=art.kind, data=data, meta=dict(art.meta))
+    return out.save_json(art.uri) if art.uri else out
+
+def merge_artifacts(kind: str, parts: List[Artifact], workdir: str) -> Artifact:
+    """按分区顺序合并同 kind 产物；分区产物带文件时合并结果写到 workdir 下同名文件"""
+    data = MERGERS.get(kind, _merge_default)([p.data for p in parts])
+    art = Artifact(kind=kind, data=data, meta={"partitions": [p.uri for p in parts]})
+    names = {p.uri.replace("\\", "/").rsplit("/", 1)[-1] for p in parts if p.uri}
+    if len(names) == 1:
+        art.save_json(f"{workdir}/{names.pop()}")
+    return art
@@ -3,42 +3,195 @@
 from __future__ import annotations
 from typing import Dict, Any, List, Type
 from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import nullcontext
+import os, re, time
 from .artifact import Artifact
+from .partition import partition_keys, slice_inputs, merge_artifacts
+from .store import ArtifactStore
+from .metrics import work_units, record_step
+from .stream import segment_end, run_stream
 from .operator import Operator
-from .registry import OP_REGISTRY
+from .registry import OP_REGISTRY, load_builtin_operators
 from .config import load_yaml
 from ..utils.logging import get_logger
 
 log = get_logger(__name__)
 
 class Pipeline:
-    def __init__(self, workdir: str):
+    def __init__(self, workdir: str, partition_workers: int | None = None, memory_budget_mb: float | None = None,
+                 keep_pool: bool = False, streaming: bool = False, stream_buffer: int = 16,
+                 shared_workdir: str | None = None, run_id: str | None = None):
         self.workdir = Path(workdir)
         self.workdir.mkdir(parents=True, exist_ok=True)
-        self.ctx: Dict[str, Artifact] = {}   # 最新产物（按 kind 存放）
+        # 分区 Pipeline 的 shared_workdir 是根 workdir，run_id 标识同一次扇出：
+        # 算子据此把缓存、断点、预算等放在各分区共用的位置（见 AugmentWithLLM）
+        self.shared_workdir = Path(shared_workdir) if shared_workdir else self.workdir
+        self.run_id = run_id or f"{os.getpid()}-{time.time_ns()}"
+        self._fanouts = 0
+        self.ctx = ArtifactStore(self.workdir / "spill")   # 最新产物（按 kind 存放）
+        self.partition_workers = partition_workers
+        self.memory_budget_mb = memory_budget_mb
+        # keep_pool：分区进程池跨多次 run_partitioned 复用（常驻模式下保持 worker 内的导入与客户端热身）
+        self.keep_pool = keep_pool
+        self._pool: ProcessPoolExecutor | None = None
+        # streaming：相邻的可流式步骤（摄取→去重→嵌入）逐表流水执行，队列容量 stream_buffer 张表
+        self.streaming = streaming
+        self.stream_buffer = stream_buffer
+
+    def _executor(self, workers: int):
+        if not self.keep_pool:
+            return ProcessPoolExecutor(max_workers=workers)
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=max(1, self.partition_workers or os.cpu_count() or 1))
+        return nullcontext(self._pool)
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    def run_step(self, step: Dict[str, Any], label: str = ""):
+        op_name = step["op"]
+        params = step.get("params", {})
+        op_cls: Type[Operator] = OP_REGISTRY[op_name]
+        op = op_cls()
+        log.info(f"{label} Run Operator: {op_name} params={params}")
+
+        # 匹配输入：从 ctx 里取算子声明的 input_kinds（缺就给空 Artifact）
+        inputs: Dict[str, Artifact] = {}
+        for k in op.input_kinds:
+            if k in self.ctx:
+                inputs[k] = self.ctx[k]
+
+        t0 = time.perf_counter()
+        outputs = op.run(inputs, workdir=str(self.workdir), shared_workdir=str(self.shared_workdir), run_id=self.run_id,
+                         **params)
+        # 耗时与工作量记入 run_metrics.jsonl，供 plan 估算吞吐
+        record_step(self.workdir, op_name, time.perf_counter() - t0, work_units({**inputs, **outputs}), params)
+        # 合并产物到 ctx，允许同 kind 覆盖
+        for kind, art in outputs.items():
+            self.ctx[kind] = art
+
+    def release(self, uses: List[set], i: int):
+        """第 i 步开始前：之后不再被读取的产物落盘；超出内存预算时再按下次使用最远优先落盘"""
+        for kind in self.ctx.resident():
+            if not any(kind in u for u in uses[i:]):
+                self.ctx.spill(kind)
+        if not self.memory_budget_mb:
+            return
+        budget = self.memory_budget_mb * 1024 * 1024
+        live = self.ctx.resident()
+        total = sum(self.ctx.size(k) for k in live)
+        next_use = {k: next(j for j in range(i, len(uses)) if k in uses[j]) for k in live}
+        for kind in sorted(live, key=lambda k: -next_use[k]):
+            if total <= budget or next_use[kind] == i:
+                break
+            total -= self.ctx.size(kind)
+            self.ctx.spill(kind)
+            log.info(f"memory budget: spilled {kind} (next used by step {next_use[kind]+1})")
 
     def run_steps(self, steps: List[Dict[str, Any]]):
-        for i, step in enumerate(steps):
-            op_name = step["op"]
-            params = step.get("params", {})
-            op_cls: Type[Operator] = OP_REGISTRY[op_name]
-            op = op_cls()
-            log.info(f"[{i+1}/{len(steps)}] Run Operator: {op_name} params={params}")
-
-            # 匹配输入：从 ctx 里取算子声明的 input_kinds（缺就给空 Artifact）
-            inputs: Dict[str, Artifact] = {}
-            for k in op.input_kinds:
-                if k in self.ctx:
-                    inputs[k] = self.ctx[k]
-
-            outputs = op.run(inputs, workdir=str(self.workdir), **params)
-            # 合并产物到 ctx，允许同 kind 覆盖
-            for kind, art in outputs.items():
+        load_builtin_operators()
+        # 每步读取的产物 kind（活跃性分析用）
+        uses = [set(OP_REGISTRY[s["op"]].input_kinds) | ({s["partition_by"]} if s.get("partition_by") else set())
+                for s in steps]
+        i = 0
+        while i < len(steps):
+            self.release(uses, i)
+            kind = steps[i].get("partition_by")
+            end = segment_end(steps, i) if self.streaming else i
+            if end > i:
+                self.run_stream(steps[i:end], f"[{i+1}-{end}/{len(steps)}]")
+                i = end
+                continue
+            if not kind:
+                self.run_step(steps[i], f"[{i+1}/{len(steps)}]")
+                i += 1
+                continue
+            # 连续声明同一 partition_by 的步骤组成一条链，按分区整链扇出
+            j = i
+            while j < len(steps) and steps[j].get("partition_by") == kind:
+                j += 1
+            self.run_partitioned(steps[i:j], kind, f"[{i+1}-{j}/{len(steps)}]")
+            i = j
+        return self.ctx
+
+    def run_stream(self, steps: List[Dict[str, Any]], label: str = ""):
+        log.info(f"{label} Stream Operators: {' -> '.join(s['op'] for s in steps)} (buffer={self.stream_buffer})")
+        ir, outputs, stats = run_stream(steps, self.ctx, str(self.workdir), self.stream_buffer)
+        self.ctx["IR"] = Artifact(kind="IR", data=ir)
+        for step, outs, st in zip(steps, outputs, stats):
+            # 各步耗时按自身忙碌时间记（不含等上游/被下游背压的时间），工作量按其产出的表
+            units = {**work_units(outs), "tables": st["tables"], "rows": st["rows"]}
+            record_step(self.workdir, step["op"], st["seconds"], units, step.get("params", {}))
+            log.info(f"{label} {step['op']}: {st['tables']} tables, busy {st['seconds']:.2f}s")
+            for kind, art in outs.items():
                 self.ctx[kind] = art
 
-        return self.ctx
+    def run_partitioned(self, steps: List[Dict[str, Any]], kind: str, label: str = "", keys: List[str] | None = None):
+        """按 kind 的 key 把 steps 链扇出为独立任务（各自 workdir/partitions/{key}），完成后按 kind 合并产物。
+        给定 keys 时只重跑这些分区，新产物合并进 ctx 中已有的同 kind 产物"""
+        if kind not in self.ctx:
+            raise ValueError(f"partition_by {kind!r}: no such artifact produced by earlier steps")
+        subset = keys is not None
+        keys = partition_keys(self.ctx[kind]) if keys is None else [k for k in partition_keys(self.ctx[kind]) if k in set(keys)]
+        if not keys:
+            return
+        chain = [{k: v for k, v in s.items() if k != "partition_by"} for s in steps]
+        workers = max(1, min(self.partition_workers or os.cpu_count() or 1, len(keys) or 1))
+        log.info(f"{label} Fan out {[s['op'] for s in chain]} over {len(keys)} {kind} partitions (workers={workers})")
+
+        # 只把链内算子会读的产物发给分区
+        needed = {kind} | {k for s in chain for k in OP_REGISTRY[s["op"]].input_kinds}
+        shared = {k: self.ctx[k] for k in self.ctx if k in needed}
+
+        self._fanouts += 1
+        run_id = f"{self.run_id}-{self._fanouts}"
+
+        def job(key: str):
+            return (chain, slice_inputs(shared, kind, key),
+                    str(self.workdir / "partitions" / re.sub(r"[^\w.-]", "_", str(key))), self.memory_budget_mb,
+                    str(self.shared_workdir), run_id)
+
+        results: Dict[str, Dict[str, Artifact]] = {}
+        failed: Dict[str, str] = {}
+        if workers == 1:
+            for key in keys:
+                results[key] = run_partition(*job(key))
+        else:
+            with self._executor(workers) as pool:
+                futs = {pool.submit(run_partition, *job(key)): key for key in keys}
+                for fut in as_completed(futs):
+                    key = futs[fut]
+                    try:
+                        results[key] = fut.result()
+                        log.info(f"{label} partition {kind}={key} done ({len(results)}/{len(keys)})")
+                    except Exception as e:
+                        failed[key] = repr(e)
+                        log.error(f"{label} partition {kind}={key} failed: {e!r}")
+        if failed:
+            raise RuntimeError(f"{len(failed)} of {len(keys)} {kind} partitions failed: {failed}")
+
+        produced = list(dict.fromkeys(k for key in keys for k in results[key]))
+        for out_kind in produced:
+            parts = [results[key][out_kind] for key in keys if out_kind in results[key]]
+            if subset and out_kind in self.ctx:
+                parts.insert(0, self.ctx[out_kind])
+            self.ctx[out_kind] = merge_artifacts(out_kind, parts, str(self.workdir))
+
+def run_partition(steps: List[Dict[str, Any]], inputs: Dict[str, Artifact], workdir: str,
+                  memory_budget_mb: float | None = None, shared_workdir: str | None = None,
+                  run_id: str | None = None) -> Dict[str, Artifact]:
+    """在独立 Pipeline 中跑一个分区的步骤链，返回该链新产出的产物"""
+    pl = Pipeline(workdir, memory_budget_mb=memory_budget_mb, shared_workdir=shared_workdir, run_id=run_id)
+    pl.ctx.update(inputs)
+    ctx = pl.run_steps(steps)
+    return {k: v for k, v in ctx.items() if inputs.get(k) is not v}
 
 def run_from_config(path: str):
     cfg = load_yaml(path)
-    pl = Pipeline(workdir=cfg.get("workdir", "./workdir"))
+    pl = Pipeline(workdir=cfg.get("workdir", "./workdir"), partition_workers=cfg.get("partition_workers"),
+                  memory_budget_mb=cfg.get("memory_budget_mb"), streaming=bool(cfg.get("streaming")),
+                  stream_buffer=int(cfg.get("stream_buffer", 16)))
     return pl.run_steps(cfg["steps"])
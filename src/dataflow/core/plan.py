@@ -0,0 +1,216 @@
+"""Dry-run planner: estimate work, external calls, runtime and cost of a pipeline config without running it."""
+
+from __future__ import annotations
+from typing import Dict, Any, List
+from pathlib import Path
+import json, math, os
+from slugify import slugify
+from .config import load_yaml
+from .metrics import load_history
+from .registry import load_builtin_operators
+from .stream import segment_end
+
+# 各算子耗时按哪种工作量折算（与 metrics.work_units 的键一致）
+UNITS = {"IngestFiles": "rows", "IngestDB": "rows", "Deduplicate": "tables", "DiscoverKeys": "rows",
+         "EmbedTables": "tables", "AdaptiveCluster": "tables", "ConsolidateSchema": "clusters", "CompileDDL": "dbs",
+         "BuildSQLite": "rows", "AugmentWithLLM": "iterations", "OptimizeSQLite": "dbs", "QualityCheck": "tables",
+         "ExportParquet": "rows"}
+
+_SAMPLE_BYTES = 1 << 16
+
+def _text_rows(p: Path, size: int, marker: bytes, skip: int) -> int:
+    # 读文件头 64KB，按其中的记录密度外推
+    with open(p, "rb") as f:
+        head = f.read(_SAMPLE_BYTES)
+    n = head.count(marker)
+    if size <= len(head):
+        return max(0, n - skip)
+    return max(0, int(n * size / max(1, len(head))) - skip)
+
+def file_rows(p: Path) -> int:
+    size = p.stat().st_size
+    ext = p.suffix.lower()
+    if ext == ".parquet":
+        import pyarrow.parquet as pq
+        return pq.ParquetFile(p).metadata.num_rows
+    if ext in (".xlsx", ".xls"):
+        try:
+            from openpyxl import load_workbook
+            wb = load_workbook(p, read_only=True)
+            try:
+                return max(0, (wb.active.max_row or 1) - 1)
+            finally:
+                wb.close()
+        except Exception:
+            return size // 64
+    if ext == ".json":
+        return _text_rows(p, size, b"{", 0)
+    return _text_rows(p, size, b"\n", 1)
+
+def scan_files(params: Dict[str, Any]) -> Dict[str, Any]:
+    files = {}
+    for pattern in params.get("input_globs", []):
+        for p in Path().glob(pattern):
+            if p.is_file():
+                files[str(p)] = p
+    rows, size = 0, 0
+    for p in files.values():
+        size += p.stat().st_size
+        try:
+            rows += file_rows(p)
+        except Exception:
+            rows += p.stat().st_size // 64
+    return {"files": len(files), "bytes": size, "tables": len({slugify(p.stem) for p in files.values()}), "rows": rows}
+
+def _db_rows(conn, dialect: str, table: str) -> int | None:
+    from sqlalchemy import text
+    q = {"sqlite": ["SELECT stat FROM sqlite_stat1 WHERE tbl = :t", 'SELECT MAX(rowid) FROM "{t}"'],
+         "postgresql": ["SELECT reltuples::bigint FROM pg_class WHERE relname = :t"],
+         "mysql": ["SELECT table_rows FROM information_schema.tables WHERE table_schema = DATABASE() AND table_name = :t"]}
+    for sql in q.get(dialect, []):
+        try:
+            v = conn.execute(text(sql.replace("{t}", table.replace('"', '""'))), {"t": table}).scalar()
+        except Exception:
+            continue
+        if v is not None:
+            return int(str(v).split()[0])
+    return None
+
+def scan_db(params: Dict[str, Any]) -> Dict[str, Any]:
+    """反射表清单；行数取统计信息（sqlite_stat1 / MAX(rowid) / pg_class / information_schema），不做 COUNT(*)"""
+    from sqlalchemy import create_engine, inspect
+    engine = create_engine(params["uri"])
+    try:
+        tables = inspect(engine).get_table_names()
+        rows, unknown = 0, 0
+        with engine.connect() as conn:
+            for t in tables:
+                n = _db_rows(conn, engine.dialect.name, t)
+                rows += n or 0
+                unknown += n is None
+        return {"tables": len(tables), "rows": rows, "tables_without_row_estimate": unknown}
+    finally:
+        engine.dispose()
+
+def throughput(history: List[Dict[str, Any]], recent: int = 20) -> Dict[str, float]:
+    """各算子最近 recent 次运行的 秒/工作量单位"""
+    by_op: Dict[str, List[Dict[str, Any]]] = {}
+    for r in history:
+        unit = UNITS.get(r.get("op"))
+        if unit and r.get("units", {}).get(unit):
+            by_op.setdefault(r["op"], []).append(r)
+    out = {}
+    for op, rs in by_op.items():
+        rs = rs[-recent:]
+        out[op] = sum(r["seconds"] for r in rs) / sum(r["units"][UNITS[op]] for r in rs)
+    return out
+
+def avg_per_db(history: List[Dict[str, Any]], unit: str = "iterations") -> float | None:
+    """历史 AugmentWithLLM 运行中每个库平均的 unit（iterations / llm_calls）；没有记录该项的运行不计"""
+    rs = [r for r in history if r.get("op") == "AugmentWithLLM" and r.get("units", {}).get("dbs")
+          and unit in r["units"]]
+    return sum(r["units"][unit] for r in rs) / sum(r["units"]["dbs"] for r in rs) if rs else None
+
+def plan(cfg: Dict[str, Any]) -> Dict[str, Any]:
+    workdir = cfg.get("workdir", "./workdir")
+    history = load_history(workdir) if Path(workdir).exists() else []
+    rate = throughput(history)
+    iters = avg_per_db(history, "iterations")
+    per_db_calls = avg_per_db(history, "llm_calls")
+    prices = cfg.get("plan", {})
+    partition_workers = cfg.get("partition_workers") or os.cpu_count() or 1
+    # 符号化执行：按步骤推进的 工作量 状态
+    st = {"tables": 0, "rows": 0, "clusters": 0, "dbs": 0}
+    steps, totals = [], {"embedding_requests": 0, "llm_calls_min": 0, "llm_calls_max": 0, "llm_calls_expected": 0,
+                         "sandbox_runs_max": 0, "qc_scans": 0}
+    for step in cfg.get("steps", []):
+        op, p = step["op"], step.get("params", {})
+        calls: Dict[str, Any] = {}
+        info: Dict[str, Any] = {}
+        if op == "IngestFiles":
+            info = scan_files(p)
+            st.update(tables=info["tables"], rows=info["rows"])
+        elif op == "IngestDB":
+            try:
+                info = scan_db(p)
+                st.update(tables=info["tables"], rows=info["rows"])
+            except Exception as e:
+                info = {"error": repr(e)}
+        elif op == "EmbedTables":
+            calls["embedding_requests"] = 0 if p.get("provider", "dummy") == "dummy" else st["tables"]
+        elif op == "AdaptiveCluster":
+            t = st["tables"]
+            st["clusters"] = max(min(int(p.get("initial_k", 50)), t), math.ceil(t / int(p.get("max_cluster_size", 20)))) if t else 0
+        elif op == "ConsolidateSchema":
+            st["dbs"] = st["clusters"]
+            if p.get("provider", "llm_http") == "llm_http":
+                # 上限：簇成员未变的缓存命中不再请求
+                calls.update(llm_calls_min=0, llm_calls_max=st["clusters"], llm_calls_expected=st["clusters"])
+        elif op == "AugmentWithLLM":
+            n, m = st["dbs"], int(p.get("max_iterations", 20))
+            it = iters if iters is not None else m
+            # 每库先有一次生成初始代码的调用，之后每轮执行一次沙箱，未通过的轮次再调用一次修复：
+            # LLM 调用 ≤ 1 + m，沙箱执行 ≤ m。期望值优先用历史里每库的实际调用数（通过的那一轮不再调用）
+            calls.update(llm_calls_min=n, llm_calls_max=n * (1 + m), sandbox_runs_max=n * m,
+                         llm_calls_expected=round(n * (per_db_calls if per_db_calls is not None else 1 + it)))
+            # 每轮执行后增量 QC；上限按每轮全表计
+            calls["qc_scans"] = st["tables"] * m
+        elif op == "QualityCheck":
+            calls["qc_scans"] = st["tables"]
+        units = dict(st)
+        units["iterations"] = round(st["dbs"] * it) if op == "AugmentWithLLM" else 0
+        unit = UNITS.get(op)
+        seconds = rate[op] * units.get(unit, 0) if op in rate else None
+        if seconds is not None and step.get("partition_by"):
+            seconds /= min(partition_workers, max(1, st["clusters"]))
+        for k, v in calls.items():
+            totals[k] += v
+        steps.append({"op": op, "unit": unit, "units": units.get(unit), "calls": calls, "source": info,
+                      "seconds": None if seconds is None else round(seconds, 2),
+                      "partitioned": bool(step.get("partition_by"))})
+    # streaming：同一流水段内各步重叠执行，段耗时取最慢的一步
+    cfg_steps = cfg.get("steps", [])
+    segments = [[k] for k in range(len(steps))]
+    if cfg.get("streaming"):
+        load_builtin_operators()
+        segments, i = [], 0
+        while i < len(cfg_steps):
+            end = max(segment_end(cfg_steps, i), i + 1)
+            segments.append(list(range(i, end)))
+            for k in range(i, end):
+                steps[k]["streamed"] = end - i > 1
+            i = end
+    seg_secs = [max(known) for seg in segments
+                if (known := [steps[k]["seconds"] for k in seg if steps[k]["seconds"] is not None])]
+    cost = None
+    if prices:
+        cost = round(totals["llm_calls_expected"] * float(prices.get("llm_call_cost", 0))
+                     + totals["embedding_requests"] * float(prices.get("embedding_request_cost", 0)), 4)
+    return {"workdir": workdir, "history_records": len(history), "final": st, "totals": totals, "steps": steps,
+            "seconds": round(sum(seg_secs), 2) if seg_secs else None,
+            "steps_without_history": [s["op"] for s in steps if s["seconds"] is None],
+            "cost": cost, "currency": prices.get("currency")}
+
+def format_plan(pl: Dict[str, Any]) -> str:
+    fmt_s = lambda s: "?" if s is None else f"{s:.1f}s" if s < 120 else f"{s / 60:.1f}min"
+    lines = [f"{'step':<20}{'work':>22}{'est. time':>12}  calls"]
+    for s in pl["steps"]:
+        work = f"{s['units']} {s['unit']}" if s["unit"] else "-"
+        calls = ", ".join(f"{k}={v}" for k, v in s["calls"].items() if v)
+        mark = " *" if s["partitioned"] else " ~" if s.get("streamed") else ""
+        lines.append(f"{s['op'] + mark:<20}{work:>22}{fmt_s(s['seconds']):>12}  {calls}")
+    t = pl["totals"]
+    lines.append("")
+    lines.append(f"final: {pl['final']}")
+    lines.append(f"LLM calls: expected {t['llm_calls_expected']} (min {t['llm_calls_min']}, max {t['llm_calls_max']}); "
+                 f"embedding requests {t['embedding_requests']}; sandbox runs <= {t['sandbox_runs_max']}; "
+                 f"QC table scans <= {t['qc_scans']}")
+    lines.append(f"estimated time: {fmt_s(pl['seconds'])} from {pl['history_records']} recorded step runs"
+                 + (f" (no history for {', '.join(pl['steps_without_history'])})" if pl["steps_without_history"] else ""))
+    if pl["cost"] is not None:
+        lines.append(f"estimated cost: {pl['cost']} {pl['currency'] or ''}".rstrip())
+    return "\n".join(lines)
+
+def plan_from_config(path: str, as_json: bool = False) -> str:
+    pl = plan(load_yaml(path))
+    return json.dumps(pl, indent=2, ensure_ascii=False) if as_json else format_plan(pl)
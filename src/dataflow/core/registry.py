@@ -9,3 +9,10 @@ OP_REGISTRY: Dict[str, Type[Operator]] = {}
 def register(cls: Type[Operator]):
     OP_REGISTRY[cls.__name__] = cls
     return cls
+
+def load_builtin_operators():
+    """导入 dataflow.operators 下所有模块，使 @register 生效"""
+    import importlib, pkgutil
+    from .. import operators
+    for m in pkgutil.iter_modules(operators.__path__):
+        importlib.import_module(f"{operators.__name__}.{m.name}")
@@ -0,0 +1,307 @@
+"""Pooled read-only HTTP/JSON query service over the built SQLite databases."""
+
+from __future__ import annotations
+from typing import Dict, Any, List, Tuple
+from collections import deque
+from contextlib import contextmanager
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from pathlib import Path
+import json, os, queue, sqlite3, threading, time
+from .config import load_yaml
+from ..qc_rules.base import connect_ro
+from ..utils.logging import get_logger
+
+log = get_logger(__name__)
+
+class QueryTimeout(Exception):
+    pass
+
+def file_sig(path: str) -> Tuple[int, int, int] | None:
+    # inode 变化说明文件被替换（os.replace），mtime/size 变化说明被原地改写
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+def _deny_attach(action, *_):
+    # 只读服务不允许 ATTACH 任意文件
+    return sqlite3.SQLITE_DENY if action in (sqlite3.SQLITE_ATTACH, sqlite3.SQLITE_DETACH) else sqlite3.SQLITE_OK
+
+class ConnectionPool:
+    """单库只读连接池：最多 size 个连接，LIFO 复用（热连接的页缓存/语句缓存命中更高）。
+    close() 后归还的连接直接关闭，借出中的查询继续读旧文件，保证单次查询一致"""
+
+    def __init__(self, path: str, size: int = 4, mmap_size: int = 0, shared_cache: bool = False,
+                 cached_statements: int = 256):
+        self.path = path
+        self.sig = file_sig(path)
+        self.size = size
+        self.opts = dict(mmap_size=mmap_size, shared_cache=shared_cache, cached_statements=cached_statements)
+        self.idle: queue.LifoQueue = queue.LifoQueue()
+        self.slots = threading.BoundedSemaphore(size)
+        self.closed = False
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = connect_ro(self.path, **self.opts)
+        conn.set_authorizer(_deny_attach)
+        return conn
+
+    @contextmanager
+    def connection(self, timeout: float):
+        """借出连接并设置查询截止时间：progress handler 每 1000 条 VM 指令检查一次，超时即中断。
+        截止时间从请求连接时算起，排队等连接的时间也计入 timeout"""
+        deadline = time.monotonic() + timeout
+        if not self.slots.acquire(timeout=max(0.0, deadline - time.monotonic())):
+            raise QueryTimeout(f"no free connection within {timeout}s")
+        try:
+            try:
+                conn = self.idle.get_nowait()
+            except queue.Empty:
+                conn = self._connect()
+            conn.set_progress_handler(lambda: time.monotonic() > deadline, 1000)
+            try:
+                yield conn
+            finally:
+                conn.set_progress_handler(None, 0)
+                if self.closed:
+                    conn.close()
+                else:
+                    self.idle.put(conn)
+        finally:
+            self.slots.release()
+
+    def close(self):
+        self.closed = True
+        while True:
+            try:
+                self.idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+class Metrics:
+    """每库查询计数与最近 window 次延迟的分位数"""
+
+    def __init__(self, window: int = 2048):
+        self.window = window
+        self.lock = threading.Lock()
+        self.stats: Dict[str, Dict[str, Any]] = {}
+
+    def record(self, db: str, ms: float, rows: int, status: str):
+        with self.lock:
+            s = self.stats.setdefault(db, {"queries": 0, "rows": 0, "errors": 0, "timeouts": 0,
+                                           "latency": deque(maxlen=self.window)})
+            s["queries"] += 1
+            s["rows"] += rows
+            if status == "timeout":
+                s["timeouts"] += 1
+            elif status != "ok":
+                s["errors"] += 1
+            s["latency"].append(ms)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self.lock:
+            out = {}
+            for db, s in self.stats.items():
+                lat = sorted(s["latency"])
+                pct = lambda q: round(lat[min(len(lat) - 1, int(q * len(lat)))], 3) if lat else None
+                out[db] = {k: v for k, v in s.items() if k != "latency"}
+                out[db].update(p50_ms=pct(0.5), p95_ms=pct(0.95), p99_ms=pct(0.99), max_ms=pct(1.0))
+            return out
+
+class DatabaseRegistry:
+    """dbid -> 连接池。库清单取自 workdir 下 agent_ready_metadata.json，扩充后的库（augment_result.json 的
+    sqlite_path）优先；后台线程轮询清单与库文件，变化且两次轮询间稳定后换新池（热加载）"""
+
+    def __init__(self, workdir: str, pool_size: int = 4, mmap_size: int = 0, shared_cache: bool = False,
+                 cached_statements: int = 256, reload_interval: float = 2.0):
+        self.workdir = Path(workdir)
+        self.pool_opts = dict(size=pool_size, mmap_size=mmap_size, shared_cache=shared_cache,
+                              cached_statements=cached_statements)
+        self.reload_interval = reload_interval
+        self.lock = threading.Lock()
+        self.pools: Dict[str, ConnectionPool] = {}
+        self.meta: Dict[str, Dict[str, Any]] = {}
+        self.pending: Dict[str, Any] = {}   # dbid -> 上次轮询看到的新签名（等待稳定）
+        self.stop = threading.Event()
+        self.reload()
+
+    def manifest(self) -> Dict[str, Dict[str, Any]]:
+        out: Dict[str, Dict[str, Any]] = {}
+        for name in ("agent_ready_metadata.json", "augment_result.json"):
+            p = self.workdir / name
+            if not p.exists():
+                continue
+            try:
+                data = json.loads(p.read_text("utf-8"))
+            except (OSError, ValueError):
+                continue   # 正在写入，下轮再读
+            for dbid, m in data.items():
+                if isinstance(m, dict) and m.get("sqlite_path"):
+                    out.setdefault(dbid, {}).update({"sqlite_path": m["sqlite_path"],
+                                                     "tables": list(m.get("table_meta", out.get(dbid, {}).get("tables", [])))})
+        return out
+
+    def reload(self):
+        wanted = self.manifest()
+        with self.lock:
+            for dbid in [d for d in self.pools if d not in wanted]:
+                self.pools.pop(dbid).close()
+                log.info(f"serve: removed {dbid}")
+            for dbid, m in wanted.items():
+                path, sig = m["sqlite_path"], file_sig(m["sqlite_path"])
+                cur = self.pools.get(dbid)
+                if sig is None or (cur is not None and cur.path == path and cur.sig == sig):
+                    self.pending.pop(dbid, None)
+                    continue
+                # 首次出现直接加载；已有库变化需连续两次轮询签名一致（写入完成）才切换
+                if cur is not None and self.pending.get(dbid) != (path, sig):
+                    self.pending[dbid] = (path, sig)
+                    continue
+                self.pending.pop(dbid, None)
+                self.pools[dbid] = ConnectionPool(path, **self.pool_opts)
+                self.meta[dbid] = m
+                if cur is not None:
+                    cur.close()
+                log.info(f"serve: {'reloaded' if cur else 'loaded'} {dbid} ({path})")
+
+    def watch(self):
+        while not self.stop.wait(self.reload_interval):
+            try:
+                self.reload()
+            except Exception as e:
+                log.error(f"serve: reload failed: {e!r}")
+
+    def get(self, dbid: str) -> ConnectionPool | None:
+        with self.lock:
+            return self.pools.get(dbid)
+
+    def close(self):
+        self.stop.set()
+        with self.lock:
+            for p in self.pools.values():
+                p.close()
+            self.pools.clear()
+
+class QueryHandler(BaseHTTPRequestHandler):
+    """GET /dbs、GET /metrics；POST /query {"db", "sql", "params", "timeout_ms", "max_rows"}
+    返回 NDJSON 流：首行 {"columns"}，之后每行一条记录（数组），末行 {"rows", "ms"} 或 {"error"}"""
+    protocol_version = "HTTP/1.1"
+    server_version = "dataflow-serve"
+
+    def log_message(self, fmt, *args):
+        pass
+
+    def _json(self, code: int, obj: Any):
+        body = json.dumps(obj, ensure_ascii=False, default=str).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _chunk(self, lines: List[bytes]):
+        data = b"".join(lines)
+        if data:
+            self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+
+    def do_GET(self):
+        reg: DatabaseRegistry = self.server.registry
+        if self.path == "/dbs":
+            with reg.lock:
+                self._json(200, {d: {"path": p.path, "tables": reg.meta.get(d, {}).get("tables", [])}
+                                 for d, p in reg.pools.items()})
+        elif self.path == "/metrics":
+            self._json(200, self.server.metrics.snapshot())
+        else:
+            self._json(404, {"error": f"unknown path {self.path}"})
+
+    def do_POST(self):
+        if self.path != "/query":
+            return self._json(404, {"error": f"unknown path {self.path}"})
+        try:
+            req = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            dbid, sql = req["db"], req["sql"]
+        except (ValueError, KeyError) as e:
+            return self._json(400, {"error": f"bad request: {e!r}"})
+        pool = self.server.registry.get(dbid)
+        if pool is None:
+            return self._json(404, {"error": f"unknown db {dbid!r}"})
+        timeout = float(req.get("timeout_ms", self.server.timeout_ms)) / 1000
+        max_rows = int(req.get("max_rows", self.server.max_rows))
+        params = req.get("params") or ()
+        t0 = time.perf_counter()
+        rows, status, started = 0, "ok", False
+        try:
+            with pool.connection(timeout) as conn:
+                try:
+                    cur = conn.execute(sql, params)
+                except sqlite3.OperationalError as e:
+                    raise QueryTimeout(str(e)) if str(e) == "interrupted" else e
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-ndjson")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                started = True
+                cols = [d[0] for d in cur.description or ()]
+                self._chunk([json.dumps({"columns": cols}).encode() + b"\n"])
+                truncated = False
+                try:
+                    # 多取一行判断是否截断：结果恰好 max_rows 行时不误报 truncated
+                    while rows < max_rows:
+                        batch = cur.fetchmany(min(self.server.batch_rows, max_rows - rows))
+                        if not batch:
+                            break
+                        rows += len(batch)
+                        self._chunk([json.dumps(list(r), ensure_ascii=False, default=str).encode("utf-8") + b"\n"
+                                     for r in batch])
+                    truncated = rows >= max_rows and cur.fetchone() is not None
+                except sqlite3.OperationalError as e:
+                    raise QueryTimeout(str(e)) if str(e) == "interrupted" else e
+                finally:
+                    cur.close()
+            ms = (time.perf_counter() - t0) * 1000
+            self._chunk([json.dumps({"rows": rows, "ms": round(ms, 3), "truncated": truncated}).encode() + b"\n"])
+        except (BrokenPipeError, ConnectionResetError):
+            status = "disconnected"
+            self.close_connection = True
+        except Exception as e:
+            status = "timeout" if isinstance(e, QueryTimeout) else "error"
+            err = {"error": str(e), "type": status}
+            if started:
+                self._chunk([json.dumps(err).encode() + b"\n"])
+            else:
+                self._json(408 if status == "timeout" else 400, err)
+        finally:
+            if started and status != "disconnected":
+                self.wfile.write(b"0\r\n\r\n")
+            self.server.metrics.record(dbid, (time.perf_counter() - t0) * 1000, rows, status)
+
+class QueryServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, addr, registry: DatabaseRegistry, timeout_ms: float = 5000, max_rows: int = 100000,
+                 batch_rows: int = 500):
+        super().__init__(addr, QueryHandler)
+        self.registry = registry
+        self.metrics = Metrics()
+        self.timeout_ms = timeout_ms
+        self.max_rows = max_rows
+        self.batch_rows = batch_rows
+
+def serve_from_config(path: str, host: str = "127.0.0.1", port: int = 8600, pool_size: int = 4, mmap_mb: int = 256,
+                      timeout_ms: float = 5000, max_rows: int = 100000, shared_cache: bool = False,
+                      reload_interval: float = 2.0):
+    cfg = load_yaml(path)
+    registry = DatabaseRegistry(cfg.get("workdir", "./workdir"), pool_size=pool_size, mmap_size=int(mmap_mb) << 20,
+                                shared_cache=shared_cache, reload_interval=reload_interval)
+    threading.Thread(target=registry.watch, daemon=True).start()
+    server = QueryServer((host, port), registry, timeout_ms=timeout_ms, max_rows=max_rows)
+    log.info(f"serve: {len(registry.pools)} databases on http://{host}:{port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        registry.close()
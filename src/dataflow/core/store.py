@@ -0,0 +1,75 @@
+"""Pipeline context store: artifacts by kind, with spill-to-disk and lazy reload."""
+
+from __future__ import annotations
+from typing import Dict, Iterator
+from collections.abc import MutableMapping
+from pathlib import Path
+import os, pickle
+from .artifact import Artifact
+from ..utils.logging import get_logger
+
+log = get_logger(__name__)
+
+class ArtifactStore(MutableMapping):
+    """kind -> Artifact。spill() 释放产物的 data，只留 kind/uri/meta；下次按 kind 取用时从磁盘懒加载。
+    总是写入 store 自有的 spill_dir/{kind}.pkl：产物自带的 JSON uri 之后可能被生产者改写，
+    JSON 往返也会丢失类型（如 ClusterMap 的 int 键变成 str）"""
+
+    def __init__(self, spill_dir: str | Path):
+        self.spill_dir = Path(spill_dir)
+        self._arts: Dict[str, Artifact] = {}
+        self._spilled: Dict[str, str] = {}   # kind -> 落盘文件
+        self._sizes: Dict[str, int] = {}
+
+    def __getitem__(self, kind: str) -> Artifact:
+        art = self._arts[kind]
+        path = self._spilled.pop(kind, None)
+        if path is not None:
+            with open(path, "rb") as f:
+                art.data = pickle.load(f)
+            log.debug(f"reloaded {kind} from {path}")
+        return art
+
+    def __setitem__(self, kind: str, art: Artifact):
+        self._arts[kind] = art
+        self._spilled.pop(kind, None)
+        self._sizes.pop(kind, None)
+
+    def __delitem__(self, kind: str):
+        del self._arts[kind]
+        self._spilled.pop(kind, None)
+        self._sizes.pop(kind, None)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._arts)
+
+    def __len__(self) -> int:
+        return len(self._arts)
+
+    def resident(self) -> list:
+        """data 仍在内存中的 kind"""
+        return [k for k, a in self._arts.items() if k not in self._spilled and a.data is not None]
+
+    def size(self, kind: str) -> int:
+        """在内存产物的估算字节数：有 JSON 文件取文件大小，否则取序列化大小（按产物缓存）"""
+        if kind not in self._sizes:
+            art = self._arts[kind]
+            if art.uri and art.uri.endswith(".json") and os.path.isfile(art.uri):
+                self._sizes[kind] = os.path.getsize(art.uri)
+            else:
+                self._sizes[kind] = len(pickle.dumps(art.data, protocol=pickle.HIGHEST_PROTOCOL))
+        return self._sizes[kind]
+
+    def spill(self, kind: str):
+        art = self._arts[kind]
+        if kind in self._spilled or art.data is None:
+            return
+        self.spill_dir.mkdir(parents=True, exist_ok=True)
+        path = str(self.spill_dir / f"{kind}.pkl")
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            pickle.dump(art.data, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+        art.data = None
+        self._spilled[kind] = path
+        log.debug(f"spilled {kind} to {path}")
@@ -0,0 +1,150 @@
+"""Table-at-a-time streaming between adjacent streamable operators (one thread per stage, bounded queues)."""
+
+from __future__ import annotations
+from typing import Dict, Any, List, Iterator, Tuple, Generator, Optional
+import json, queue, threading, time
+from .artifact import Artifact
+from .registry import OP_REGISTRY
+
+# 流上的单位：一张表的 IR 条目 (表名, {"header": [...], "schema": {...}|None, "content": {...}|None})
+TableEntry = Tuple[str, Dict[str, Any]]
+# 算子的 stream(upstream, ir, **params)：消费上游条目、产出条目；ir 为不含表的 IR 骨架（源算子就地填写），
+# 生成器的 return 值为除 IR 外的其他产物 {kind: Artifact}
+TableStream = Generator[TableEntry, None, Optional[Dict[str, Artifact]]]
+
+_TABLE_KEYS = ("table_header", "table_schema", "table_content")
+_END = object()
+
+class _Cancelled(Exception):
+    pass
+
+def streamable(op: str) -> bool:
+    return getattr(OP_REGISTRY[op], "stream", None) is not None
+
+def is_source(op: str) -> bool:
+    return not OP_REGISTRY[op].input_kinds
+
+def entries(ir: Dict[str, Any]) -> Iterator[TableEntry]:
+    for t, header in ir["table_header"].items():
+        yield t, {"header": header, "schema": ir.get("table_schema", {}).get(t),
+                  "content": ir.get("table_content", {}).get(t)}
+
+def put_entry(ir: Dict[str, Any], name: str, entry: Dict[str, Any]):
+    ir["table_header"][name] = entry["header"]
+    if entry.get("schema") is not None:
+        ir["table_schema"][name] = entry["schema"]
+    if entry.get("content") is not None:
+        ir["table_content"][name] = entry["content"]
+
+def skeleton(ir: Dict[str, Any]) -> Dict[str, Any]:
+    return {k: ({} if k in _TABLE_KEYS else json.loads(json.dumps(v))) for k, v in ir.items()}
+
+def drain(gen: TableStream, ir: Dict[str, Any]) -> Dict[str, Artifact]:
+    """一次跑完 stream()，条目写回 ir；返回其余产物（算子的 run() 借此复用流式实现）"""
+    while True:
+        try:
+            name, entry = next(gen)
+        except StopIteration as stop:
+            return stop.value or {}
+        put_entry(ir, name, entry)
+
+def segment_end(steps: List[Dict[str, Any]], i: int) -> int:
+    """从第 i 步起可串成流水线的连续步骤的结束下标；不足两步返回 i。
+    段内后一个源算子会整体替换前面的 IR，所以只从段内最后一个源开始"""
+    j = i
+    while j < len(steps) and not steps[j].get("partition_by") and streamable(steps[j]["op"]):
+        j += 1
+    if any(is_source(s["op"]) for s in steps[i + 1:j]):
+        return i
+    return j if j - i >= 2 else i
+
+def run_stream(steps: List[Dict[str, Any]], ctx, workdir: str, buffer: int = 16
+               ) -> Tuple[Dict[str, Any], List[Dict[str, Artifact]], List[Dict[str, Any]]]:
+    """各步骤一个线程，相邻步骤间用容量 buffer 的队列串联（满则上游阻塞，形成背压）。
+    返回 (最终 IR, 各步的其他产物, 各步统计 {tables, rows, seconds})；seconds 不含等待上下游的时间"""
+    ops = [OP_REGISTRY[s["op"]]() for s in steps]
+    if ops[0].input_kinds:
+        ir = skeleton(ctx["IR"].data)
+        head: Iterator[TableEntry] = entries(ctx["IR"].data)
+    else:
+        ir, head = {}, iter(())
+    queues = [queue.Queue(maxsize=max(1, buffer)) for _ in steps]
+    cancel = threading.Event()
+    errors: List[BaseException] = []
+    outputs: List[Dict[str, Artifact]] = [{} for _ in steps]
+    stats = [{"tables": 0, "rows": 0, "seconds": 0.0, "wait": 0.0} for _ in steps]
+
+    def get(q: queue.Queue, st: Dict[str, Any]):
+        t0 = time.perf_counter()
+        try:
+            while True:
+                if cancel.is_set():
+                    raise _Cancelled()
+                try:
+                    return q.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+        finally:
+            st["wait"] += time.perf_counter() - t0
+
+    def put(q: queue.Queue, item, st: Dict[str, Any]):
+        t0 = time.perf_counter()
+        try:
+            while True:
+                if cancel.is_set():
+                    raise _Cancelled()
+                try:
+                    return q.put(item, timeout=0.1)
+                except queue.Full:
+                    continue
+        finally:
+            st["wait"] += time.perf_counter() - t0
+
+    def pull(q: queue.Queue, st: Dict[str, Any]) -> Iterator[TableEntry]:
+        while (item := get(q, st)) is not _END:
+            yield item
+
+    def stage(i: int):
+        st = stats[i]
+        upstream = head if i == 0 else pull(queues[i - 1], st)
+        t0 = time.perf_counter()
+        gen = ops[i].stream(upstream, ir, workdir=workdir, **steps[i].get("params", {}))
+        try:
+            while True:
+                try:
+                    item = next(gen)
+                except StopIteration as stop:
+                    outputs[i] = stop.value or {}
+                    break
+                st["tables"] += 1
+                st["rows"] += int((item[1].get("content") or {}).get("row_count") or 0)
+                put(queues[i], item, st)
+            put(queues[i], _END, st)
+        except _Cancelled:
+            pass
+        except BaseException as e:
+            errors.append(e)
+            cancel.set()
+        finally:
+            gen.close()
+            st["seconds"] = time.perf_counter() - t0 - st["wait"]
+
+    threads = [threading.Thread(target=stage, args=(i,), name=f"stream-{s['op']}", daemon=True)
+               for i, s in enumerate(steps)]
+    for th in threads:
+        th.start()
+    sink = {"wait": 0.0}
+    try:
+        for name, entry in pull(queues[-1], sink):
+            put_entry(ir, name, entry)
+    except _Cancelled:
+        pass
+    except BaseException:
+        cancel.set()
+        raise
+    finally:
+        for th in threads:
+            th.join()
+    if errors:
+        raise errors[0]
+    return ir, outputs, [{k: v for k, v in st.items() if k != "wait"} for st in stats]
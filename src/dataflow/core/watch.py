@@ -0,0 +1,212 @@
+"""Long-running watch mode: keep pipeline state warm and push only changed input tables through it."""
+
+from __future__ import annotations
+from typing import Dict, Any, List, Tuple
+from pathlib import Path
+import glob, os, shutil, time
+import numpy as np
+from slugify import slugify
+from .artifact import Artifact
+from .config import load_yaml
+from .partition import drop_partitions
+from .pipeline import Pipeline
+from .registry import OP_REGISTRY, load_builtin_operators
+from ..utils.logging import get_logger
+
+log = get_logger(__name__)
+
+# 由 watch 自行增量处理的前段产物，其余产物按簇分区重跑
+FRONT_KINDS = ("IR", "Embeddings", "ClusterMap")
+
+class Watcher:
+    """常驻进程：首轮完整运行配置；之后轮询 IngestFiles 的 input_globs，文件稳定 debounce 秒后
+    只把新增/变化/删除的表做 摄取→前段 IR 变换重放→嵌入→就近分簇，再按簇重跑 AdaptiveCluster 之后的步骤。
+    Pipeline ctx、簇质心与分区进程池跨轮保留；配置文件变化时整体重建"""
+
+    def __init__(self, config_path: str, interval: float = 2.0, debounce: float = 1.0):
+        self.config_path = config_path
+        self.interval = interval
+        self.debounce = debounce
+        self.cfg_mtime = None
+        self.pl: Pipeline | None = None
+        self.files: Dict[str, Tuple[int, int]] = {}
+        self.centroids: Dict[str, np.ndarray] = {}
+
+    def load_config(self):
+        load_builtin_operators()
+        self.cfg_mtime = os.stat(self.config_path).st_mtime_ns
+        cfg = load_yaml(self.config_path)
+        steps = cfg["steps"]
+        ops = [s["op"] for s in steps]
+        if "AdaptiveCluster" not in ops:
+            raise ValueError("watch mode needs an AdaptiveCluster step")
+        cut = len(ops) - 1 - ops[::-1].index("AdaptiveCluster")
+        self.front, self.back = steps[:cut + 1], steps[cut + 1:]
+        # IR 的来源：不读 IR 的 IR 产出步骤（Deduplicate / DiscoverKeys 等只是变换）。watch 只监视 IngestFiles 的文件；
+        # 其后若还有别的源（如 IngestDB）会整体替换 IR，文件变化便无从增量合并
+        producers = [i for i, s in enumerate(self.front)
+                     if "IR" in OP_REGISTRY[s["op"]].output_kinds and "IR" not in OP_REGISTRY[s["op"]].input_kinds]
+        files = [i for i in producers if self.front[i]["op"] == "IngestFiles"]
+        if not files:
+            raise ValueError("watch mode needs the IR to come from an IngestFiles step")
+        later = [self.front[i]["op"] for i in producers if i > files[-1]]
+        if later:
+            raise ValueError(f"watch mode watches IngestFiles inputs, but {later[0]} replaces the IR after it; "
+                             f"use a files-only config (see configs/watch.yaml)")
+        self.ingest = self.front[files[-1]].get("params", {})
+        # IR 来源之后的前段步骤：IR→IR 变换按配置顺序重放（传入 changed_tables，支持的算子只处理相关的表），
+        # EmbedTables 与分簇由 update() 增量处理
+        self.replay = self.front[files[-1] + 1:cut]
+        for s in self.replay:
+            op = OP_REGISTRY[s["op"]]
+            if s["op"] != "EmbedTables" and not ("IR" in op.input_kinds and op.output_kinds == ["IR"]):
+                raise ValueError(f"watch mode cannot replay front step {s['op']} incrementally")
+        self.max_cluster_size = int(steps[cut].get("params", {}).get("max_cluster_size", 20))
+        if self.pl is not None:
+            self.pl.close()
+        self.pl = Pipeline(workdir=cfg.get("workdir", "./workdir"), partition_workers=cfg.get("partition_workers"),
+                           memory_budget_mb=cfg.get("memory_budget_mb"), keep_pool=True,
+                           streaming=bool(cfg.get("streaming")), stream_buffer=int(cfg.get("stream_buffer", 16)))
+
+    def scan(self) -> Dict[str, Tuple[int, int]]:
+        out = {}
+        for pattern in self.ingest.get("input_globs", []):
+            for p in Path().glob(pattern):
+                try:
+                    st = p.stat()
+                except OSError:
+                    continue
+                if p.is_file():
+                    out[str(p)] = (st.st_mtime_ns, st.st_size)
+        return out
+
+    def full(self):
+        """完整运行：前段照常执行，后段按簇分区（便于之后只重跑受影响的簇）"""
+        self.files = self.scan()
+        self.pl.run_steps(self.front)
+        cmap = self.pl.ctx["ClusterMap"]
+        cmap = {str(k): list(v) for k, v in cmap.data.items()}
+        self.pl.ctx["ClusterMap"] = Artifact(kind="ClusterMap", data=cmap).save_json(str(self.pl.workdir / "cluster_map.json"))
+        emb = self.pl.ctx["Embeddings"].data
+        vec = dict(zip(emb["ids"], np.asarray(emb["vectors"], dtype=float)))
+        self.centroids = {c: np.mean([vec[t] for t in ts], axis=0) for c, ts in cmap.items() if ts}
+        self.pl.run_partitioned(self.back, "ClusterMap", "[watch]")
+
+    def update(self, cur: Dict[str, Tuple[int, int]]):
+        t0 = time.time()
+        changed = [p for p in cur if self.files.get(p) != cur[p]]
+        removed = [p for p in self.files if p not in cur]
+        tables = {slugify(Path(p).stem) for p in changed + removed}
+        files = [p for p in cur if slugify(Path(p).stem) in tables]   # 同名表的全部文件一起重摄取
+        log.info(f"[watch] {len(changed)} changed, {len(removed)} removed file(s) -> tables {sorted(tables)}")
+        workdir = str(self.pl.workdir)
+        ctx = self.pl.ctx
+
+        # 摄取：只读受影响的表，替换进常驻 IR；先清掉这些表的暂存目录，免得残留的旧 part_N.parquet 被一并读入
+        old = ctx["IR"].data
+        ir = {k: ({t: v for t, v in old[k].items() if t not in tables}
+                  if k in ("table_header", "table_schema", "table_content") else v) for k, v in old.items()}
+        staging = Path(workdir) / "staging" / self.ingest.get("dataset_id", "")
+        for t in tables:
+            shutil.rmtree(staging / t, ignore_errors=True)
+        # 未变表上指向受影响表的已发现外键可能已失效，去掉后由 DiscoverKeys 重新校验
+        for t, schema in ir["table_schema"].items():
+            if any(fk.get("discovered") and fk.get("ref_table") in tables for fk in schema.get("foreign_keys", [])):
+                ir["table_schema"][t] = {**schema, "foreign_keys": [
+                    fk for fk in schema["foreign_keys"] if not (fk.get("discovered") and fk.get("ref_table") in tables)]}
+        if files:
+            delta = OP_REGISTRY["IngestFiles"]().run({}, **{**self.ingest, "input_globs": [glob.escape(p) for p in files]},
+                                                     workdir=workdir)["IR"].data
+            for k in ("table_header", "table_schema", "table_content"):
+                ir[k].update(delta[k])
+        ir_art = Artifact(kind="IR", data=ir)
+        emb_params: Dict[str, Any] | None = None
+        emb_headers: Dict[str, List[str]] = {}
+        for step in self.replay:
+            if step["op"] == "EmbedTables":
+                # 嵌入看到的是它在配置中所处位置的表头
+                emb_params, emb_headers = step.get("params", {}), dict(ir_art.data["table_header"])
+            else:
+                ir_art = OP_REGISTRY[step["op"]]().run({"IR": ir_art}, workdir=workdir, changed_tables=sorted(tables),
+                                                       **step.get("params", {}))["IR"]
+        ir = ir_art.data
+        fresh = [t for t in ir["table_header"] if t in tables]
+
+        # 嵌入：只算新表，合并进常驻向量
+        emb = ctx["Embeddings"].data
+        keep = [i for i, t in enumerate(emb["ids"]) if t not in tables]
+        ids = [emb["ids"][i] for i in keep]
+        vectors = [emb["vectors"][i] for i in keep]
+        if fresh:
+            sub = {"table_header": {t: emb_headers.get(t, ir["table_header"][t]) for t in fresh}}
+            new = OP_REGISTRY["EmbedTables"]().run({"IR": Artifact(kind="IR", data=sub)},
+                                                   workdir=str(self.pl.workdir / "watch"), **(emb_params or {}))["Embeddings"].data
+            ids += new["ids"]
+            vectors += new["vectors"]
+
+        # 分簇：移出旧簇，新表按最近质心分配（满簇跳过，全满则开新簇）
+        cmap = {c: list(ts) for c, ts in ctx["ClusterMap"].data.items()}
+        vec = dict(zip(ids, np.asarray(vectors, dtype=float)))
+        affected = set()
+        for c, ts in cmap.items():
+            if any(t in tables for t in ts):
+                cmap[c] = [t for t in ts if t not in tables]
+                affected.add(c)
+        for t in fresh:
+            room = [c for c in cmap if len(cmap[c]) < self.max_cluster_size and c in self.centroids]
+            if room:
+                c = min(room, key=lambda c: float(((self.centroids[c] - vec[t]) ** 2).sum()))
+            else:
+                c = str(max((int(c) for c in cmap if c.isdigit()), default=-1) + 1)
+                cmap[c] = []
+            cmap[c].append(t)
+            self.centroids[c] = np.mean([vec[x] for x in cmap[c]], axis=0)
+            affected.add(c)
+        emptied = sorted(c for c in affected if not cmap[c])
+        for c in affected:
+            if cmap[c]:
+                self.centroids[c] = np.mean([vec[x] for x in cmap[c]], axis=0)
+        for c in emptied:
+            cmap.pop(c)
+            self.centroids.pop(c, None)
+
+        ctx["IR"] = ir_art
+        ctx["Embeddings"] = Artifact(kind="Embeddings", data={"ids": ids, "vectors": vectors}).save_json(
+            str(self.pl.workdir / "embeddings.json"))
+        ctx["ClusterMap"] = Artifact(kind="ClusterMap", data=cmap).save_json(str(self.pl.workdir / "cluster_map.json"))
+        if emptied:
+            names = emptied + [f"db_{c}" for c in emptied]
+            for kind in list(ctx):
+                if kind not in FRONT_KINDS:
+                    ctx[kind] = drop_partitions(ctx[kind], names)
+        rerun = sorted(affected - set(emptied))
+        self.pl.run_partitioned(self.back, "ClusterMap", "[watch]", keys=rerun)
+        self.files = cur
+        log.info(f"[watch] rebuilt clusters {rerun}, dropped {emptied} in {time.time() - t0:.1f}s")
+
+    def run_forever(self):
+        self.load_config()
+        self.full()
+        seen, since, failed = self.files, time.time(), None
+        log.info(f"[watch] watching {len(self.files)} file(s), interval={self.interval}s debounce={self.debounce}s")
+        try:
+            while True:
+                time.sleep(self.interval)
+                if os.stat(self.config_path).st_mtime_ns != self.cfg_mtime:
+                    log.info("[watch] config changed, full rerun")
+                    self.load_config()
+                    self.full()
+                    seen, since = self.files, time.time()
+                    continue
+                cur = self.scan()
+                if cur != seen:
+                    seen, since = cur, time.time()   # 仍在写入：重新计时
+                elif cur != self.files and cur != failed and time.time() - since >= self.debounce:
+                    try:
+                        self.update(cur)
+                    except Exception as e:
+                        # 本轮失败不退出；文件快照不前移，输入再次变化时连同本轮一起重试
+                        failed = cur
+                        log.error(f"[watch] update failed: {e!r}")
+        finally:
+            self.pl.close()
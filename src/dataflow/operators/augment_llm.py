@@ -1,20 +1,372 @@
 """Operator for augmenting data using LLM."""
 
 from __future__ import annotations
-from typing import Dict
+from typing import Dict, Any, Callable, Iterator, List, Tuple
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from pathlib import Path
-import json, re, shutil
+import json, re, shutil, os, logging, threading, hashlib, time
+from tqdm import tqdm
 from ..core.operator import Operator
 from ..core.registry import register
 from ..core.artifact import Artifact
-from ..providers.llm import HTTPClient
-from ..operators.quality_check import quality_check_db
-from ..utils.sqlite_exec import exec_python_code
+from ..providers.llm import LLMClient, get_llm_client
+from ..operators.quality_check import QCSession
+from ..utils.sqlite_exec import exec_python_code, SandboxPool
+from ..utils.sqlite_snapshot import snapshot_db, restore_db, backup_db
+from ..utils.logging import get_logger
+try:
+    import fcntl
+except ImportError:   # 非 POSIX：预算只在本进程内统计
+    fcntl = None
+
+log = get_logger(__name__)
 
 def extract_python_block(text: str):
     m = re.findall(r"```python(.*?)```", text, flags=re.S)
     return m[0].strip() if m else ""
 
+def read_until_python_block(chunks: Iterator[str]) -> str:
+    """流式读取响应，首个完整 ```python 块出现即停止并关闭连接"""
+    text = ""
+    try:
+        for c in chunks:
+            text += c
+            if "```" in text[-(len(c) + 3):] and extract_python_block(text):
+                break
+    finally:
+        close = getattr(chunks, "close", None)
+        if close:
+            close()
+    return text
+
+def _main_code(rsp: str) -> str:
+    return extract_python_block(rsp) + "\n\nif __name__=='__main__':\n\tprint(extend_database())"
+
+def _db_logger(dbid: str, log_dir: Path) -> logging.Logger:
+    logger = logging.getLogger(f"{__name__}.{dbid}")
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    for h in list(logger.handlers):
+        logger.removeHandler(h); h.close()
+    h = logging.FileHandler(log_dir / f"{dbid}.log", encoding="utf-8")
+    h.setFormatter(logging.Formatter("[%(asctime)s] %(levelname)s - %(message)s"))
+    logger.addHandler(h)
+    return logger
+
+class _Limits:
+    """LLM 在途请求数与沙箱并发数分别限流"""
+    def __init__(self, max_inflight_llm: int, max_sandboxes: int):
+        self.llm = threading.BoundedSemaphore(max(1, max_inflight_llm))
+        self.sandbox = threading.BoundedSemaphore(max(1, max_sandboxes))
+
+class _Budget:
+    """全局 LLM 预算：调用次数 / token（按 字符数÷4 近似）/ 墙钟秒数，任一耗尽即不再发起新一轮。
+    在途轮次不打断，实际用量最多超出 parallelism 轮。
+    给出 ledger 时用量记在该文件里（文件锁保护），同一次扇出的各分区进程共用一份预算，时间预算从首个分区开始算"""
+    def __init__(self, llm_calls: int | None = None, llm_tokens: int | None = None, seconds: float | None = None,
+                 ledger: Path | None = None):
+        self.llm_calls = llm_calls
+        self.llm_tokens = llm_tokens
+        self.ledger = ledger if fcntl is not None and (llm_calls or llm_tokens or seconds) else None
+        self.deadline = time.monotonic() + seconds if seconds else None
+        self.used_calls = 0      # 本进程用量（日志用）
+        self.used_tokens = 0
+        self.lock = threading.Lock()
+        if self.ledger is not None:
+            started = self._update(lambda s: s)["started"]
+            self.deadline = started + seconds if seconds else None
+
+    def _update(self, fn) -> Dict[str, Any]:
+        self.ledger.parent.mkdir(parents=True, exist_ok=True)
+        with self.lock, open(self.ledger.with_name(self.ledger.name + ".lock"), "w") as lk:
+            fcntl.flock(lk, fcntl.LOCK_EX)
+            try:
+                with open(self.ledger, "r", encoding="utf-8") as f:
+                    state = json.load(f)
+            except (FileNotFoundError, json.JSONDecodeError):
+                state = {"calls": 0, "tokens": 0, "started": time.time()}
+            state = fn(state)
+            tmp = self.ledger.with_name(self.ledger.name + ".tmp")
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(state, f)
+            os.replace(tmp, self.ledger)
+            return state
+
+    def totals(self) -> Tuple[int, int]:
+        if self.ledger is None:
+            return self.used_calls, self.used_tokens
+        try:
+            with open(self.ledger, "r", encoding="utf-8") as f:
+                state = json.load(f)
+            return state["calls"], state["tokens"]
+        except (OSError, ValueError, KeyError):
+            return self.used_calls, self.used_tokens
+
+    def charge(self, prompt: str, response: str):
+        tokens = (len(prompt) + len(response)) // 4
+        if self.ledger is not None:
+            self._update(lambda s: {**s, "calls": s["calls"] + 1, "tokens": s["tokens"] + tokens})
+        with self.lock:
+            self.used_calls += 1
+            self.used_tokens += tokens
+
+    def exhausted(self) -> str | None:
+        calls, tokens = self.totals()
+        if self.llm_calls is not None and calls >= self.llm_calls:
+            return "llm_calls"
+        if self.llm_tokens is not None and tokens >= self.llm_tokens:
+            return "llm_tokens"
+        now = time.time() if self.ledger is not None else time.monotonic()
+        if self.deadline is not None and now >= self.deadline:
+            return "seconds"
+        return None
+
+class _ResultWriter:
+    """结果随完成随写入 augment_result.json（原子替换）"""
+    def __init__(self, path: Path):
+        self.path = path
+        self.results: Dict[str, Any] = {}
+        self.lock = threading.Lock()
+
+    def put(self, dbid: str, result: Dict[str, Any]):
+        with self.lock:
+            self.results[dbid] = result
+            tmp = self.path.with_name(self.path.name + ".tmp")
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(self.results, f, indent=2, ensure_ascii=False)
+            os.replace(tmp, self.path)
+
+class AugmentTask:
+    """单库扩充：start() 生成初始代码，step() 执行一轮（沙箱执行 -> QC -> 修复 prompt）。
+    QC 走增量会话：按表快照仅重查本轮代码改动过的表（会话不向工作库写任何对象）。
+    每轮结束把状态写入 augment_state/{dbid}.json，start(resume=True) 从中断处继续。
+    rollback=True 时每轮执行前把工作库恢复到空库基线快照，并把 QC 失败项最少的一轮另存为 best"""
+
+    def __init__(self, dbid: str, schema_meta: Dict[str, Any], workdir: str, client: LLMClient, limits: _Limits,
+                 prompts: Dict[str, str], max_iterations: int, log: logging.Logger,
+                 executor: Callable[..., Any] = exec_python_code, stream_responses: bool = True,
+                 qc_rules: List[Tuple[str, dict]] | None = None, rollback: bool = True, qc_approx: bool = False,
+                 budget: _Budget | None = None, state_dir: str = ""):
+        self.dbid = dbid
+        self.schema_meta = schema_meta
+        self.client = client
+        self.limits = limits
+        self.executor = executor
+        self.stream_responses = stream_responses
+        self.prompts = prompts
+        self.max_iterations = max_iterations
+        self.log = log
+        self.qc_rules = qc_rules
+        self.qc_approx = qc_approx
+        self.qc: QCSession | None = None
+        self.work_db = Path(workdir) / "augment_dbs" / f"{dbid}.sqlite"
+        self.state_path = Path(state_dir or workdir) / "augment_state" / f"{dbid}.json"
+        self.schema_info = "\n".join(schema_meta["table_meta"].values())
+        # 断点按建库指纹（DDL + 装载数据）失效；没有指纹的元数据退回按 DDL 文本
+        self.fingerprint = schema_meta.get("fingerprint") or hashlib.sha256(self.schema_info.encode("utf-8")).hexdigest()
+        self.code = ""
+        self.iteration = 0
+        self.done = False
+        self.success = False
+        self.resumed = False
+        self.last_error = ""
+        self.last_report: List[dict] = []
+        self.rollback = rollback
+        self.base = None
+        self.base_db = self.work_db.with_name(f"{dbid}.base.sqlite")
+        self.base_version = None
+        self.best_db = self.work_db.with_name(f"{dbid}.best.sqlite")
+        self.best_score: int | None = None
+        self.best_code = ""
+        self.budget = budget
+        self.llm_calls = 0
+        self.scores: List[int | None] = []   # 每轮 QC 失败的 error 规则数；执行报错记 None
+        self.started = False
+        self.stopped: str | None = None
+
+    def _complete(self, prompt: str) -> str:
+        with self.limits.llm:
+            if self.stream_responses:
+                rsp = read_until_python_block(self.client.stream(prompt))
+            else:
+                rsp = self.client.complete(prompt)
+        self.llm_calls += 1
+        if self.budget is not None:
+            self.budget.charge(prompt, rsp)
+        return rsp
+
+    def priority(self) -> Tuple:
+        """调度优先级（小者先）：未开始的库先各拿一轮；之后失败规则少、且比上一轮有改善、已用轮次少的优先"""
+        if not self.started:
+            return (0, 0, 0, 0)
+        inf = float("inf")
+        cur = self.scores[-1] if self.scores and self.scores[-1] is not None else inf
+        prev = self.scores[-2] if len(self.scores) > 1 and self.scores[-2] is not None else inf
+        gain = 0 if cur == inf else (1 if prev == inf else prev - cur)
+        return (1, cur, -gain, self.iteration)
+
+    def stalled(self, patience: int) -> bool:
+        """最近 patience 轮的最好结果没有好过之前的最好结果（都没跑通也算）"""
+        if len(self.scores) <= patience:
+            return False
+        best = lambda xs: min((x for x in xs if x is not None), default=float("inf"))
+        return best(self.scores[-patience:]) >= best(self.scores[:-patience])
+
+    def stop(self, reason: str):
+        # 预算耗尽/停滞：按未通过收尾（回到最好的一轮）；续跑时可继续
+        self.stopped = reason
+        self.done = True
+        self.log.info(f"stopped: {reason} after {self.iteration} iterations")
+        self._finish()
+        self.save_state()
+
+    def _exec(self, code: str):
+        with self.limits.sandbox:
+            return self.executor(code, env={
+                "SQLITE_PATH": str(self.work_db.resolve()),
+                "PYTHONNOUSERSITE": "1",
+                "MAX_ID": "1200",
+            })
+
+    def save_state(self):
+        state = {"dbid": self.dbid, "status": "done" if self.done else "running", "success": self.success,
+                 "iteration": self.iteration, "code": self.code, "last_error": self.last_error,
+                 "last_report": self.last_report, "work_db": str(self.work_db.resolve()),
+                 "best_db": str(self.best_db.resolve()) if self.best_score is not None else None,
+                 "best_score": self.best_score, "best_code": self.best_code,
+                 "schema_fingerprint": self.fingerprint, "updated": time.time()}
+        self.state_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.state_path.with_name(self.state_path.name + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(state, f, ensure_ascii=False)
+        os.replace(tmp, self.state_path)
+
+    def _load_state(self) -> bool:
+        try:
+            with open(self.state_path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return False
+        # schema 变了，或不回滚时工作库丢失：从头来
+        if state.get("schema_fingerprint") != self.fingerprint or \
+                not self.rollback and not Path(state["work_db"]).exists():
+            return False
+        self.work_db = Path(state["work_db"])
+        self.iteration = state["iteration"]
+        self.code = state["code"]
+        self.success = state["success"]
+        # 未成功且调大了 max_iterations 的库继续迭代
+        self.done = state["status"] == "done" and (self.success or self.iteration >= self.max_iterations)
+        self.last_error = state.get("last_error", "")
+        self.last_report = state.get("last_report", [])
+        if state.get("best_db") and Path(state["best_db"]).exists():
+            self.best_db = Path(state["best_db"])
+            self.best_score, self.best_code = state["best_score"], state["best_code"]
+        return True
+
+    def start(self, resume: bool = True):
+        self.started = True
+        self.work_db.parent.mkdir(parents=True, exist_ok=True)
+        loaded = resume and self._load_state()
+        if loaded:
+            self.resumed = True
+            self.log.info(f"resumed from checkpoint: iteration={self.iteration} done={self.done}")
+            if self.done:
+                return
+        if not loaded or self.rollback:
+            # 用空库起步（仅 schema）；回滚模式下每轮都从这里开始，续跑时直接重建
+            shutil.copy2(self.schema_meta["sqlite_path"], self.work_db)
+        self.qc = QCSession(str(self.work_db), self.qc_rules, approx=self.qc_approx)
+        if self.rollback:
+            # 基线：检查过的初始库，存为文件快照（装载过数据的库可能很大，不占内存）+ 对应的 QC 状态
+            self.qc.check()
+            self.base = (snapshot_db(str(self.work_db), str(self.base_db)), self.qc.mark())
+            self.base_version = self._data_version()
+        if not loaded:
+            full_prompt = f"{self.prompts['init']}\n<SCHEMA>\n{self.schema_info}\n</SCHEMA>"
+            self.code = _main_code(self._complete(full_prompt))
+            self.log.info(f"initial code:\n{self.code}")
+            self.save_state()
+
+    def _data_version(self) -> int:
+        return self.qc.data_version_now()
+
+    def _rollback(self):
+        # 上一轮的残留（部分插入、失败的写入）整库回退到基线；上一轮没有提交过任何写入则无需回退
+        if self.rollback and self._data_version() != self.base_version:
+            restore_db(self.base[0], str(self.work_db))
+            self.qc.reset(self.base[1])
+            self.base_version = self._data_version()
+
+    def _keep_best(self, score: int):
+        if not self.rollback or self.best_score is not None and score >= self.best_score:
+            return
+        tmp = self.best_db.with_name(self.best_db.name + ".tmp")
+        backup_db(str(self.work_db), str(tmp))
+        os.replace(tmp, self.best_db)
+        self.best_score, self.best_code = score, self.code
+
+    def _finish(self):
+        # 最终未通过：工作库与代码回到 QC 失败项最少的那一轮
+        if not self.success and self.best_score is not None and self.best_db.exists():
+            backup_db(str(self.best_db), str(self.work_db))
+            self.code = self.best_code
+            self.log.info(f"restored best state: failed_error_rules={self.best_score}")
+
+    def step(self):
+        # 只在一轮完整结束后落盘；中途失败则重启时重跑本轮
+        self._iterate()
+        if self.done:
+            self._finish()
+        self.save_state()
+
+    def _iterate(self):
+        it = self.iteration
+        self.iteration += 1
+        self._rollback()
+        stdout, stderr = self._exec(self.code)
+        if stdout and stdout.strip() == "True":
+            # 质量检查
+            ok, report, _ = self.qc.check()
+            failed = [r for r in report if r.get("severity") == "error" and not r.get("passed")]
+            self.log.info(f"iteration {it}: executed, QC ok={ok} failed_error_rules={len(failed)}")
+            self.scores.append(len(failed))
+            self.last_error, self.last_report = "", failed
+            if ok:
+                self.success = True
+                self.done = True
+                return
+            self._keep_best(len(failed))
+            # 用质量错误+代码+schema 让模型修复
+            qtext = json.dumps(report, ensure_ascii=False, indent=2)
+            fix_query = f"{self.prompts['table_react']}\n<SCHEMA>\n{self.schema_info}\n</SCHEMA>\n<ERRORS>\n{qtext}\n</ERRORS>\n<PREV>\n```python\n{self.code}\n```\n</PREV>"
+            self.code = _main_code(self._complete(fix_query))
+        else:
+            # 运行报错，走 react_prompt 修复
+            self.log.info(f"iteration {it}: execution failed\n{stderr}")
+            self.scores.append(None)
+            self.last_error, self.last_report = stderr or "", []
+            query = f"{self.prompts['react']}\n<SCHEMA>\n{self.schema_info}\n</SCHEMA>\n<ERROR>\n{stderr}\n</ERROR>\n<PREV>\n```python\n{self.code}\n```\n</PREV>"
+            self.code = _main_code(self._complete(query))
+        self.log.info(f"iteration {it}: new code:\n{self.code}")
+        if self.iteration >= self.max_iterations:
+            self.done = True
+
+    def close(self):
+        if self.qc is not None:
+            self.qc.close()
+            self.qc = None
+        if self.base is not None:
+            self.base[0].close()
+            self.base = None
+            self.base_db.unlink(missing_ok=True)
+
+    def result(self) -> Dict[str, Any]:
+        # 从未开始（预算先耗尽）的库没有工作库
+        return {"success": self.success, "code": self.code, "iterations": self.iteration,
+                "sqlite_path": str(self.work_db.resolve()) if self.started else None, "resumed": self.resumed,
+                "llm_calls": self.llm_calls, "stopped": self.stopped}
+
 @register
 class AugmentWithLLM(Operator):
     name = "AugmentWithLLM"
@@ -23,60 +375,124 @@ class AugmentWithLLM(Operator):
 
     def run(self, inputs: Dict[str, Artifact], provider: str="llm_http",
             init_prompt_path: str="", react_prompt_path: str="", table_react_prompt_path: str="",
-            max_iterations: int=20, workdir: str="", **cfg):
+            max_iterations: int=20, parallelism: int=8, max_inflight_llm: int|None=None,
+            max_sandboxes: int|None=None, sandbox: str="pool", sandbox_cpu_seconds: int=300,
+            sandbox_memory_mb: int=2048, sandbox_max_open_files: int=256, stream_responses: bool=True,
+            qc_rules: List[dict]|None=None, qc_approx: bool=False, resume: bool=True, rollback: bool=True,
+            llm_call_budget: int|None=None, llm_token_budget: int|None=None, time_budget_s: float|None=None,
+            stall_patience: int|None=None, max_active_dbs: int|None=None, workdir: str="",
+            shared_workdir: str="", run_id: str="", **cfg):
 
         meta = inputs["AgentReadyMeta"].data
-        client = HTTPClient(url=cfg.get("url","http://localhost:8000"), token=cfg.get("token",""))
+        # 按簇分区运行时各分区 workdir 不同：LLM 缓存、断点与预算放在共享的根 workdir，
+        # 预算按本次扇出（run_id）在各分区进程间共用，而不是每个分区各一份
+        shared = shared_workdir or workdir
+        client = get_llm_client(provider, workdir=shared, **cfg)
+        prompts = {
+            "init": Path(init_prompt_path).read_text("utf-8") if init_prompt_path else "Write extend_database()",
+            "react": Path(react_prompt_path).read_text("utf-8") if react_prompt_path else "Fix error",
+            "table_react": Path(table_react_prompt_path).read_text("utf-8") if table_react_prompt_path else "Fix quality issues",
+        }
+        rules = [(r["module"], r.get("params", {})) for r in qc_rules] if qc_rules else None
+        limits = _Limits(max_inflight_llm or parallelism, max_sandboxes or os.cpu_count() or 1)
+        # 预热沙箱池（fork-per-task + rlimit）；不支持 fork 的平台退回一次性子进程
+        pool_exec = SandboxPool(size=max_sandboxes or os.cpu_count() or 1, cpu_seconds=sandbox_cpu_seconds,
+                                memory_mb=sandbox_memory_mb, max_open_files=sandbox_max_open_files) \
+            if sandbox == "pool" and hasattr(os, "fork") else None
+        executor = pool_exec.run if pool_exec else exec_python_code
 
         log_dir = Path(workdir) / "augment_logs"
         log_dir.mkdir(parents=True, exist_ok=True)
-        results = {}
-
-        for dbid, schema_meta in meta.items():
-            sqlite_path = schema_meta["sqlite_path"]
-            # 用空库起步（仅 schema）
-            work_db = Path(workdir) / "augment_dbs" / f"{dbid}.sqlite"
-            work_db.parent.mkdir(parents=True, exist_ok=True)
-            shutil.copy2(sqlite_path, work_db)
-
-            # 组 prompt（简化）
-            schema_info = "\n".join(schema_meta["table_meta"].values())
-            init_prompt = Path(init_prompt_path).read_text("utf-8") if init_prompt_path else "Write extend_database()"
-            full_prompt = f"{init_prompt}\n<SCHEMA>\n{schema_info}\n</SCHEMA>"
-            rsp = client.complete(full_prompt)
-            code = extract_python_block(rsp) + "\n\nif __name__=='__main__':\n\tprint(extend_database())"
-
-            success = False
-            for it in range(max_iterations):
-                # 执行代码
-                stdout, stderr = exec_python_code(code, env={
-                    "SQLITE_PATH": str(work_db.resolve()),
-                    "PYTHONNOUSERSITE": "1",
-                    "MAX_ID": "1200",
-                })
-                if stdout and stdout.strip() == "True":
-                    # 质量检查
-                    ok, report, _ = quality_check_db(str(work_db))
-                    if ok:
-                        results[dbid] = {"success": True, "code": code}
-                        success = True
+        writer = _ResultWriter(Path(workdir) / "augment_result.json")
+
+        budget = _Budget(llm_call_budget, llm_token_budget, time_budget_s,
+                         ledger=Path(shared) / "augment_budget" / f"{run_id}.json" if run_id else None)
+        workers = max(1, parallelism)
+        max_active = max_active_dbs or workers * 4
+        pending = list(meta)                 # 尚未开始的库
+        ready: List[AugmentTask] = []        # 已开始、等待下一轮
+        inflight: Dict[Any, AugmentTask] = {}
+        bar = tqdm(total=len(meta), desc="Augment")
+        passed = 0
+
+        def make(dbid: str) -> AugmentTask:
+            return AugmentTask(dbid, meta[dbid], workdir, client, limits, prompts, max_iterations,
+                               _db_logger(dbid, log_dir), executor, stream_responses, rules, rollback, qc_approx, budget,
+                               state_dir=shared)
+
+        def advance(task: AugmentTask):
+            if task.started:
+                task.step()
+            else:
+                task.start(resume=resume)
+
+        def finish(task: AugmentTask, error: BaseException | None = None):
+            nonlocal passed
+            res = task.result()
+            if error is not None:
+                task.log.error("augmentation aborted", exc_info=error)
+                res = {**res, "success": False, "error": str(error)}
+            else:
+                task.log.info(f"finished: success={task.success} iterations={task.iteration}")
+            task.close()
+            for h in list(task.log.handlers):
+                task.log.removeHandler(h); h.close()
+            writer.put(task.dbid, res)
+            passed += bool(res.get("success"))
+            bar.update(1)
+            bar.set_postfix(passed=passed)
+
+        # 全局调度：每次只推进一个库的一轮；空出的并发槽给优先级最高的库（未开始的先各拿一轮，
+        # 之后按 QC 失败规则数与改善幅度），停滞 stall_patience 轮的库提前停止，把预算让给其他库
+        reason = None
+        try:
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                while True:
+                    reason = budget.exhausted()
+                    while not reason and len(inflight) < workers:
+                        # 同时在途的库（已开始未结束）受 max_active 限制，避免打开过多工作库/日志
+                        if pending and len(ready) + len(inflight) < max_active:
+                            task = make(pending.pop(0))
+                        elif ready:
+                            task = min(ready, key=lambda t: t.priority())
+                            ready.remove(task)
+                        else:
+                            break
+                        inflight[pool.submit(advance, task)] = task
+                    if not inflight:
                         break
+                    done, _ = wait(inflight, return_when=FIRST_COMPLETED)
+                    for fut in done:
+                        task = inflight.pop(fut)
+                        if fut.exception() is not None:
+                            finish(task, fut.exception())
+                            continue
+                        if not task.done and stall_patience and task.stalled(stall_patience):
+                            task.stop("stalled")
+                        if task.done:
+                            finish(task)
+                        else:
+                            ready.append(task)
+                # 预算耗尽：已开始的库按未通过收尾；未开始的库只认领已完成的断点
+                for task in ready:
+                    task.stop(reason)
+                    finish(task)
+                for dbid in pending:
+                    task = make(dbid)
+                    if resume and task._load_state() and task.done:
+                        task.started = True
                     else:
-                        # 用质量错误+代码+schema 让模型修复
-                        qtext = json.dumps(report, ensure_ascii=False, indent=2)
-                        react_prompt = Path(table_react_prompt_path).read_text("utf-8") if table_react_prompt_path else "Fix quality issues"
-                        fix_query = f"{react_prompt}\n<SCHEMA>\n{schema_info}\n</SCHEMA>\n<ERRORS>\n{qtext}\n</ERRORS>\n<PREV>\n```python\n{code}\n```\n</PREV>"
-                        rsp = client.complete(fix_query)
-                        code = extract_python_block(rsp) + "\n\nif __name__=='__main__':\n\tprint(extend_database())"
-                else:
-                    # 运行报错，走 react_prompt 修复
-                    react = Path(react_prompt_path).read_text("utf-8") if react_prompt_path else "Fix error"
-                    query = f"{react}\n<SCHEMA>\n{schema_info}\n</SCHEMA>\n<ERROR>\n{stderr}\n</ERROR>\n<PREV>\n```python\n{code}\n```\n</PREV>"
-                    rsp = client.complete(query)
-                    code = extract_python_block(rsp) + "\n\nif __name__=='__main__':\n\tprint(extend_database())"
-
-            if not success:
-                results[dbid] = {"success": False, "code": code}
+                        task.stopped = reason
+                    finish(task)
+        finally:
+            bar.close()
+            if pool_exec:
+                pool_exec.close()
+        calls, tokens = budget.totals()
+        log.info(f"Augment: {passed}/{len(meta)} passed, LLM calls={budget.used_calls} tokens~{budget.used_tokens}"
+                 + (f" (shared budget: {calls} calls, ~{tokens} tokens)" if budget.ledger else "")
+                 + (f", budget exhausted ({reason})" if reason else ""))
 
+        results = {dbid: writer.results[dbid] for dbid in meta if dbid in writer.results}
         out = Artifact(kind="AugmentResult", data=results).save_json(f"{workdir}/augment_result.json")
         return {"AugmentResult": out}
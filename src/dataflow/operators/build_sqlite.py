@@ -1,41 +1,266 @@
 """Operator for building SQLite databases from data and DDL."""
 
 from __future__ import annotations
-from typing import Dict
-import sqlite3, os, json
+from typing import Dict, Any, List
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import sqlite3, os, re, json, time, xxhash
 from pathlib import Path
+import pyarrow as pa
+import pyarrow.parquet as pq
 from tqdm import tqdm
 from ..core.operator import Operator
 from ..core.registry import register
 from ..core.artifact import Artifact
+from ..utils.logging import get_logger
+from .compile_ddl import ddl_fingerprint
+
+log = get_logger(__name__)
+
+MANIFEST = "build_manifest.json"
+
+# 装载期 pragma；装载后恢复为改动前读到的值（库的编译期默认值因构建而异，不写死）
+LOAD_PRAGMAS = {"journal_mode": "OFF", "synchronous": "OFF", "temp_store": "MEMORY", "locking_mode": "EXCLUSIVE"}
+
+def read_pragmas(conn: sqlite3.Connection, names) -> Dict[str, Any]:
+    return {k: conn.execute(f"PRAGMA {k}").fetchone()[0] for k in names}
+
+def _sqlite_safe(col: pa.ChunkedArray | pa.Array):
+    # sqlite3 只接受 int/float/str/bytes/None，其余类型（时间、decimal 等）转字符串
+    t = col.type
+    if pa.types.is_integer(t) or pa.types.is_floating(t) or pa.types.is_string(t) \
+            or pa.types.is_large_string(t) or pa.types.is_binary(t) or pa.types.is_boolean(t) or pa.types.is_null(t):
+        return col.to_pylist()
+    try:
+        return col.cast(pa.string()).to_pylist()
+    except (pa.ArrowInvalid, pa.ArrowNotImplementedError):
+        return [None if v is None else str(v) for v in col.to_pylist()]
+
+def _parquet_parts(data_uri: str | None) -> List[Path]:
+    if not data_uri:
+        return []
+    p = Path(data_uri)
+    if p.is_dir():
+        return sorted(p.glob("*.parquet"))
+    return [p] if p.suffix == ".parquet" and p.exists() else []
+
+def source_table(meta: Dict[str, Any], table: str) -> str | None:
+    """LogicalDB 表名 -> 暂存 parquet 所在的 IR 表 id；没有 table_sources 的旧版 LogicalDB 按同名"""
+    sources = meta.get("table_sources")
+    return table if sources is None else sources.get(table)
+
+def _load_table(conn: sqlite3.Connection, table: str, parts: List[Path], batch_size: int) -> int:
+    cols = [r[1] for r in conn.execute(f"PRAGMA table_info('{table}')")]
+    loaded = 0
+    # 每表单事务；journal_mode=OFF 下失败即整库重建，不做回滚
+    conn.execute("BEGIN")
+    for part in parts:
+        pf = pq.ParquetFile(part)
+        use = [c for c in cols if c in pf.schema_arrow.names]
+        if not use:
+            continue
+        sql = f'INSERT INTO "{table}" (' + ", ".join(f'"{c}"' for c in use) + ") VALUES (" + ", ".join("?" * len(use)) + ")"
+        for batch in pf.iter_batches(batch_size=batch_size, columns=use):
+            columns = [_sqlite_safe(batch.column(i)) for i in range(batch.num_columns)]
+            conn.executemany(sql, zip(*columns))
+            loaded += batch.num_rows
+    conn.execute("COMMIT")
+    return loaded
+
+def _integer_keys(parts: List[Path], column: str, batch_size: int) -> bool:
+    """列值按整数亲和性转换后是否都是整数（或 NULL）：INTEGER PRIMARY KEY 是 rowid 别名，否则装载会中止"""
+    probe = sqlite3.connect(":memory:")
+    try:
+        probe.execute("CREATE TABLE v (k INT)")
+        for part in parts:
+            pf = pq.ParquetFile(part)
+            if column not in pf.schema_arrow.names or pa.types.is_integer(pf.schema_arrow.field(column).type):
+                continue
+            for batch in pf.iter_batches(batch_size=batch_size, columns=[column]):
+                probe.executemany("INSERT INTO v VALUES (?)", ((v,) for v in _sqlite_safe(batch.column(0))))
+                if probe.execute("SELECT 1 FROM v WHERE k IS NOT NULL AND typeof(k) <> 'integer' LIMIT 1").fetchone():
+                    return False
+                probe.execute("DELETE FROM v")
+        return True
+    finally:
+        probe.close()
+
+def _check_rowid_key(conn: sqlite3.Connection, table: str, ddl: str, parts: List[Path], batch_size: int):
+    """装载前核对 rowid 别名主键；有非整数值时该表退回 INT PRIMARY KEY（整数亲和性，不自增），QC 的主键规则会报告"""
+    pk = [r for r in conn.execute(f"PRAGMA table_info('{table}')") if r[5]]
+    if len(pk) != 1 or pk[0][2].upper() != "INTEGER" or _integer_keys(parts, pk[0][1], batch_size):
+        return
+    col = re.escape(pk[0][1])
+    fallback, n = re.subn(rf'(["`\[]?{col}["`\]]?\s+)INTEGER(\s+PRIMARY\s+KEY)(\s+AUTOINCREMENT)?', r"\1INT\2",
+                          ddl, count=1, flags=re.I)
+    if not n:
+        return
+    log.warning(f"{table}.{pk[0][1]} has non-integer values; created as INT PRIMARY KEY (no rowid alias)")
+    conn.execute(f'DROP TABLE "{table}"')
+    conn.execute(fallback)
+
+def _file_digest(path: str, cache: Dict[str, Dict[str, Any]]) -> str:
+    # 内容哈希按 (size, mtime) 缓存在清单里；重新摄取写出的同内容 parquet 只需重算一次
+    st = os.stat(path)
+    hit = cache.get(path)
+    if hit and hit["size"] == st.st_size and hit["mtime_ns"] == st.st_mtime_ns:
+        return hit["hash"]
+    h = xxhash.xxh3_128()
+    with open(path, "rb") as f:
+        while chunk := f.read(1 << 20):
+            h.update(chunk)
+    cache[path] = {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "hash": h.hexdigest()}
+    return cache[path]["hash"]
+
+def build_fingerprint(table_meta: Dict[str, str], index_meta: Dict[str, List[str]],
+                      table_parts: Dict[str, List[str]], files: Dict[str, Dict[str, Any]]) -> str:
+    """DDL 指纹 + 各表装载的 parquet 内容哈希"""
+    data = {t: [_file_digest(p, files) for p in parts] for t, parts in sorted(table_parts.items()) if t in table_meta}
+    return xxhash.xxh3_128_hexdigest(json.dumps({"ddl": ddl_fingerprint(table_meta, index_meta), "data": data},
+                                                sort_keys=True).encode("utf-8"))
+
+def _load_manifest(path: Path) -> Dict[str, Any]:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            m = json.load(f)
+        return {"dbs": m.get("dbs", {}), "files": m.get("files", {})}
+    except (FileNotFoundError, ValueError):
+        return {"dbs": {}, "files": {}}
+
+def _save_manifest(path: Path, manifest: Dict[str, Any]):
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+    os.replace(tmp, path)
+
+def build_one(db_path: str, table_meta: Dict[str, str], index_meta: Dict[str, List[str]],
+              table_parts: Dict[str, List[str]], batch_size: int = 50000, cache_size_mb: int = 512) -> Dict[str, int]:
+    """建库 + 装载一个数据库文件；返回 {table: 装载行数}。顶层函数以便在进程池中执行。
+    先建到同目录临时文件再原子替换，正在读旧库的连接不会看到半成品"""
+    final = Path(db_path)
+    path = final.with_name(final.name + ".tmp")
+    for stale in (path, path.with_name(path.name + "-journal")):
+        if stale.exists(): stale.unlink()
+    conn = sqlite3.connect(path, isolation_level=None)
+    counts: Dict[str, int] = {}
+    try:
+        for t, ddl in table_meta.items():
+            conn.execute(ddl)
+        if table_parts:
+            saved = read_pragmas(conn, [*LOAD_PRAGMAS, "cache_size"])
+            for k, v in LOAD_PRAGMAS.items():
+                conn.execute(f"PRAGMA {k}={v}")
+            conn.execute(f"PRAGMA cache_size=-{cache_size_mb * 1024}")
+            for t, parts in table_parts.items():
+                if t in table_meta:
+                    _check_rowid_key(conn, t, table_meta[t], [Path(p) for p in parts], batch_size)
+                    counts[t] = _load_table(conn, t, [Path(p) for p in parts], batch_size)
+        # 索引在装载之后统一建立
+        for t, stmts in index_meta.items():
+            for ddl in stmts:
+                conn.execute(ddl)
+        if table_parts:
+            for k, v in saved.items():
+                conn.execute(f"PRAGMA {k}={v}")
+    except BaseException:
+        conn.close()
+        path.unlink(missing_ok=True)
+        raise
+    conn.close()
+    os.replace(path, final)
+    return counts
 
 @register
 class BuildSQLite(Operator):
     name = "BuildSQLite"
-    input_kinds = ["LogicalDB"]
+    input_kinds = ["LogicalDB", "IR"]
     output_kinds = ["SQLiteDB", "AgentReadyMeta"]
 
-    def run(self, inputs: Dict[str, Artifact], workdir: str="", **_):
+    def run(self, inputs: Dict[str, Artifact], load_data: bool=False, batch_size: int=50000,
+            cache_size_mb: int=512, workers: int|None=None, rebuild: bool=False, workdir: str="", **_):
         logical = inputs["LogicalDB"].data
+        ir = inputs["IR"].data if load_data and "IR" in inputs else None
         out_dir = Path(workdir) / "sqlite_dbs"
         out_dir.mkdir(parents=True, exist_ok=True)
 
-        agent_meta = {}
-        for dbid, meta in tqdm(list(logical.items()), desc="Create SQLite"):
-            db_path = out_dir / f"{dbid}.sqlite"
-            if db_path.exists(): db_path.unlink()
-            conn = sqlite3.connect(db_path)
-            cur = conn.cursor()
-            for t, ddl in meta["table_meta"].items():
-                cur.execute(ddl)
-            conn.commit(); conn.close()
+        jobs: Dict[str, Dict[str, Any]] = {}
+        for dbid, meta in logical.items():
+            table_parts = {}
+            if ir is not None:
+                # 表经 table_sources 对应到 IR 中暂存的 parquet（IngestFiles 的 data_uri）
+                for t in meta["table_meta"]:
+                    src = source_table(meta, t)
+                    parts = _parquet_parts(ir["table_content"].get(src, {}).get("data_uri")) if src else []
+                    if parts:
+                        table_parts[t] = [str(p) for p in parts]
+            jobs[dbid] = dict(db_path=str(out_dir / f"{dbid}.sqlite"), table_meta=meta["table_meta"],
+                              index_meta=meta.get("index_meta", {}), table_parts=table_parts,
+                              batch_size=batch_size, cache_size_mb=cache_size_mb)
+
+        # 清单记录各库上次构建的指纹；指纹未变且库文件仍在的直接复用
+        manifest_path = out_dir / MANIFEST
+        manifest = _load_manifest(manifest_path)
+        status: Dict[str, str] = {}
+        prints: Dict[str, str] = {}
+        loaded: Dict[str, Dict[str, int]] = {}
+        for dbid, job in jobs.items():
+            prints[dbid] = build_fingerprint(job["table_meta"], job["index_meta"], job["table_parts"], manifest["files"])
+            prev = manifest["dbs"].get(dbid)
+            if prev is None:
+                status[dbid] = "new"
+            elif prev["fingerprint"] != prints[dbid] or rebuild or not Path(job["db_path"]).exists():
+                status[dbid] = "changed"
+            else:
+                status[dbid] = "unchanged"
+                loaded[dbid] = prev.get("counts", {})
+        todo = [dbid for dbid in jobs if status[dbid] != "unchanged"]
+        log.info(f"BuildSQLite: {len(todo)} to build, {len(jobs) - len(todo)} unchanged")
 
+        # 每个 db_{cid} 是独立文件，按库并行构建
+        if todo:
+            with ProcessPoolExecutor(max_workers=min(workers or os.cpu_count() or 1, len(todo))) as pool:
+                futs = {pool.submit(build_one, **jobs[dbid]): dbid for dbid in todo}
+                for fut in tqdm(as_completed(futs), total=len(futs), desc="Create SQLite"):
+                    dbid = futs[fut]
+                    try:
+                        loaded[dbid] = fut.result()
+                    except Exception as e:
+                        # 单库失败不中止整批：记入清单（无指纹，下次必重建），该库不进入输出
+                        log.error(f"BuildSQLite: {dbid} failed: {e!r}")
+                        status[dbid] = "failed"
+                        manifest["dbs"][dbid] = {"fingerprint": None, "db_path": jobs[dbid]["db_path"],
+                                                 "status": "failed", "error": repr(e), "built": round(time.time(), 3)}
+                        _save_manifest(manifest_path, manifest)
+                        continue
+                    manifest["dbs"][dbid] = {"fingerprint": prints[dbid], "db_path": jobs[dbid]["db_path"],
+                                             "counts": loaded[dbid], "built": round(time.time(), 3)}
+                    # 每建完一个库就落盘清单，中断后已建好的库不必重建
+                    _save_manifest(manifest_path, manifest)
+        # 只保留仍被引用的 parquet 的内容哈希
+        used = {p for job in jobs.values() for parts in job["table_parts"].values() for p in parts}
+        manifest["files"] = {p: v for p, v in manifest["files"].items() if p in used}
+        _save_manifest(manifest_path, manifest)
+
+        failed = [dbid for dbid in jobs if status[dbid] == "failed"]
+        if failed:
+            log.error(f"BuildSQLite: {len(failed)} database(s) failed: {failed}")
+        agent_meta = {}
+        for dbid, meta in logical.items():
+            if status[dbid] == "failed":
+                continue
+            db_path = Path(jobs[dbid]["db_path"])
             db_meta = dict(meta)
             db_meta["sqlite_path"] = str(db_path.resolve())
-            # 标记为空内容（后续由 LLM 插入）
+            # new / changed / unchanged：后续步骤可跳过未变的库
+            db_meta["build_status"] = status[dbid]
+            db_meta["fingerprint"] = prints[dbid]
+            # 未装载的表标记为空内容（后续由 LLM 插入）
             tc = {}
             for t in meta["table_meta"].keys():
-                tc[t] = {"content": "| column1 | column2 |\n|---|---|\n", "is_empty": True}
+                n = loaded[dbid].get(t, 0)
+                if n:
+                    tc[t] = {"content": "", "is_empty": False, "row_count": n}
+                else:
+                    tc[t] = {"content": "| column1 | column2 |\n|---|---|\n", "is_empty": True}
             db_meta["table_content"] = tc
 
             agent_meta[dbid] = db_meta
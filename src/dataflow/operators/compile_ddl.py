@@ -1,11 +1,34 @@
 """Operator for compiling DDL statements from schemas."""
 
 from __future__ import annotations
-from typing import Dict
+from typing import Dict, Any, List
+from pathlib import Path
+import json, xxhash
 from ..core.operator import Operator
 from ..core.registry import register
 from ..core.artifact import Artifact
 
+def ddl_fingerprint(table_meta: Dict[str, str], index_meta: Dict[str, List[str]]) -> str:
+    """单库 DDL 指纹（建表 + 建索引语句），BuildSQLite 据此判断库是否需要重建"""
+    return xxhash.xxh3_128_hexdigest(json.dumps({"table_meta": table_meta, "index_meta": index_meta},
+                                                sort_keys=True, ensure_ascii=False).encode("utf-8"))
+
+# DDLBundle 条目格式版本：1 = {table: create_sql}；2 = {table_meta, index_meta, fingerprint, version}
+DDL_BUNDLE_VERSION = 2
+
+def bundle_entry(entry: Dict[str, Any]) -> Dict[str, Any]:
+    """把任一版本的 DDLBundle 条目规范为当前格式（旧版只有建表语句，没有索引与指纹）"""
+    if entry.get("version") == DDL_BUNDLE_VERSION:
+        return entry
+    table_meta = entry.get("table_meta") if isinstance(entry.get("table_meta"), dict) else entry
+    index_meta = entry.get("index_meta", {}) if table_meta is not entry else {}
+    return {"table_meta": table_meta, "index_meta": index_meta,
+            "fingerprint": ddl_fingerprint(table_meta, index_meta), "version": DDL_BUNDLE_VERSION}
+
+def load_ddl_bundle(data: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+    """读取 ddl_bundle.json 等外部保存的 DDLBundle 时用，兼容旧版"""
+    return {dbid: bundle_entry(entry) for dbid, entry in data.items()}
+
 @register
 class CompileDDL(Operator):
     name = "CompileDDL"
@@ -16,5 +39,18 @@ class CompileDDL(Operator):
         dbs = inputs["LogicalDB"].data
         ddl_bundle = {}
         for dbid, meta in dbs.items():
-            ddl_bundle[dbid] = meta["table_meta"]
-        return {"DDLBundle": Artifact(kind="DDLBundle", data=ddl_bundle).save_json(f"{workdir}/ddl_bundle.json")}
+            ddl_bundle[dbid] = {
+                "table_meta": meta["table_meta"],
+                "index_meta": meta.get("index_meta", {}),
+                "fingerprint": ddl_fingerprint(meta["table_meta"], meta.get("index_meta", {})),
+                "version": DDL_BUNDLE_VERSION,
+            }
+        path = Path(f"{workdir}/ddl_bundle.json")
+        # 内容未变时不重写文件（保持 mtime，监视该文件的进程不会误判为变更）；旧版文件没有 version，总会被改写为新版
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                if json.load(f) == ddl_bundle:
+                    return {"DDLBundle": Artifact(kind="DDLBundle", uri=str(path), data=ddl_bundle)}
+        except (FileNotFoundError, ValueError):
+            pass
+        return {"DDLBundle": Artifact(kind="DDLBundle", data=ddl_bundle).save_json(path)}
@@ -1,11 +1,208 @@
 """Operator for consolidating schemas from multiple data sources."""
 
 from __future__ import annotations
-from typing import Dict, Any
-import json
+from typing import Dict, Any, List, Tuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+import json, re, sqlite3, xxhash
+from tqdm import tqdm
 from ..core.operator import Operator
 from ..core.registry import register
 from ..core.artifact import Artifact
+from ..providers.llm import get_llm_client
+from ..utils.logging import get_logger
+
+log = get_logger(__name__)
+
+_ALLOWED_DDL = re.compile(r"^\s*CREATE\s+(TABLE|(UNIQUE\s+)?INDEX)\b", re.I)
+
+def extract_sql_block(text: str):
+    m = re.findall(r"```sql(.*?)```", text, flags=re.S)
+    return m[0].strip() if m else text.strip()
+
+def split_sql(script: str) -> List[str]:
+    stmts, buf = [], ""
+    for chunk in script.split(";"):
+        buf += chunk + ";"
+        if sqlite3.complete_statement(buf):
+            if buf.strip(" \n\t;"):
+                stmts.append(buf.strip())
+            buf = ""
+    return stmts
+
+def validate_ddl(script: str) -> Tuple[Dict[str, str], Dict[str, List[str]]]:
+    """在内存 SQLite 中执行 DDL，返回 ({table: create_sql}, {table: [index_sql]})；非法则抛 ValueError/sqlite3.Error"""
+    stmts = split_sql(script)
+    if not stmts:
+        raise ValueError("empty DDL")
+    bad = [s for s in stmts if not _ALLOWED_DDL.match(s)]
+    if bad:
+        raise ValueError(f"non-DDL statement: {bad[0][:80]}")
+    conn = sqlite3.connect(":memory:")
+    try:
+        for s in stmts:
+            conn.execute(s)
+        rows = conn.execute(
+            "SELECT name, sql FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%'").fetchall()
+        if not rows:
+            raise ValueError("DDL defines no tables")
+        table_meta = {name: sql + ";" for name, sql in rows}
+        index_meta: Dict[str, List[str]] = {t: [] for t in table_meta}
+        for t, sql in conn.execute("SELECT tbl_name, sql FROM sqlite_master WHERE type='index' AND sql IS NOT NULL"):
+            index_meta[t].append(sql + ";")
+        # 外键列补建索引（LLM 未给出时）：已有以该列开头的索引（任意名字、含 UNIQUE/主键自动索引）或该列是 rowid 别名即视为覆盖
+        for t in table_meta:
+            covered = set()
+            for r in conn.execute(f"PRAGMA index_list('{t}')").fetchall():
+                lead = conn.execute(f"PRAGMA index_info('{r[1]}')").fetchone()
+                if lead is not None and lead[2] is not None:
+                    covered.add(lead[2])
+            pk = [r for r in conn.execute(f"PRAGMA table_info('{t}')") if r[5]]
+            if len(pk) == 1 and pk[0][2].upper() == "INTEGER":
+                covered.add(pk[0][1])
+            fk_cols = [r[3] for r in conn.execute(f"PRAGMA foreign_key_list('{t}')")]
+            for c in dict.fromkeys(fk_cols):
+                if c not in covered:
+                    index_meta[t].append(fk_index_sql(t, c))
+    finally:
+        conn.close()
+    return table_meta, index_meta
+
+def _table_key(name: str) -> str:
+    n = re.sub(r"[^0-9a-z]", "", name.lower())
+    return n[:-1] if n.endswith("s") else n
+
+def source_table_map(table_meta: Dict[str, str], table_ids: List[str]) -> Dict[str, str]:
+    """LLM 给出的表名 -> 簇内 IR 表 id（暂存 parquet 按 IR 表 id 查找）：同名优先，其次忽略大小写/分隔符/复数；
+    未对应源表的表视为新增（装载为空）。有源表没被任何表对应（改名到认不出、合并）则抛 ValueError"""
+    by_key: Dict[str, List[str]] = {}
+    for t in table_ids:
+        by_key.setdefault(_table_key(t), []).append(t)
+    mapping = {t: t for t in table_meta if t in table_ids}
+    for t in table_meta:
+        if t not in mapping:
+            cands = [s for s in by_key.get(_table_key(t), []) if s not in mapping.values()]
+            if len(cands) == 1:
+                mapping[t] = cands[0]
+    missing = [t for t in table_ids if t not in mapping.values()]
+    if missing:
+        raise ValueError(f"no table for source table(s) {missing[:5]}")
+    return mapping
+
+def table_columns(create_sql: str) -> List[str]:
+    conn = sqlite3.connect(":memory:")
+    try:
+        conn.execute(create_sql)
+        t = conn.execute("SELECT name FROM sqlite_master WHERE type='table'").fetchone()[0]
+        return [r[1] for r in conn.execute(f"PRAGMA table_info('{t}')")]
+    finally:
+        conn.close()
+
+def sqlite_type(decl: str) -> str:
+    """按 SQLite 亲和性规则把源库类型映射为存储类型；未知返回空串"""
+    d = (decl or "").upper()
+    if not d or d == "NULL":
+        return ""
+    if "INT" in d or "BOOL" in d:
+        return "INTEGER"
+    if any(k in d for k in ("CHAR", "CLOB", "TEXT", "DATE", "TIME", "UUID", "JSON", "ENUM")):
+        return "TEXT"
+    if "BLOB" in d or "BINARY" in d:
+        return "BLOB"
+    if any(k in d for k in ("REAL", "FLOA", "DOUB", "DEC", "NUMERIC", "MONEY")):
+        return "REAL"
+    return "TEXT"
+
+def infer_type(values: List[Any]) -> str:
+    """基于样本值推断列类型：全整数 -> INTEGER，全数值 -> REAL，否则 TEXT"""
+    vals = [v for v in values if v is not None and v == v and v != ""]
+    if not vals:
+        return "TEXT"
+    def is_int(v):
+        if isinstance(v, bool) or isinstance(v, int):
+            return True
+        if isinstance(v, float):
+            return v.is_integer()
+        # 前导 0 的编码（邮编/证件号等）保留为 TEXT
+        return isinstance(v, str) and re.fullmatch(r"[+-]?(0|[1-9]\d{0,17})", v.strip()) is not None
+    def is_real(v):
+        if isinstance(v, (int, float)):
+            return True
+        if not isinstance(v, str) or re.fullmatch(r"[+-]?0\d+", v.strip()):
+            return False
+        try:
+            float(v)
+            return True
+        except ValueError:
+            return False
+    if all(is_int(v) for v in vals):
+        return "INTEGER"
+    if all(is_real(v) for v in vals):
+        return "REAL"
+    return "TEXT"
+
+def fk_index_name(table: str, column: str) -> str:
+    return f"idx_{table}_{column}"
+
+def fk_index_sql(table: str, column: str) -> str:
+    return f'CREATE INDEX IF NOT EXISTS "{fk_index_name(table, column)}" ON "{table}" ("{column}");'
+
+def typed_table_meta(ir: Dict[str, Any], table_ids: List[str]) -> Tuple[Dict[str, str], Dict[str, List[str]]]:
+    """由 IR 的 table_schema（类型/主键/外键）+ 样本类型推断生成带约束的 DDL 与外键索引"""
+    members = set(table_ids)
+    table_meta, index_meta = {}, {}
+    for t in table_ids:
+        header = ir["table_header"].get(t, [])
+        schema = ir["table_schema"].get(t, {})
+        declared = {c["name"]: sqlite_type(c.get("type", "")) for c in schema.get("columns", [])}
+        names = [c["name"] for c in schema.get("columns", [])] or list(header)
+        samples = ir["table_content"].get(t, {}).get("samples", [])
+        pks = [c for c in schema.get("primary_key", []) if c in names]
+
+        defs = []
+        for c in names:
+            ctype = declared.get(c)
+            if not ctype:
+                idx = header.index(c) if c in header else -1
+                ctype = infer_type([row[idx] for row in samples if 0 <= idx < len(row)])
+            col = f'"{c}" {ctype}'
+            if len(pks) == 1 and pks[0] == c:
+                # INTEGER PRIMARY KEY 是 rowid 别名（自增）；类型只由样本推断时，全列是否都是整数由 BuildSQLite 装载前核对
+                col += " PRIMARY KEY"
+            defs.append(col)
+        if not defs:
+            defs.append('"id" INTEGER PRIMARY KEY')
+        if len(pks) > 1:
+            defs.append("PRIMARY KEY (" + ", ".join(f'"{c}"' for c in pks) + ")")
+
+        # 仅保留簇内可解析的外键，避免引用不存在的表
+        fks = [fk for fk in schema.get("foreign_keys", [])
+               if fk.get("ref_table") in members and fk.get("column") in names]
+        for fk in fks:
+            defs.append(f'FOREIGN KEY ("{fk["column"]}") REFERENCES "{fk["ref_table"]}" ("{fk["ref_column"]}")')
+
+        body = ",\n  ".join(defs)
+        table_meta[t] = f'CREATE TABLE "{t}" (\n  {body}\n);'
+        index_meta[t] = [fk_index_sql(t, c) for c in dict.fromkeys(fk["column"] for fk in fks)]
+    return table_meta, index_meta
+
+def cluster_prompt(template: str, ir: Dict[str, Any], table_ids: List[str]) -> str:
+    tables = [{"table": t,
+               "columns": ir["table_header"].get(t, []),
+               "schema": ir["table_schema"].get(t, {}),
+               "samples": ir["table_content"].get(t, {}).get("samples", [])[:3]} for t in table_ids]
+    body = json.dumps(tables, ensure_ascii=False, indent=2, default=str)
+    return f"{template}\n<TABLES>\n{body}\n</TABLES>"
+
+def cluster_cache_key(ir: Dict[str, Any], table_ids: List[str], template: str) -> str:
+    base = json.dumps({
+        "tables": sorted(table_ids),
+        "headers": {t: sorted(ir["table_header"].get(t, [])) for t in sorted(table_ids)},
+        # 主键/外键等 schema 元数据也进 prompt（DiscoverKeys 之后会变），一并计入
+        "schemas": {t: ir["table_schema"].get(t, {}) for t in sorted(table_ids)},
+        "template": template,
+    }, sort_keys=True, ensure_ascii=False, default=str)
+    return xxhash.xxh3_64_hexdigest(base.encode("utf-8"))
 
 @register
 class ConsolidateSchema(Operator):
@@ -14,29 +211,81 @@ class ConsolidateSchema(Operator):
     output_kinds = ["LogicalDB"]
 
     def run(self, inputs: Dict[str, Artifact], provider: str="llm_http",
-            prompt_template_path: str="", workdir: str="", **kwargs):
-        # 简化：不强依赖 LLM，基于 cluster 将同簇表合并成“数据库”
+            prompt_template_path: str="", parallelism: int=8, workdir: str="", shared_workdir: str="",
+            run_id: str="", **kwargs):
         ir = inputs["IR"].data
         cmap = inputs["ClusterMap"].data
 
+        schemas: Dict[str, Tuple[Dict[str, str], Dict[str, List[str]]]] = {}
+        sources: Dict[str, str] = {}
+        if provider == "llm_http":
+            template = Path(prompt_template_path).read_text("utf-8") if prompt_template_path \
+                else "Merge the following tables into one relational SQLite schema. Reply with a ```sql block of CREATE TABLE statements."
+            # LLM 响应缓存放在根 workdir，按簇分区运行时各分区共用
+            client = get_llm_client(provider, workdir=shared_workdir or workdir, **kwargs)
+            cache_dir = Path(workdir) / "consolidate_cache"
+            cache_dir.mkdir(parents=True, exist_ok=True)
+
+            # 每簇一个 prompt；簇成员+表头+schema+模板 未变则直接复用缓存，不再请求
+            pending = {}
+            for cid, table_ids in cmap.items():
+                key = cluster_cache_key(ir, table_ids, template)
+                cache_file = cache_dir / f"{key}.json"
+                if cache_file.exists():
+                    cached = json.loads(cache_file.read_text("utf-8"))
+                    try:
+                        mapping = cached.get("table_sources") or source_table_map(cached["table_meta"], table_ids)
+                    except ValueError as e:
+                        log.warning(f"cluster {cid}: cached LLM DDL rejected ({e}); fallback to IR-derived schema")
+                        continue
+                    schemas[cid] = (cached["table_meta"], cached.get("index_meta", {}), mapping)
+                    sources[cid] = "llm_cache"
+                else:
+                    pending[cid] = (table_ids, cache_file)
+
+            def consolidate(table_ids):
+                rsp = client.complete(cluster_prompt(template, ir, table_ids))
+                table_meta, index_meta = validate_ddl(extract_sql_block(rsp))
+                return table_meta, index_meta, source_table_map(table_meta, table_ids)
+
+            with ThreadPoolExecutor(max_workers=max(1, parallelism)) as pool:
+                futs = {pool.submit(consolidate, tids): cid for cid, (tids, _) in pending.items()}
+                for fut in tqdm(as_completed(futs), total=len(futs), desc="Consolidate schema"):
+                    cid = futs[fut]
+                    try:
+                        table_meta, index_meta, mapping = fut.result()
+                    except Exception as e:
+                        log.warning(f"cluster {cid}: LLM DDL rejected ({e}); fallback to IR-derived schema")
+                        continue
+                    cache_file = pending[cid][1]
+                    cache_file.write_text(json.dumps({"tables": sorted(pending[cid][0]), "table_meta": table_meta,
+                                                      "index_meta": index_meta, "table_sources": mapping},
+                                                     ensure_ascii=False, indent=2), "utf-8")
+                    schemas[cid] = (table_meta, index_meta, mapping)
+                    sources[cid] = "llm"
+
         final = {}
         for cid, table_ids in cmap.items():
             dbid = f"db_{cid}"
-            table_meta = {}
-            for t in table_ids:
-                # 简化生成建表语句（真实项目中可调用 LLM 生成/修复）
-                header = ir["table_header"].get(t, [])
-                cols = ",\n  ".join([f"\"{c}\" TEXT" for c in header]) or "\"id\" INTEGER"
-                create_sql = f'CREATE TABLE "{t}" (\n  {cols}\n);'
-                table_meta[t] = create_sql
+            if cid in schemas:
+                table_meta, index_meta, mapping = schemas[cid]
+            else:
+                table_meta, index_meta = typed_table_meta(ir, table_ids)
+                mapping = {t: t for t in table_meta if t in table_ids}
+            table_header = {t: table_columns(sql) for t, sql in table_meta.items()}
 
             final[dbid] = {
                 "source": "consolidated",
                 "type": "sqlite",
                 "unique_id": dbid,
+                "schema_source": sources.get(cid, "ir_schema"),
+                "source_tables": list(table_ids),
+                # 表名 -> 暂存数据所在的 IR 表 id；不在其中的表装载为空
+                "table_sources": mapping,
                 "table_meta": table_meta,
-                "table_header": {t: ir["table_header"].get(t, []) for t in table_ids},
-                "table_content": {t: { "content": "", "is_empty": True } for t in table_ids}
+                "index_meta": index_meta,
+                "table_header": table_header,
+                "table_content": {t: { "content": "", "is_empty": True } for t in table_meta}
             }
 
         return {"LogicalDB": Artifact(kind="LogicalDB", data=final).save_json(f"{workdir}/consolidated_database.json")}
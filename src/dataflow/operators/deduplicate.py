@@ -1,11 +1,12 @@
 """Operator for deduplicating data records."""
 
 from __future__ import annotations
-from typing import Dict
+from typing import Dict, Any, Iterator
 import json, hashlib
 from ..core.operator import Operator
 from ..core.registry import register
 from ..core.artifact import Artifact
+from ..core.stream import TableEntry, entries, skeleton, drain
 
 @register
 class Deduplicate(Operator):
@@ -13,20 +14,21 @@ class Deduplicate(Operator):
     input_kinds = ["IR"]
     output_kinds = ["IR"]
 
-    def run(self, inputs: Dict[str, Artifact], **_):
-        ir = json.loads(json.dumps(inputs["IR"].data))  # deep copy
-        seen = {}
-        for t, header in list(ir["table_header"].items()):
+    def run(self, inputs: Dict[str, Artifact], **params):
+        src = json.loads(json.dumps(inputs["IR"].data))  # deep copy
+        ir = skeleton(src)
+        drain(self.stream(entries(src), ir, **params), ir)
+        return {"IR": Artifact(kind="IR", data=ir)}
+
+    def stream(self, upstream: Iterator[TableEntry], ir: Dict[str, Any], **_):
+        # 表头 + 样本相同的表只保留先到的一张
+        seen = set()
+        for t, entry in upstream:
             stable = json.dumps({
-                "header": header,
-                "samples": ir["table_content"].get(t, {}).get("samples", [])
+                "header": entry["header"],
+                "samples": (entry.get("content") or {}).get("samples", [])
             }, sort_keys=True)
             h = hashlib.md5(stable.encode("utf-8")).hexdigest()
-            if h in seen:
-                # remove duplicate table
-                ir["table_header"].pop(t, None)
-                ir["table_schema"].pop(t, None)
-                ir["table_content"].pop(t, None)
-            else:
-                seen[h] = t
-        return {"IR": Artifact(kind="IR", data=ir)}
+            if h not in seen:
+                seen.add(h)
+                yield t, entry
@@ -0,0 +1,220 @@
+"""Operator for discovering primary/foreign keys across ingested tables from column sketches."""
+
+from __future__ import annotations
+from typing import Dict, Any, List, Tuple
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+import json, os, pickle, re, xxhash
+from pathlib import Path
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+from tqdm import tqdm
+from ..core.operator import Operator
+from ..core.registry import register
+from ..core.artifact import Artifact
+from ..utils.sketch import ColumnSketch, ContainmentIndex, canonical, hash_values
+from ..utils.logging import get_logger
+from .build_sqlite import _parquet_parts
+
+log = get_logger(__name__)
+
+def sketch_table(parts: List[str], num_perm: int = 128, p: int = 12, batch_size: int = 65536) -> Dict[str, ColumnSketch]:
+    """按批读取一张表的 parquet 分片，逐列更新草图；每批先去重再哈希。顶层函数以便在进程池中执行"""
+    out: Dict[str, ColumnSketch] = {}
+    for part in parts:
+        pf = pq.ParquetFile(part)
+        for batch in pf.iter_batches(batch_size=batch_size):
+            for name, col in zip(batch.schema.names, batch.columns):
+                if name.startswith("__index_level_"):
+                    continue
+                sk = out.get(name) or out.setdefault(name, ColumnSketch(num_perm, p))
+                vals, keyable = canonical(col)
+                sk.rows += len(col)
+                sk.nulls += len(col) - len(vals)
+                sk.keyable = sk.keyable and keyable
+                if sk.keyable:
+                    sk.update(hash_values(pc.unique(vals)))
+    return out
+
+SKETCH_CACHE = "key_sketches"
+
+def _sketch_cache_path(workdir: str, table: str) -> Path:
+    return Path(workdir) / SKETCH_CACHE / f"{xxhash.xxh3_64_hexdigest(table.encode('utf-8'))}.pkl"
+
+def sketch_fingerprint(parts: List[str], num_perm: int, p: int) -> str:
+    """按分片的 (路径, 大小, mtime) 与草图参数：暂存文件没变就复用上次的草图"""
+    stats = [(q, os.stat(q).st_size, os.stat(q).st_mtime_ns) for q in parts]
+    return xxhash.xxh3_64_hexdigest(json.dumps([stats, num_perm, p]).encode("utf-8"))
+
+def load_sketches(workdir: str, table: str, fingerprint: str) -> Dict[str, ColumnSketch] | None:
+    try:
+        with open(_sketch_cache_path(workdir, table), "rb") as f:
+            cached = pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError):
+        return None
+    return cached["sketches"] if cached.get("fingerprint") == fingerprint else None
+
+def save_sketches(workdir: str, table: str, fingerprint: str, sketches: Dict[str, ColumnSketch]):
+    path = _sketch_cache_path(workdir, table)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "wb") as f:
+        pickle.dump({"table": table, "fingerprint": fingerprint, "sketches": sketches}, f)
+    os.replace(tmp, path)
+
+def distinct_values(parts: List[str], column: str) -> pa.Array:
+    """列的精确去重值（规范字符串形式）"""
+    chunks = []
+    for part in parts:
+        if column in pq.ParquetFile(part).schema_arrow.names:
+            chunks.append(canonical(pq.read_table(part, columns=[column]).column(0))[0])
+    return pc.unique(pa.chunked_array(chunks, type=pa.string())) if chunks else pa.array([], type=pa.string())
+
+def _stem(name: str) -> str:
+    n = name.lower()
+    return re.sub(r"[_\s-]*(id|key|code|no)$", "", n) or n
+
+def name_related(column: str, ref_table: str, ref_column: str) -> bool:
+    """外键列名与被引用表/列名是否相关：customer_id ~ customers.id、sku ~ products.sku"""
+    s, t = _stem(column), ref_table.lower()
+    return s in (t, t[:-1] if t.endswith("s") else t) or column.lower() == ref_column.lower()
+
+def _pk_rank(table: str, column: str) -> Tuple[int, int]:
+    c, t = column.lower(), table.lower()
+    if c == "id":
+        return (0, 0)
+    if c in (f"{t}_id", f"{t}id", f"{t.rstrip('s')}_id", f"{t.rstrip('s')}id"):
+        return (1, 0)
+    return (2, 0) if c.endswith("id") else (3, len(c))
+
+@register
+class DiscoverKeys(Operator):
+    """从暂存 parquet 为每列构建 MinHash + HLL 草图：
+    1) 主键：无空值且 HLL 基数≈行数的列按列名排序，逐个精确校验唯一性；
+    2) 外键：各表单列主键建包含度索引（MinHash 分段取候选，查询近线性），其余可作键的列按估计包含度
+       |A∩B|/|A| 筛选；父列远大于子列、草图无法估计时只取按列名索引找到的相关主键；
+       再对每列前 max_candidates 个候选做精确包含校验。exhaustive=True 时改为与全部主键逐一比较估计（键少时可用）；
+    结果写回 IR.table_schema 的 primary_key / foreign_keys（已声明的键保留，不覆盖）。
+    各表草图按暂存分片指纹缓存在 workdir/key_sketches/；给出 changed_tables 时（watch 增量）只为这些表找主键，
+    外键只查 这些表的列→任意主键 与 其余表的列→这些表的主键"""
+    name = "DiscoverKeys"
+    input_kinds = ["IR"]
+    output_kinds = ["IR"]
+
+    def run(self, inputs: Dict[str, Artifact], num_perm: int = 128, bands: int | None = None, exhaustive: bool = False,
+            hll_p: int = 12, min_containment: float = 1.0, min_estimate: float = 0.7, min_signal: float = 4.0,
+            min_distinct: int = 2, max_candidates: int = 3,
+            require_name_match: bool = False, batch_size: int = 65536, workers: int | None = None,
+            changed_tables: List[str] | None = None, workdir: str = "", **_):
+        ir = json.loads(json.dumps(inputs["IR"].data, default=str))  # deep copy
+        parts = {t: [str(p) for p in _parquet_parts(c.get("data_uri"))] for t, c in ir["table_content"].items()}
+        parts = {t: ps for t, ps in parts.items() if ps and t in ir["table_header"]}
+        if not parts:
+            log.info("DiscoverKeys: no staged parquet data, nothing to do")
+            return {"IR": Artifact(kind="IR", data=ir)}
+
+        # 1) 草图：先查缓存，其余按表并行
+        sketches: Dict[str, Dict[str, ColumnSketch]] = {}
+        prints = {t: sketch_fingerprint(ps, num_perm, hll_p) for t, ps in parts.items()} if workdir else {}
+        for t in parts:
+            cached = load_sketches(workdir, t, prints[t]) if workdir else None
+            if cached is not None:
+                sketches[t] = cached
+        todo = [t for t in parts if t not in sketches]
+        n = max(1, min(workers or os.cpu_count() or 1, len(todo)))
+        if n == 1:
+            for t in tqdm(todo, desc="Sketch columns"):
+                sketches[t] = sketch_table(parts[t], num_perm, hll_p, batch_size)
+        else:
+            with ProcessPoolExecutor(max_workers=n) as pool:
+                futs = {t: pool.submit(sketch_table, parts[t], num_perm, hll_p, batch_size) for t in todo}
+                for t in tqdm(futs, desc="Sketch columns"):
+                    sketches[t] = futs[t].result()
+        if workdir:
+            for t in todo:
+                save_sketches(workdir, t, prints[t], sketches[t])
+        scope = set(changed_tables) & set(sketches) if changed_tables is not None else None
+
+        exact = lru_cache(maxsize=256)(lambda t, c: distinct_values(parts[t], c))
+
+        # 2) 主键
+        pks: Dict[str, List[str]] = {}
+        for t, cols in sketches.items():
+            declared = ir["table_schema"].get(t, {}).get("primary_key") or []
+            if declared:
+                pks[t] = list(declared)
+                continue
+            if scope is not None and t not in scope:
+                continue
+            cand = [c for c, sk in cols.items()
+                    if sk.keyable and sk.rows and not sk.nulls and sk.cardinality() >= 0.95 * sk.rows]
+            for c in sorted(cand, key=lambda c: _pk_rank(t, c)):
+                if len(exact(t, c)) == cols[c].rows:
+                    pks[t] = [c]
+                    break
+
+        # 3) 外键候选：只索引单列主键（草图 + 按被引用表名/列名的名字索引）；增量时其余表的列只查这些表的主键
+        def build_index(tables):
+            index, names = ContainmentIndex(bands, exhaustive), {}
+            for t in tables:
+                pk = pks[t]
+                if len(pk) == 1 and pk[0] in sketches[t] and sketches[t][pk[0]].keyable:
+                    index.add((t, pk[0]), sketches[t][pk[0]])
+                    n = t.lower()
+                    for name in {n, n[:-1] if n.endswith("s") else n, "column:" + pk[0].lower()}:
+                        names.setdefault(name, []).append((t, pk[0]))
+            return index, names
+        index = build_index(pks)
+        local = index if scope is None else build_index([t for t in pks if t in scope])
+        found: Dict[str, List[Dict[str, Any]]] = {}
+        checked = 0
+        for t, cols in sketches.items():
+            declared = {fk.get("column") for fk in ir["table_schema"].get(t, {}).get("foreign_keys", [])}
+            for c, sk in cols.items():
+                # 本表单列主键不作为外键（避免 id 与 id 的巧合包含）
+                if not sk.keyable or c in declared or pks.get(t) == [c] or sk.cardinality() < min_distinct:
+                    continue
+                cands = []
+                idx, names = index if scope is None or t in scope else local
+                # 与 name_related 相同的规则：列名词干匹配表名，或列名与主键列名相同
+                extra = [*names.get(_stem(c), ()), *names.get("column:" + c.lower(), ())]
+                hits = idx.query(sk, min_estimate, min_signal, extra)
+                for (rt, rc), est in hits:
+                    if rt == t:
+                        continue
+                    related = name_related(c, rt, rc)
+                    if require_name_match and not related:
+                        continue
+                    # 草图给不出估计（父列远大于子列）：只凭列名相关进入精确校验，排在有估计的候选之后
+                    if est is None and not related:
+                        continue
+                    if est is None or est >= min_estimate:
+                        cands.append((related, -1.0 if est is None else est, -sketches[rt][rc].cardinality(), rt, rc))
+                cands.sort(reverse=True)
+                for related, est, _, rt, rc in cands[:max_candidates]:
+                    checked += 1
+                    a = exact(t, c)
+                    if len(a) < min_distinct:
+                        break
+                    inside = pc.sum(pc.is_in(a, value_set=exact(rt, rc))).as_py() or 0
+                    if inside / len(a) >= min_containment:
+                        found.setdefault(t, []).append({"column": c, "ref_table": rt, "ref_column": rc,
+                                                        "containment": round(inside / len(a), 4), "discovered": True})
+                        break
+
+        # 4) 写回 IR
+        for t in sketches:
+            if t not in pks and t not in found:
+                continue
+            schema = ir["table_schema"].setdefault(t, {})
+            if t in pks and not schema.get("primary_key"):
+                schema["primary_key"] = pks[t]
+            if t in found:
+                schema["foreign_keys"] = list(schema.get("foreign_keys", [])) + found[t]
+        n_fk = sum(len(v) for v in found.values())
+        ir["meta"]["key_discovery"] = {"tables": len(sketches), "primary_keys": len(pks), "foreign_keys": n_fk,
+                                       "verified_candidates": checked, "sketched_tables": len(todo)}
+        log.info(f"DiscoverKeys: {len(pks)} primary keys, {n_fk} foreign keys "
+                 f"({checked} candidates verified exactly over {len(sketches)} tables, {len(todo)} sketched)")
+        return {"IR": Artifact(kind="IR", data=ir)}
@@ -1,31 +1,50 @@
 """Operator for generating embeddings from text data."""
 
 from __future__ import annotations
-from typing import Dict, Any, List
-import numpy as np
+from typing import Dict, Any, List, Iterator
+from concurrent.futures import ThreadPoolExecutor
 from ..core.operator import Operator
 from ..core.registry import register
 from ..core.artifact import Artifact
+from ..core.stream import TableEntry, entries, drain
 from ..providers.embedding import get_embedding_provider
 
+def _table_text(title: str, header: List[str]) -> str:
+    return f"Table Title: {title}. Column Names: {', '.join(header)}."
+
 @register
 class EmbedTables(Operator):
     name = "EmbedTables"
     input_kinds = ["IR"]
     output_kinds = ["Embeddings"]
 
-    def run(self, inputs: Dict[str, Artifact], provider: str="dummy", model: str="", parallelism: int=8, workdir: str="", **kwargs):
+    def run(self, inputs: Dict[str, Artifact], **params):
         ir = inputs["IR"].data
-        ids, texts = [], []
-        for t in ir["table_header"].keys():
-            title = t
-            header = ", ".join(ir["table_header"][t])
-            rep = f"Table Title: {title}. Column Names: {header}."
-            ids.append(t); texts.append(rep)
+        # 表原样下传，这里只取嵌入产物
+        return drain(self.stream(entries(ir), {}, **params), {"table_header": {}, "table_schema": {}, "table_content": {}})
 
+    def stream(self, upstream: Iterator[TableEntry], ir: Dict[str, Any], provider: str="dummy", model: str="",
+               parallelism: int=8, batch_size: int=8, workdir: str="", **kwargs):
+        """表到即入批，满 batch_size 张就提交请求（最多 parallelism 批并发）；表原样下传"""
         prov = get_embedding_provider(provider, model=model, **kwargs)
-        vecs = prov.embed(texts)
+        ids, batch, futs = [], [], []
+        checked = 0
+        with ThreadPoolExecutor(max_workers=max(1, parallelism)) as pool:
+            for t, entry in upstream:
+                ids.append(t)
+                batch.append(_table_text(t, entry["header"]))
+                if len(batch) >= batch_size:
+                    futs.append(pool.submit(prov.embed, batch))
+                    batch = []
+                # 已完成的批次若出错立即失败，不等上游读完
+                while checked < len(futs) and futs[checked].done():
+                    futs[checked].result()
+                    checked += 1
+                yield t, entry
+            if batch:
+                futs.append(pool.submit(prov.embed, batch))
+            vecs = [v for f in futs for v in f.result().tolist()]
 
-        emb = {"ids": ids, "vectors": vecs.tolist()}
+        emb = {"ids": ids, "vectors": vecs}
         art = Artifact(kind="Embeddings", data=emb).save_json(f"{workdir}/embeddings.json")
         return {"Embeddings": art}
@@ -0,0 +1,270 @@
+"""Operator for exporting consolidated databases as Hive-partitioned Parquet datasets."""
+
+from __future__ import annotations
+from typing import Dict, Any, List, Iterator, Tuple
+from collections import OrderedDict
+from pathlib import Path
+import sqlite3, json, shutil, datetime
+import pyarrow as pa
+import pyarrow.parquet as pq
+from tqdm import tqdm
+from ..core.operator import Operator
+from ..core.registry import register
+from ..core.artifact import Artifact
+from .consolidate_schema import sqlite_type
+from .build_sqlite import _parquet_parts, source_table
+
+HIVE_NULL = "__HIVE_DEFAULT_PARTITION__"
+# Hive FileUtils.escapePathName 转义的字符：控制字符与路径/分区语法字符按 %XX 编码
+_HIVE_ESCAPE = frozenset([*map(chr, range(0x01, 0x20)), '"', "#", "%", "'", "*", "/", ":", "=", "?", "\\",
+                          "\x7f", "{", "[", "]", "^"])
+
+def hive_escape(value: Any) -> str:
+    """分区目录名中的取值：NULL / 空串为默认分区，其余按 Hive 规则百分号转义（读端按同一规则还原）"""
+    if value is None or value == "":
+        return HIVE_NULL
+    return "".join(f"%{ord(ch):02X}" if ch in _HIVE_ESCAPE else ch for ch in str(value))
+
+# SQLite 存储类型 -> (arrow 类型, 允许的 typeof 取值)
+_ARROW_TYPES = {
+    "INTEGER": (pa.int64(), ("integer", "null")),
+    "REAL": (pa.float64(), ("real", "integer", "null")),
+    "BLOB": (pa.binary(), ("blob", "null")),
+    "TEXT": (pa.string(), ("text", "null")),
+}
+
+def _jsonable(v):
+    if v is None or isinstance(v, (bool, int, float, str)):
+        return v
+    if isinstance(v, bytes):
+        return v.hex()
+    if isinstance(v, (datetime.date, datetime.datetime, datetime.time)):
+        return v.isoformat()
+    return str(v)
+
+def file_manifest(path: Path, root: Path) -> Dict[str, Any]:
+    """从 parquet footer 汇总每列的 null_count / min / max"""
+    md = pq.read_metadata(path)
+    cols: Dict[str, Dict[str, Any]] = {}
+    for rg in range(md.num_row_groups):
+        g = md.row_group(rg)
+        for ci in range(g.num_columns):
+            c = g.column(ci)
+            ent = cols.setdefault(c.path_in_schema, {"null_count": 0, "min": None, "max": None})
+            st = c.statistics
+            if st is None:
+                continue
+            if st.null_count is not None:
+                ent["null_count"] += st.null_count
+            if st.has_min_max:
+                lo, hi = _jsonable(st.min), _jsonable(st.max)
+                try:
+                    ent["min"] = lo if ent["min"] is None else min(ent["min"], lo)
+                    ent["max"] = hi if ent["max"] is None else max(ent["max"], hi)
+                except TypeError:
+                    ent["min"], ent["max"] = lo, hi
+    return {"path": str(path.relative_to(root)), "num_rows": md.num_rows, "row_groups": md.num_row_groups,
+            "size": path.stat().st_size, "columns": cols}
+
+def _has_rows(db_path: str, table: str) -> bool:
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        return bool(conn.execute(f'SELECT EXISTS (SELECT 1 FROM "{table}")').fetchone()[0])
+    finally:
+        conn.close()
+
+def sqlite_batches(db_path: str, table: str, batch_rows: int) -> Tuple[pa.Schema, Iterator[pa.RecordBatch]]:
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    info = conn.execute(f"PRAGMA table_info('{table}')").fetchall()
+    names = [r[1] for r in info]
+    want = [_ARROW_TYPES.get(sqlite_type(r[2]) or "TEXT") for r in info]
+    # 一次聚合扫描确认各列实际存储类型；与声明不符（SQLite 动态类型）的列降级为 string
+    checks = ", ".join(f'SUM(typeof("{n}") NOT IN ({", ".join(repr(x) for x in ok)}))'
+                       for n, (_, ok) in zip(names, want))
+    bad = conn.execute(f'SELECT {checks} FROM "{table}"').fetchone() if names else ()
+    types = [pa.string() if b else t for (t, _), b in zip(want, bad)]
+    schema = pa.schema([pa.field(n, t) for n, t in zip(names, types)])
+
+    def gen():
+        try:
+            cur = conn.execute(f'SELECT {", ".join(chr(34) + n + chr(34) for n in names)} FROM "{table}"')
+            while True:
+                rows = cur.fetchmany(batch_rows)
+                if not rows:
+                    break
+                cols = list(zip(*rows))
+                arrays = []
+                for vals, t in zip(cols, types):
+                    if t == pa.string():
+                        vals = [v if v is None or isinstance(v, str) else (v.hex() if isinstance(v, bytes) else str(v)) for v in vals]
+                    arrays.append(pa.array(vals, type=t))
+                yield pa.RecordBatch.from_arrays(arrays, schema=schema)
+        finally:
+            conn.close()
+    return schema, gen()
+
+def staged_batches(parts: List[Path], columns: List[str], batch_rows: int) -> Tuple[pa.Schema, Iterator[pa.RecordBatch]]:
+    files = [pq.ParquetFile(p) for p in parts]
+    # 各分片类型一致则沿用，否则该列统一为 string
+    fields = []
+    for c in columns:
+        ts = {f.schema_arrow.field(c).type for f in files if c in f.schema_arrow.names}
+        t = ts.pop() if len(ts) == 1 else pa.string()
+        fields.append(pa.field(c, pa.string() if pa.types.is_null(t) else t))
+    schema = pa.schema(fields)
+
+    def gen():
+        for pf in files:
+            use = [c for c in columns if c in pf.schema_arrow.names]
+            for b in pf.iter_batches(batch_size=batch_rows, columns=use):
+                arrays = []
+                for field in schema:
+                    if field.name in b.schema.names:
+                        col = b.column(b.schema.get_field_index(field.name))
+                        arrays.append(col if col.type == field.type else col.cast(field.type))
+                    else:
+                        arrays.append(pa.nulls(b.num_rows, type=field.type))
+                yield pa.RecordBatch.from_arrays(arrays, schema=schema)
+    return schema, gen()
+
+class _PartitionedWriter:
+    """按 Hive 分区（col=value/）分流写入；每个分区攒满 row_group_size 再落一个 row group。
+    同时打开的 ParquetWriter 不超过 max_open_writers，超出时关闭最久未写的（该分区再有数据时写新文件 part-0000N）；
+    各分区缓冲的总行数超过 max_buffered_rows 时，从最久未写入的分区起落盘"""
+
+    def __init__(self, root: Path, schema: pa.Schema, partition_cols: List[str], row_group_size: int,
+                 max_open_writers: int = 64, max_buffered_rows: int | None = None, **writer_opts):
+        self.root = root
+        self.partition_cols = [c for c in partition_cols if c in schema.names]
+        self.data_schema = pa.schema([f for f in schema if f.name not in self.partition_cols])
+        self.row_group_size = row_group_size
+        self.max_open_writers = max(1, max_open_writers)
+        self.max_buffered_rows = max_buffered_rows or 4 * row_group_size
+        self.writer_opts = writer_opts
+        self.writers: OrderedDict[tuple, pq.ParquetWriter] = OrderedDict()
+        self.buffers: OrderedDict[tuple, List[pa.RecordBatch]] = OrderedDict()
+        self.buffered: Dict[tuple, int] = {}
+        self.total_buffered = 0
+        self.files: Dict[tuple, int] = {}
+        self.paths: List[Path] = []
+
+    def _dir(self, key: tuple) -> Path:
+        d = self.root
+        for c, v in zip(self.partition_cols, key):
+            d = d / f"{hive_escape(c)}={hive_escape(v)}"
+        return d
+
+    def _writer(self, key: tuple) -> pq.ParquetWriter:
+        w = self.writers.get(key)
+        if w is not None:
+            self.writers.move_to_end(key)
+            return w
+        if len(self.writers) >= self.max_open_writers:
+            self.writers.popitem(last=False)[1].close()
+        d = self._dir(key)
+        d.mkdir(parents=True, exist_ok=True)
+        n = self.files.get(key, 0)
+        self.files[key] = n + 1
+        path = d / f"part-{n:05d}.parquet"
+        self.writers[key] = w = pq.ParquetWriter(path, self.data_schema, **self.writer_opts)
+        self.paths.append(path)
+        return w
+
+    def _flush(self, key: tuple):
+        rows = self.buffered.pop(key, 0)
+        batches = self.buffers.pop(key, [])
+        if not rows:
+            return
+        self.total_buffered -= rows
+        tbl = pa.Table.from_batches(batches, schema=self.data_schema)
+        self._writer(key).write_table(tbl, row_group_size=self.row_group_size)
+
+    def write(self, batch: pa.RecordBatch):
+        if not self.partition_cols:
+            groups = {(): batch}
+        else:
+            keys = list(zip(*[batch.column(batch.schema.get_field_index(c)).to_pylist() for c in self.partition_cols]))
+            idx: Dict[tuple, List[int]] = {}
+            for i, k in enumerate(keys):
+                idx.setdefault(k, []).append(i)
+            groups = {k: batch.take(pa.array(ix)) for k, ix in idx.items()}
+        for key, part in groups.items():
+            part = part.select(self.data_schema.names)
+            self.buffers.setdefault(key, []).append(part)
+            self.buffers.move_to_end(key)
+            self.buffered[key] = self.buffered.get(key, 0) + part.num_rows
+            self.total_buffered += part.num_rows
+            if self.buffered[key] >= self.row_group_size:
+                self._flush(key)
+        while self.total_buffered > self.max_buffered_rows:
+            self._flush(next(iter(self.buffers)))
+
+    def close(self) -> List[Path]:
+        for key in list(self.buffers):
+            self._flush(key)
+        for w in self.writers.values():
+            w.close()
+        self.writers.clear()
+        if not self.paths:
+            # 空表也写出一个仅含 schema 的文件，保证数据集可读
+            self.root.mkdir(parents=True, exist_ok=True)
+            path = self.root / "part-00000.parquet"
+            pq.write_table(self.data_schema.empty_table(), path, **self.writer_opts)
+            self.paths.append(path)
+        return self.paths
+
+@register
+class ExportParquet(Operator):
+    name = "ExportParquet"
+    input_kinds = ["LogicalDB", "SQLiteDB", "IR"]
+    output_kinds = ["ParquetExport"]
+
+    def run(self, inputs: Dict[str, Artifact], source: str="auto", export_dir: str="",
+            partition_cols: Dict[str, List[str]]|None=None, row_group_size: int=131072, batch_rows: int=65536,
+            compression: str="zstd", use_dictionary: bool|List[str]=True, max_open_writers: int=64,
+            max_buffered_rows: int|None=None, workdir: str="", **_):
+        logical = inputs["LogicalDB"].data
+        ir = inputs["IR"].data if "IR" in inputs else {"table_content": {}}
+        sqlite_paths = {Path(p).stem: p for p in inputs["SQLiteDB"].data["db_paths"]} if "SQLiteDB" in inputs else {}
+        out_root = Path(export_dir or Path(workdir) / "parquet_export")
+        partition_cols = partition_cols or {}
+        writer_opts = dict(compression=compression, use_dictionary=use_dictionary, write_statistics=True)
+
+        exported = {}
+        for dbid, meta in tqdm(list(logical.items()), desc="Export Parquet"):
+            db_root = out_root / dbid
+            db_path = sqlite_paths.get(dbid)
+            tables = {}
+            for t in meta["table_meta"]:
+                staged = source_table(meta, t)
+                parts = _parquet_parts(ir["table_content"].get(staged, {}).get("data_uri")) if staged else []
+                # auto：库里有数据（含 LLM 扩充）优先导出库，否则回落到暂存 parquet
+                has_db = bool(db_path) and Path(db_path).exists()
+                if has_db and (source == "sqlite" or source == "auto" and (not parts or _has_rows(db_path, t))):
+                    src = "sqlite"
+                    schema, batches = sqlite_batches(db_path, t, batch_rows)
+                elif parts and source != "sqlite":
+                    src = "staged"
+                    schema, batches = staged_batches(parts, meta["table_header"].get(t, []), batch_rows)
+                else:
+                    continue
+
+                table_root = db_root / t
+                if table_root.exists(): shutil.rmtree(table_root)
+                writer = _PartitionedWriter(table_root, schema, partition_cols.get(t, []), row_group_size,
+                                            max_open_writers, max_buffered_rows, **writer_opts)
+                for batch in batches:
+                    writer.write(batch)
+                files = writer.close()
+                tables[t] = {"source": src, "partition_cols": writer.partition_cols,
+                             "schema": {f.name: str(f.type) for f in schema},
+                             "files": [file_manifest(p, db_root) for p in files]}
+
+            manifest = {"dbid": dbid, "tables": tables}
+            db_root.mkdir(parents=True, exist_ok=True)
+            with open(db_root / "_manifest.json", "w", encoding="utf-8") as f:
+                json.dump(manifest, f, indent=2, ensure_ascii=False)
+            exported[dbid] = {"path": str(db_root.resolve()), "manifest": str((db_root / "_manifest.json").resolve()),
+                              "tables": {t: sum(x["num_rows"] for x in v["files"]) for t, v in tables.items()}}
+
+        return {"ParquetExport": Artifact(kind="ParquetExport", data=exported).save_json(f"{workdir}/parquet_export.json")}
@@ -1,12 +1,13 @@
 """Operator for ingesting data from databases."""
 
 from __future__ import annotations
-from typing import Dict, Any
+from typing import Dict, Any, Iterator
 from sqlalchemy import create_engine, inspect, text
 import pandas as pd
 from ..core.operator import Operator
 from ..core.registry import register
 from ..core.artifact import Artifact
+from ..core.stream import TableEntry, drain
 from ..ir.schema import new_ir
 
 @register
@@ -15,10 +16,16 @@ class IngestDB(Operator):
     input_kinds = []
     output_kinds = ["IR"]
 
-    def run(self, inputs: Dict[str, Artifact], uri: str, dataset_id: str, workdir: str, **_):
+    def run(self, inputs: Dict[str, Artifact], **params):
+        ir: Dict[str, Any] = {}
+        drain(self.stream(iter(()), ir, **params), ir)
+        return {"IR": Artifact(kind="IR", data=ir)}
+
+    def stream(self, upstream: Iterator[TableEntry], ir: Dict[str, Any], uri: str, dataset_id: str, workdir: str, **_):
+        """逐表反射 + 取样，每张表完成即产出"""
         engine = create_engine(uri)
         insp = inspect(engine)
-        ir = new_ir(dataset_id)
+        ir.update(new_ir(dataset_id))
         ir["source"] = uri
         ir["type"] = "db"
 
@@ -28,8 +35,7 @@ class IngestDB(Operator):
             fks = insp.get_foreign_keys(t)
             pks = insp.get_pk_constraint(t).get("constrained_columns") or []
 
-            ir["table_header"][t] = [c["name"] for c in cols]
-            ir["table_schema"][t] = {
+            schema = {
                 "columns": [{"name": c["name"], "type": str(c.get("type"))} for c in cols],
                 "primary_key": pks,
                 "foreign_keys": [{"column": fk["constrained_columns"][0],
@@ -40,10 +46,8 @@ class IngestDB(Operator):
             with engine.connect() as conn:
                 sample = conn.execute(text(f"SELECT * FROM \"{t}\" LIMIT 20")).fetchall()
                 cnt = conn.execute(text(f"SELECT COUNT(*) FROM \"{t}\"")).scalar()
-            ir["table_content"][t] = {
+            yield t, {"header": [c["name"] for c in cols], "schema": schema, "content": {
                 "samples": [list(row) for row in sample],
                 "row_count": int(cnt),
                 "data_uri": uri
-            }
-
-        return {"IR": Artifact(kind="IR", data=ir)}
+            }}
@@ -1,13 +1,14 @@
 """Operator for ingesting data from files."""
 
 from __future__ import annotations
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Iterator
 from pathlib import Path
 import pandas as pd
 from slugify import slugify
 from ..core.operator import Operator
 from ..core.registry import register
 from ..core.artifact import Artifact
+from ..core.stream import TableEntry, drain
 from ..ir.schema import new_ir
 
 @register
@@ -16,17 +17,29 @@ class IngestFiles(Operator):
     input_kinds = []
     output_kinds = ["IR"]
 
-    def run(self, inputs: Dict[str, Artifact], input_globs: List[str], dataset_id: str, workdir: str, **_):
-        ir = new_ir(dataset_id)
+    def run(self, inputs: Dict[str, Artifact], **params):
+        ir: Dict[str, Any] = {}
+        drain(self.stream(iter(()), ir, **params), ir)
+        return {"IR": Artifact(kind="IR", data=ir)}
+
+    def stream(self, upstream: Iterator[TableEntry], ir: Dict[str, Any], input_globs: List[str], dataset_id: str,
+               workdir: str, **_):
+        """逐表产出：先按文件名归组，同名（slugify 后）的文件读完即产出该表"""
+        ir.update(new_ir(dataset_id))
         ir["source"] = "files"
         ir["type"] = "tables"
 
-        tables = {}
         tmp_dir = Path(workdir) / "staging" / dataset_id
         tmp_dir.mkdir(parents=True, exist_ok=True)
 
+        groups: Dict[str, List[Path]] = {}
         for pattern in input_globs:
             for p in Path().glob(pattern):
+                groups.setdefault(slugify(p.stem), []).append(p)
+
+        for tname, paths in groups.items():
+            items = []
+            for p in paths:
                 try:
                     df = (pd.read_excel(p) if p.suffix.lower() in [".xlsx", ".xls"]
                           else pd.read_json(p) if p.suffix.lower() == ".json"
@@ -34,16 +47,15 @@ class IngestFiles(Operator):
                           else pd.read_csv(p))
                 except Exception:
                     continue
+                df.columns = [str(c) for c in df.columns]
+                items.append((p, df))
+            if not items:
+                continue
 
-                tname = slugify(p.stem)
-                tables.setdefault(tname, []).append((p, df))
-
-        # 简化：同名表合并列头（取最大覆盖）
-        for tname, items in tables.items():
+            # 简化：同名表合并列头（取最大覆盖，保持列序）
             header = []
             for _, df in items:
-                header = list({*header, *map(str, df.columns)})
-            ir["table_header"][tname] = header
+                header = list(dict.fromkeys([*header, *df.columns]))
 
             sample_rows = []
             total_rows = 0
@@ -53,15 +65,14 @@ class IngestFiles(Operator):
             parts = []
             for idx, (p, df) in enumerate(items):
                 total_rows += len(df)
-                sample_rows += df.head(5).values.tolist()
+                # 样本按合并后的表头对齐，供下游类型推断
+                sample_rows += df.head(5).reindex(columns=header).values.tolist()
                 outp = table_dir / f"part_{idx}.parquet"
                 df.to_parquet(outp)
                 parts.append(str(outp))
 
-            ir["table_content"][tname] = {
+            yield tname, {"header": header, "schema": None, "content": {
                 "samples": sample_rows[:50],
                 "row_count": int(total_rows),
                 "data_uri": str(table_dir.resolve())
-            }
-
-        return {"IR": Artifact(kind="IR", data=ir)}
+            }}
@@ -0,0 +1,142 @@
+"""Operator for post-build SQLite tuning: indexes, planner statistics, page size and VACUUM."""
+
+from __future__ import annotations
+from typing import Dict, Any, List
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+import sqlite3, os, time
+from tqdm import tqdm
+from ..core.operator import Operator
+from ..core.registry import register
+from ..core.artifact import Artifact
+
+def auto_page_size(size_bytes: int) -> int:
+    # 小库保持默认 4K；大库用更大的页减少 B-tree 深度与页头开销
+    if size_bytes < 64 << 20:
+        return 4096
+    if size_bytes < 1 << 30:
+        return 8192
+    return 16384
+
+def _tables(conn: sqlite3.Connection) -> List[str]:
+    return [r[0] for r in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%'")]
+
+def _leading_index_columns(conn: sqlite3.Connection, table: str) -> set:
+    cols = set()
+    for idx in conn.execute(f"PRAGMA index_list('{table}')").fetchall():
+        info = conn.execute(f"PRAGMA index_info('{idx[1]}')").fetchall()
+        if info:
+            cols.add(info[0][2])
+    return cols
+
+def default_queries(conn: sqlite3.Connection, index_columns: Dict[str, List[str]]) -> List[str]:
+    qs = []
+    for t in _tables(conn):
+        qs.append(f'SELECT COUNT(*) FROM "{t}"')
+        for fk in conn.execute(f"PRAGMA foreign_key_list('{t}')").fetchall():
+            _, _, ref_table, col, ref_col, *_ = fk
+            qs.append(f'SELECT COUNT(*) FROM "{t}" a JOIN "{ref_table}" b ON a."{col}" = b."{ref_col or "rowid"}"')
+        for col in index_columns.get(t, []):
+            qs.append(f'SELECT * FROM "{t}" WHERE "{col}" = (SELECT "{col}" FROM "{t}" LIMIT 1)')
+    return qs
+
+def time_queries(conn: sqlite3.Connection, queries: List[str], repeat: int = 3) -> List[Dict[str, Any]]:
+    out = []
+    for q in queries:
+        best = None
+        try:
+            for _ in range(repeat):
+                t0 = time.perf_counter()
+                conn.execute(q).fetchall()
+                dt = (time.perf_counter() - t0) * 1000
+                best = dt if best is None else min(best, dt)
+            out.append({"sql": q, "ms": round(best, 3)})
+        except sqlite3.Error as e:
+            out.append({"sql": q, "ms": None, "error": str(e)})
+    return out
+
+def optimize_db(db_path: str, page_size: int | None = None, index_columns: Dict[str, List[str]] | None = None,
+                sample_queries: List[str] | None = None, repeat: int = 3) -> Dict[str, Any]:
+    """单库优化：补索引 -> ANALYZE/optimize -> 设置 page_size 并 VACUUM INTO 重建。顶层函数以便进程池调用"""
+    path = Path(db_path)
+    index_columns = index_columns or {}
+    size_before = path.stat().st_size
+    conn = sqlite3.connect(path, isolation_level=None)
+    try:
+        queries = sample_queries or default_queries(conn, index_columns)
+        before = time_queries(conn, queries, repeat)
+
+        # 外键列 + 配置的高频过滤列，缺少前导索引的补建
+        added = []
+        for t in _tables(conn):
+            want = [fk[3] for fk in conn.execute(f"PRAGMA foreign_key_list('{t}')").fetchall()]
+            want += index_columns.get(t, [])
+            have = _leading_index_columns(conn, t)
+            for col in dict.fromkeys(want):
+                if col in have:
+                    continue
+                name = f"idx_{t}_{col}"
+                conn.execute(f'CREATE INDEX IF NOT EXISTS "{name}" ON "{t}" ("{col}")')
+                have.add(col)
+                added.append(name)
+
+        conn.execute("ANALYZE")
+        conn.execute("PRAGMA optimize")
+
+        ps = page_size or auto_page_size(size_before)
+        tmp = path.with_name(path.name + ".vacuum")
+        if tmp.exists(): tmp.unlink()
+        conn.execute(f"PRAGMA page_size={int(ps)}")
+        conn.execute("VACUUM INTO ?", (str(tmp),))
+    finally:
+        conn.close()
+    os.replace(tmp, path)
+
+    conn = sqlite3.connect(path)
+    try:
+        after = time_queries(conn, queries, repeat)
+        final_ps = conn.execute("PRAGMA page_size").fetchone()[0]
+    finally:
+        conn.close()
+
+    return {
+        "size_before": size_before,
+        "size_after": path.stat().st_size,
+        "page_size": final_ps,
+        "indexes_added": added,
+        "queries": [{"sql": b["sql"], "before_ms": b["ms"], "after_ms": a["ms"], **({"error": b["error"]} if "error" in b else {})}
+                    for b, a in zip(before, after)],
+    }
+
+@register
+class OptimizeSQLite(Operator):
+    name = "OptimizeSQLite"
+    input_kinds = ["SQLiteDB", "AugmentResult"]
+    output_kinds = ["SQLiteDB", "OptimizeReport"]
+
+    def run(self, inputs: Dict[str, Artifact], page_size: int|None=None,
+            index_columns: Dict[str, List[str]]|None=None, sample_queries: List[str]|Dict[str, List[str]]|None=None,
+            repeat: int=3, workers: int|None=None, workdir: str="", **_):
+        paths = list(inputs["SQLiteDB"].data["db_paths"])
+        # 经过 AugmentWithLLM 的库以扩充后的工作库为准
+        if "AugmentResult" in inputs:
+            augmented = {Path(p).stem: p for p in
+                         (r.get("sqlite_path") for r in inputs["AugmentResult"].data.values()) if p}
+            paths = [augmented.get(Path(p).stem, p) for p in paths]
+
+        def queries_for(p):
+            if isinstance(sample_queries, dict):
+                return sample_queries.get(Path(p).stem)
+            return sample_queries
+
+        report = {}
+        with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+            futs = {pool.submit(optimize_db, p, page_size, index_columns, queries_for(p), repeat): p for p in paths}
+            for fut in tqdm(as_completed(futs), total=len(futs), desc="Optimize SQLite"):
+                report[futs[fut]] = fut.result()
+
+        return {
+            "SQLiteDB": Artifact(kind="SQLiteDB", data={"db_paths": paths}),
+            "OptimizeReport": Artifact(kind="OptimizeReport", data=report).save_json(f"{workdir}/optimize_report.json"),
+        }
@@ -1,48 +1,254 @@
 from __future__ import annotations
-from typing import Dict, Any, List, Tuple
-import importlib, sqlite3, json
+from typing import Dict, Any, List, Tuple, Set
+from functools import lru_cache
+import importlib, sqlite3, json, os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from tqdm import tqdm
 from ..core.operator import Operator
 from ..core.registry import register
 from ..core.artifact import Artifact
+from ..qc_rules.base import AggregateRule, RULE_OPTIONS, connect_ro, table_info, run_fused
 
-def quality_check_db(db_path: str, rules: List[Tuple[str, dict]]|None=None):
-    # 通用质量检查引擎：加载规则插件并执行
-    report = []
-    ok = True
-    database_content = {}
-    try:
-        with sqlite3.connect(db_path) as conn:
-            cur = conn.cursor()
-            cur.execute("SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%';")
-            tables = [r[0] for r in cur.fetchall()]
-            database_content["table_names"] = tables
+# 默认规则（无外部配置时）
+DEFAULT_RULES: List[Tuple[str, dict]] = [
+    ("dataflow.qc_rules.basic.RowCountRule", {"min_records_per_table": 20}),
+    ("dataflow.qc_rules.basic.NullRateRule", {"max_null_rate": 1.0}),  # 容忍
+    ("dataflow.qc_rules.basic.ForeignKeyRule", {})
+]
+
+# 旧版本在库内装过的变更追踪对象（版本表 + 触发器）；现改为只读快照，遇到时清掉
+TRACK_TABLE = "_dataflow_qc_versions"
+_TRIGGER_PREFIX = "_dataflow_qc_"
+
+@lru_cache(maxsize=None)
+def resolve_rule(mod_cls: str):
+    mod_name, cls_name = mod_cls.rsplit(".", 1)
+    return getattr(importlib.import_module(mod_name), cls_name)
+
+def build_rules(rules: List[Any] | None) -> List[Any]:
+    # (模块.类, 参数) 实例化；已是规则实例的原样保留（规则只持有配置，可跨库复用）
+    out = []
+    for r in rules or DEFAULT_RULES:
+        if isinstance(r, (tuple, list)):
+            params = dict(r[1] or {})
+            # 采样/容忍度等通用选项不进构造函数，直接覆盖实例属性
+            opts = {k: params.pop(k) for k in RULE_OPTIONS if k in params}
+            r = resolve_rule(r[0])(**params)
+            for k, v in opts.items():
+                setattr(r, k, v)
+        out.append(r)
+    return out
+
+def _ident(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+def _lit(name: str) -> str:
+    return "'" + name.replace("'", "''") + "'"
+
+def drop_tracking(conn: sqlite3.Connection):
+    """删除旧版本 QCSession 装在库里的变更追踪触发器与版本表"""
+    for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type='trigger'").fetchall():
+        if name.startswith(_TRIGGER_PREFIX):
+            conn.execute(f"DROP TRIGGER IF EXISTS {_ident(name)}")
+    conn.execute(f"DROP TABLE IF EXISTS {TRACK_TABLE}")
+
+class QCSession:
+    """同一数据库跨多次检查的增量 QC 引擎（不向库内写任何对象）。
+
+    - PRAGMA data_version 未变：直接复用上次结果
+    - 否则按每表快照 (建表 SQL, COUNT(*), MAX(rowid)) 判定变更表，仅对变更表重跑 scope="table" 的规则；
+      scope="fk" 的规则额外覆盖引用了变更表的表；scope="database"（或未声明）的规则有变更即整库重跑
+    - 快照看不到不改行数与最大 rowid 的原地 UPDATE：上次未通过的 (规则, 表) 每次都重查，
+      增量检查全部通过时再整库复查一遍确认，结论不会停留在过期的结果上
+    track_changes=False 时每次检查视全部表为变更（一次性检查）。
+    AggregateRule 规则走融合执行：每张待查表只扫描一次，共享同一只读连接。
+    approx=True 时支持采样的规则先在大表的随机样本上估计，结论不确定再精确检查。
+    """
+
+    def __init__(self, db_path: str, rules: List[Any] | None = None, track_changes: bool = True,
+                 immutable: bool = False, mmap_size: int = 0, approx: bool = False):
+        self.db_path = db_path
+        self.rules = build_rules(rules)
+        self.track_changes = track_changes
+        self.approx = approx
+        if track_changes:
+            # 旧版本崩溃时可能留下的追踪对象：清掉，免得混进交付库与提示词
+            conn = sqlite3.connect(db_path, isolation_level=None)
+            try:
+                drop_tracking(conn)
+            finally:
+                conn.close()
+        self.ro = connect_ro(db_path, immutable=immutable and not track_changes, mmap_size=mmap_size)
+        self.data_version = None
+        self.fingerprints: Dict[str, Tuple[str, int, Any]] = {}
+        self.info: Dict[str, Dict[str, Any]] = {}
+        self.content: Dict[str, Any] = {}
+        self.items: List[Dict[str, List[dict]]] = [{} for _ in self.rules]   # rule -> {table: items}
+        self.db_items: List[List[dict] | None] = [None for _ in self.rules]  # database 级规则
+        self.last = None
+
+    def invalidate(self):
+        """外部替换了库文件（如回滚快照）后调用，下次检查全量重跑"""
+        self.fingerprints.clear()
+        self.last = None
+        self.data_version = None
+
+    def mark(self) -> Dict[str, Any]:
+        """记录当前检查状态；与同一时刻的库快照配对使用"""
+        return {"fingerprints": dict(self.fingerprints), "content": dict(self.content), "info": dict(self.info),
+                "items": [{t: list(v) for t, v in c.items()} for c in self.items],
+                "db_items": list(self.db_items), "last": self.last}
+
+    def reset(self, mark: Dict[str, Any]):
+        """库被恢复到 mark() 时的快照后调用：表快照随库一起回退，增量判定依然有效"""
+        self.fingerprints = dict(mark["fingerprints"])
+        self.content = dict(mark["content"])
+        self.info = dict(mark["info"])
+        self.items = [{t: list(v) for t, v in c.items()} for c in mark["items"]]
+        self.db_items = list(mark["db_items"])
+        self.last = mark["last"]
+        self.data_version = None
+
+    def data_version_now(self) -> int:
+        # 其他连接（沙箱）提交过写入时才会变化
+        return self.ro.execute("PRAGMA data_version").fetchone()[0]
+
+    def _snapshot(self, table: str) -> Tuple[int, Any]:
+        t = _ident(table)
+        try:
+            return tuple(self.ro.execute(f"SELECT COUNT(*), MAX(rowid) FROM {t}").fetchone())
+        except sqlite3.OperationalError:
+            # WITHOUT ROWID 表没有 rowid
+            return (self.ro.execute(f"SELECT COUNT(*) FROM {t}").fetchone()[0], None)
+
+    def _changed_tables(self) -> Tuple[List[str], Set[str]]:
+        rows = self.ro.execute("SELECT name, sql FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%' "
+                               "AND name <> ?", (TRACK_TABLE,)).fetchall()
+        tables = [r[0] for r in rows]
+        if not self.track_changes:
+            return tables, set(tables)
+        fps = {t: (sql, *self._snapshot(t)) for t, sql in rows}
+        dirty = {t for t in tables if self.fingerprints.get(t) != fps[t]}
+        self.fingerprints = fps
+        return tables, dirty
 
+    def check(self):
+        try:
+            dv = self.data_version_now()
+            if self.last is not None and dv == self.data_version:
+                return self.last
+            tables, dirty = self._changed_tables()
+            removed = set(self.content) - set(tables) - {"table_names"}
+            for t in removed:
+                self.content.pop(t, None)
+                self.info.pop(t, None)
             for t in tables:
-                cur.execute(f"PRAGMA table_info('{t}')")
-                cols = cur.fetchall()
-                cur.execute(f"SELECT COUNT(*) FROM '{t}'"); total = cur.fetchone()[0]
-                cur.execute(f"SELECT * FROM '{t}' LIMIT 10"); sample = cur.fetchall()
-                database_content[t] = {"columns": cols, "sample_data": sample, "total_count": total}
-
-        # 默认规则（无外部配置时）
-        rules = rules or [
-            ("dataflow.qc_rules.basic.RowCountRule", {"min_records_per_table": 20}),
-            ("dataflow.qc_rules.basic.NullRateRule", {"max_null_rate": 1.0}),  # 容忍
-            ("dataflow.qc_rules.basic.ForeignKeyRule", {})
-        ]
-
-        for mod_cls, params in rules:
-            mod_name, cls_name = mod_cls.rsplit(".", 1)
-            cls = getattr(importlib.import_module(mod_name), cls_name)
-            inst = cls(**(params or {}))
-            items = inst.run(db_path, {"tables": database_content.get("table_names", [])})
-            report.extend(items)
+                if t in dirty or t not in self.content:
+                    self.info[t] = info = table_info(self.ro, t)
+                    total = self.ro.execute(f"SELECT COUNT(*) FROM {_ident(t)}").fetchall()[0][0]
+                    sample = self.ro.execute(f"SELECT * FROM {_ident(t)} LIMIT 10").fetchall()
+                    self.content[t] = {"columns": info["columns"], "sample_data": sample, "total_count": total}
+            self.content["table_names"] = tables
+
+            # 引用了变更表的表（外键规则需要重查）
+            referencing = {t for t in tables if {fk[2] for fk in self.info[t]["fks"]} & dirty}
+
+            # 各规则本次需要（重）查的表
+            plan: List[Tuple[int, List[str]]] = []
+            for i, rule in enumerate(self.rules):
+                scope = getattr(rule, "scope", "database")
+                if scope in ("table", "fk"):
+                    cache = self.items[i]
+                    rerun = dirty | referencing if scope == "fk" else set(dirty)
+                    rerun |= {t for t, items in cache.items() if not all(it.get("passed", False) for it in items)}
+                    rerun = [t for t in tables if t in rerun]
+                    for t in list(cache):
+                        if t not in tables or t in rerun:
+                            cache.pop(t)
+                    if rerun:
+                        plan.append((i, rerun))
+                elif (self.db_items[i] is None or dirty or removed
+                      or not all(it.get("passed", False) for it in self.db_items[i])):
+                    plan.append((i, tables))
+
+            fused = [(i, ts) for i, ts in plan if isinstance(self.rules[i], AggregateRule)]
+            results = dict(zip((i for i, _ in fused),
+                               run_fused([(self.rules[i], ts) for i, ts in fused], self.ro, self.info,
+                                         approx=self.approx)))
+            for i, ts in plan:
+                if i not in results:
+                    results[i] = self.rules[i].run(self.db_path, {"tables": ts, "conn": self.ro, "table_info": self.info})
+
+            report = []
+            for i, rule in enumerate(self.rules):
+                if getattr(rule, "scope", "database") in ("table", "fk"):
+                    cache = self.items[i]
+                    for item in results.get(i, []):
+                        cache.setdefault(item.get("table"), []).append(item)
+                    for t in tables:
+                        report.extend(cache.get(t, []))
+                else:
+                    if i in results:
+                        self.db_items[i] = results[i]
+                    report.extend(self.db_items[i])
+        except Exception as e:
+            self.invalidate()
+            return False, [{"rule_id":"engine_error","passed":False,"severity":"error","message":str(e),"details":{}}], dict(self.content)
+
+        ok = all(item.get("passed", False) for item in report if item.get("severity")=="error")
+        if ok and set(dirty) != set(tables):
+            # 增量结果全部通过：整库复查确认（快照可能漏掉原地 UPDATE）
+            self.invalidate()
+            return self.check()
+        self.data_version = dv
+        self.last = (ok, report, dict(self.content))
+        return self.last
+
+    def close(self):
+        if self.ro is not None:
+            self.ro.close()
+            self.ro = None
+
+def quality_check_db(db_path: str, rules: List[Any]|None=None, immutable: bool=False, mmap_size: int=0,
+                     approx: bool=False):
+    # 通用质量检查引擎：加载规则插件并执行（一次性，全表检查）
+    try:
+        session = QCSession(db_path, rules, track_changes=False, immutable=immutable, mmap_size=mmap_size,
+                            approx=approx)
     except Exception as e:
-        report.append({"rule_id":"engine_error","passed":False,"severity":"error","message":str(e),"details":{}})
-        ok = False
+        return False, [{"rule_id":"engine_error","passed":False,"severity":"error","message":str(e),"details":{}}], {}
+    try:
+        return session.check()
+    finally:
+        session.close()
+
+# 进程池 worker：规则计划每个进程只构建一次
+_WORKER: Dict[str, Any] = {}
+
+def _init_qc_worker(rules: List[Tuple[str, dict]] | None, immutable: bool, mmap_size: int):
+    _WORKER.update(rules=build_rules(rules), immutable=immutable, mmap_size=mmap_size)
+
+def _qc_one(db_path: str):
+    ok, report, _ = quality_check_db(db_path, _WORKER["rules"], _WORKER["immutable"], _WORKER["mmap_size"])
+    return db_path, {"ok": ok, "report": report}
 
-    ok = ok and all(item.get("passed", False) for item in report if item.get("severity")=="error")
-    return ok, report, database_content
+class _JSONObjectStream:
+    """逐项追加写出的 JSON 对象，每项一行，close() 后为合法 JSON"""
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.f = open(path, "w", encoding="utf-8")
+        self.f.write("{")
+        self.n = 0
+
+    def put(self, key: str, value: Any):
+        self.f.write(("," if self.n else "") + "\n  " + json.dumps(key, ensure_ascii=False) + ": "
+                     + json.dumps(value, ensure_ascii=False))
+        self.f.flush()
+        self.n += 1
+
+    def close(self):
+        self.f.write("\n}\n")
+        self.f.close()
 
 @register
 class QualityCheck(Operator):
@@ -50,15 +256,30 @@ class QualityCheck(Operator):
     input_kinds = ["SQLiteDB", "AgentReadyMeta"]
     output_kinds = ["QCReport"]
 
-    def run(self, inputs: Dict[str, Artifact], rules: List[dict]|None=None, workdir: str="", **_):
-        # 针对 BuildSQLite 后“被 LLM 扩充过的 dbs” 检查
+    def run(self, inputs: Dict[str, Artifact], rules: List[dict]|None=None, workers: int|None=None,
+            immutable: bool=True, mmap_mb: int=256, workdir: str="", **_):
+        # 针对 BuildSQLite 后“被 LLM 扩充过的 dbs” 检查；各库独立且只读，多进程并行
         paths = inputs["SQLiteDB"].data["db_paths"]
+        tuples = [(r["module"], r.get("params", {})) for r in rules] if rules else None
+        init_args = (tuples, immutable, mmap_mb << 20)
+        workers = max(1, min(workers or os.cpu_count() or 1, len(paths) or 1))
+        out_path = f"{workdir}/qc_report.json"
+        stream = _JSONObjectStream(out_path)
         results = {}
-        for p in paths:
-            tuples = []
-            if rules:
-                tuples = [(r["module"], r.get("params", {})) for r in rules]
-            ok, report, content = quality_check_db(p, rules=tuples if rules else None)
-            results[p] = {"ok": ok, "report": report}
-
-        return {"QCReport": Artifact(kind="QCReport", data=results).save_json(f"{workdir}/qc_report.json")}
+        try:
+            if workers == 1:
+                _init_qc_worker(*init_args)
+                done = (_qc_one(p) for p in paths)
+                for p, res in tqdm(done, total=len(paths), desc="QC"):
+                    results[p] = res; stream.put(p, res)
+            else:
+                with ProcessPoolExecutor(max_workers=workers, initializer=_init_qc_worker, initargs=init_args) as pool:
+                    futs = [pool.submit(_qc_one, p) for p in paths]
+                    for fut in tqdm(as_completed(futs), total=len(futs), desc="QC"):
+                        p, res = fut.result()
+                        results[p] = res; stream.put(p, res)
+        finally:
+            stream.close()
+
+        data = {p: results[p] for p in paths if p in results}
+        return {"QCReport": Artifact(kind="QCReport", uri=out_path, data=data)}
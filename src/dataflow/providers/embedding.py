@@ -1,6 +1,6 @@
 from __future__ import annotations
 from typing import List, Dict, Any
-import numpy as np, requests, time
+import numpy as np, requests, time, hashlib
 
 class EmbeddingProvider:
     def embed(self, texts: List[str], **kwargs) -> np.ndarray:
@@ -8,8 +8,12 @@ class EmbeddingProvider:
 
 class DummyEmbedding(EmbeddingProvider):
     def embed(self, texts: List[str], **_):
-        rng = np.random.default_rng(42)
-        return rng.normal(size=(len(texts), 128))
+        # 向量只由文本决定，分批/流式调用与整批调用结果一致
+        out = np.empty((len(texts), 128))
+        for i, t in enumerate(texts):
+            seed = int.from_bytes(hashlib.md5(t.encode("utf-8")).digest()[:8], "little")
+            out[i] = np.random.default_rng(seed).normal(size=128)
+        return out
 
 class QianfanEmbedding(EmbeddingProvider):
     def __init__(self, api_url: str, token: str, model: str):
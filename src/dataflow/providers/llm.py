@@ -1,23 +1,316 @@
 from __future__ import annotations
-from typing import Dict, Any
-import requests, time
+from typing import Dict, Any, Optional, Iterator
+from pathlib import Path
+from email.utils import parsedate_to_datetime
+import requests, time, hashlib, json, os, threading, random
+from requests.adapters import HTTPAdapter
+
+class LLMError(RuntimeError):
+    """LLM 调用失败（重试耗尽或不可重试）"""
+
+class LLMTimeoutError(LLMError):
+    pass
+
+class LLMHTTPError(LLMError):
+    def __init__(self, status: int, body: str = ""):
+        super().__init__(f"HTTP {status}: {body[:200]}")
+        self.status = status
+        self.body = body
+
+class LLMRateLimitError(LLMHTTPError):
+    pass
+
+class LLMResponseError(LLMError):
+    """响应格式不对或内容为空"""
 
 class LLMClient:
+    endpoint: str = ""
+
     def complete(self, prompt: str) -> str:
         raise NotImplementedError
 
+    def stream(self, prompt: str) -> Iterator[str]:
+        # 默认：不支持流式的实现整体返回一次
+        yield self.complete(prompt)
+
+class TokenBucket:
+    """令牌桶限速：rate 个/秒，容量 burst；acquire() 阻塞直到拿到令牌"""
+
+    def __init__(self, rate: float, burst: Optional[int] = None):
+        self.rate = float(rate)
+        self.capacity = float(burst or max(1, int(rate)))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+_RETRY_STATUS = {429, 500, 502, 503, 504}
+
+def _retry_after(r: requests.Response) -> Optional[float]:
+    v = r.headers.get("Retry-After")
+    if not v:
+        return None
+    try:
+        return max(0.0, float(v))
+    except ValueError:
+        try:
+            return max(0.0, parsedate_to_datetime(v).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+
 class HTTPClient(LLMClient):
-    def __init__(self, url: str, token: str):
+    """线程安全的连接池客户端：keep-alive 复用、并发上限、令牌桶限速、
+    指数退避（full jitter，遵循 Retry-After）、流式读取；失败抛 LLMError 子类"""
+
+    def __init__(self, url: str, token: str, timeout: float = 60, max_retries: int = 5, concurrency: int = 16,
+                 rate_per_sec: Optional[float] = None, burst: Optional[int] = None,
+                 backoff_base: float = 1.0, backoff_max: float = 60.0):
         self.url = url; self.token = token
+        self.endpoint = url
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(1, concurrency), max_retries=0)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers.update({"Authorization": f"Bearer {self.token}", "Content-Type": "application/json"})
+        self.slots = threading.BoundedSemaphore(max(1, concurrency))
+        self.bucket = TokenBucket(rate_per_sec, burst) if rate_per_sec else None
+
+    def _backoff(self, attempt: int, retry_after: Optional[float] = None):
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        time.sleep(delay)
+
+    def _post(self, payload: Dict[str, Any], stream: bool = False) -> requests.Response:
+        """带重试地发出请求；调用方需持有 self.slots"""
+        for attempt in range(self.max_retries + 1):
+            last = attempt == self.max_retries
+            if self.bucket:
+                self.bucket.acquire()
+            try:
+                r = self.session.post(self.url, json=payload, timeout=self.timeout, stream=stream)
+            except requests.Timeout as e:
+                if last:
+                    raise LLMTimeoutError(str(e)) from e
+                self._backoff(attempt); continue
+            except requests.ConnectionError as e:
+                if last:
+                    raise LLMError(f"connection failed: {e}") from e
+                self._backoff(attempt); continue
+            if r.status_code < 400:
+                return r
+            body = r.text if not stream else ""
+            r.close()
+            if r.status_code not in _RETRY_STATUS or last:
+                cls = LLMRateLimitError if r.status_code == 429 else LLMHTTPError
+                raise cls(r.status_code, body)
+            self._backoff(attempt, _retry_after(r))
+        raise LLMError("unreachable")
 
     def complete(self, prompt: str) -> str:
-        headers = {"Authorization": f"Bearer {self.token}", "Content-Type": "application/json"}
         payload = {"query": prompt, "inputs": {"__system__": ""}}
-        for _ in range(3):
+        with self.slots:
+            r = self._post(payload)
+            try:
+                answer = r.json().get("answer", "")
+            except ValueError as e:
+                raise LLMResponseError(f"invalid JSON response: {e}") from e
+        if not answer:
+            raise LLMResponseError("empty answer")
+        return answer
+
+    def stream(self, prompt: str) -> Iterator[str]:
+        """SSE 流式（data: {"event": "message", "answer": ...}）；调用方可提前 close() 中止下载"""
+        payload = {"query": prompt, "inputs": {"__system__": ""}, "response_mode": "streaming"}
+        with self.slots:
+            with self._post(payload, stream=True) as r:
+                if "text/event-stream" not in r.headers.get("Content-Type", ""):
+                    # 服务端未按流式返回
+                    answer = r.json().get("answer", "")
+                    if not answer:
+                        raise LLMResponseError("empty answer")
+                    yield answer
+                    return
+                try:
+                    for line in r.iter_lines(decode_unicode=True):
+                        if not line or not line.startswith("data:"):
+                            continue
+                        ev = json.loads(line[5:].strip())
+                        kind = ev.get("event")
+                        if kind in ("message", "agent_message") and ev.get("answer"):
+                            yield ev["answer"]
+                        elif kind == "message_end":
+                            return
+                        elif kind == "error":
+                            raise LLMResponseError(ev.get("message", "stream error"))
+                except requests.RequestException as e:
+                    raise LLMError(f"stream interrupted: {e}") from e
+
+class LLMCacheMiss(LookupError):
+    """replay 模式下缓存未命中"""
+
+class CachedLLMClient(LLMClient):
+    """按 endpoint + prompt 内容寻址的磁盘响应缓存。
+
+    mode:
+      readwrite  命中即返回，未命中请求后写入（默认）
+      record     总是请求并覆盖写入，录制一次完整运行
+      replay     只读缓存，未命中抛 LLMCacheMiss，用于离线确定性重放
+      off        直通
+    超过 max_bytes 时按最近访问时间淘汰（record 模式不淘汰，保证可完整重放）。
+    """
+
+    MODES = ("readwrite", "record", "replay", "off")
+
+    def __init__(self, inner: LLMClient, cache_dir: str | Path, mode: str = "readwrite", max_bytes: int = 1 << 30):
+        if mode not in self.MODES:
+            raise ValueError(f"unknown cache mode {mode!r}, expected one of {self.MODES}")
+        self.inner = inner
+        self.endpoint = inner.endpoint
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.mode = mode
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self._index: Optional[Dict[Path, list]] = None   # path -> [size, atime]
+        self.hits = self.misses = 0
+
+    def key(self, prompt: str) -> str:
+        return hashlib.sha256(f"{self.endpoint}\n{prompt}".encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self.cache_dir / key[:2] / f"{key}.json"
+
+    def _load_index(self):
+        if self._index is None:
+            self._index = {}
+            for p in self.cache_dir.glob("*/*.json"):
+                st = p.stat()
+                self._index[p] = [st.st_size, st.st_mtime]
+        return self._index
+
+    def get(self, prompt: str, allow_partial: bool = False) -> Optional[str]:
+        p = self._path(self.key(prompt))
+        try:
+            with open(p, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        if entry.get("partial") and not allow_partial:
+            return None
+        now = time.time()
+        os.utime(p, (now, now))
+        with self.lock:
+            idx = self._load_index()
+            if p in idx:
+                idx[p][1] = now
+        return entry["response"]
+
+    def put(self, prompt: str, response: str, partial: bool = False):
+        key = self.key(prompt)
+        p = self._path(key)
+        p.parent.mkdir(parents=True, exist_ok=True)
+        tmp = p.with_name(f"{p.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"endpoint": self.endpoint, "prompt_sha256": key, "prompt_chars": len(prompt),
+                       "created": time.time(), "partial": partial, "response": response}, f, ensure_ascii=False)
+        os.replace(tmp, p)
+        with self.lock:
+            idx = self._load_index()
+            idx[p] = [p.stat().st_size, time.time()]
+            if self.mode != "record":
+                self._evict(idx)
+
+    def _evict(self, idx: Dict[Path, list]):
+        total = sum(v[0] for v in idx.values())
+        if total <= self.max_bytes:
+            return
+        for p, (size, _) in sorted(idx.items(), key=lambda kv: kv[1][1]):
+            if total <= self.max_bytes:
+                break
             try:
-                r = requests.post(self.url, headers=headers, json=payload, timeout=60)
-                r.raise_for_status()
-                return r.json().get("answer", "")
-            except Exception:
-                time.sleep(2)
-        return ""
+                p.unlink()
+            except FileNotFoundError:
+                pass
+            total -= size
+            idx.pop(p, None)
+
+    def complete(self, prompt: str) -> str:
+        if self.mode == "off":
+            return self.inner.complete(prompt)
+        if self.mode != "record":
+            cached = self.get(prompt, allow_partial=self.mode == "replay")
+            if cached is not None:
+                self.hits += 1
+                return cached
+            if self.mode == "replay":
+                raise LLMCacheMiss(f"no recorded response for prompt {self.key(prompt)[:16]} at {self.endpoint}")
+        self.misses += 1
+        rsp = self.inner.complete(prompt)
+        if rsp:  # 失败（空响应）不入缓存
+            self.put(prompt, rsp)
+        return rsp
+
+    def stream(self, prompt: str) -> Iterator[str]:
+        if self.mode == "off":
+            yield from self.inner.stream(prompt)
+            return
+        if self.mode != "record":
+            cached = self.get(prompt, allow_partial=True)
+            if cached is not None:
+                self.hits += 1
+                yield cached
+                return
+            if self.mode == "replay":
+                raise LLMCacheMiss(f"no recorded response for prompt {self.key(prompt)[:16]} at {self.endpoint}")
+        self.misses += 1
+        parts = []
+        chunks = self.inner.stream(prompt)
+        try:
+            for chunk in chunks:
+                parts.append(chunk)
+                yield chunk
+        except GeneratorExit:
+            # 消费方拿到所需内容后主动关闭：记录已收到的前缀（partial），complete() 不复用它。
+            # 上游出错（超时、5xx、连接中断）时异常照常抛出，不写缓存，下次重新请求
+            if parts:
+                self.put(prompt, "".join(parts), partial=True)
+            raise
+        finally:
+            close = getattr(chunks, "close", None)
+            if close:
+                close()
+        if parts:
+            self.put(prompt, "".join(parts))
+
+# 同配置的 HTTP 客户端进程内复用：常驻进程（watch）跨多次运行保持 keep-alive 连接与限速状态
+_HTTP_CLIENTS: Dict[tuple, HTTPClient] = {}
+
+def get_llm_client(provider: str, workdir: str = "", **cfg) -> LLMClient:
+    if provider != "llm_http":
+        raise ValueError(f"unknown LLM provider {provider!r}")
+    key = (cfg.get("url", "http://localhost:8000"), cfg.get("token", ""), cfg.get("timeout", 60),
+           cfg.get("max_retries", 5), cfg.get("concurrency", 16), cfg.get("rate_per_sec"), cfg.get("burst"))
+    client: LLMClient = _HTTP_CLIENTS.get(key) or _HTTP_CLIENTS.setdefault(key, HTTPClient(
+        url=key[0], token=key[1], timeout=key[2], max_retries=key[3],
+        concurrency=key[4], rate_per_sec=key[5], burst=key[6]))
+    mode = cfg.get("cache_mode", "readwrite")
+    if mode == "off":
+        return client
+    cache_dir = cfg.get("cache_dir") or Path(workdir or ".") / "llm_cache"
+    return CachedLLMClient(client, cache_dir, mode=mode, max_bytes=int(cfg.get("cache_max_mb", 1024)) << 20)
@@ -0,0 +1,212 @@
+"""Declarative QC rule API and the fused single-scan executor."""
+
+from __future__ import annotations
+from typing import Dict, Any, List, Tuple
+from pathlib import Path
+import sqlite3, re, datetime, json, random, math
+from functools import lru_cache
+from statistics import NormalDist
+
+# 单条 SELECT 的聚合表达式上限（SQLite 默认结果列上限 2000）
+MAX_EXPRS_PER_SCAN = 1000
+
+# 可在任意规则的 params 中覆盖的通用选项（见 AggregateRule）
+RULE_OPTIONS = ("sample_size", "confidence", "max_invalid_rate")
+
+def qname(name: str) -> str:
+    return '"' + str(name).replace('"', '""') + '"'
+
+def qlit(value: str) -> str:
+    return "'" + str(value).replace("'", "''") + "'"
+
+# ---- 规则可用的 SQL 函数（确定性，可参与查询优化；NULL 入参返回 NULL） ----
+
+@lru_cache(maxsize=256)
+def _pattern(p: str):
+    return re.compile(p)
+
+def _regexp(pattern, value):
+    # X REGEXP Y 调用 regexp(Y, X)
+    if pattern is None or value is None:
+        return None
+    return _pattern(pattern).search(value if isinstance(value, str) else str(value)) is not None
+
+def _is_date(value, fmt):
+    if value is None or fmt is None:
+        return None
+    try:
+        datetime.datetime.strptime(value if isinstance(value, str) else str(value), fmt)
+        return True
+    except ValueError:
+        return False
+
+def _ends_with_punct(value, chars):
+    if value is None or chars is None:
+        return None
+    v = (value if isinstance(value, str) else str(value)).strip()
+    return bool(v) and v[-1] in chars
+
+def register_udfs(conn: sqlite3.Connection):
+    conn.create_function("regexp", 2, _regexp, deterministic=True)
+    conn.create_function("is_date", 2, _is_date, deterministic=True)
+    conn.create_function("ends_with_punct", 2, _ends_with_punct, deterministic=True)
+
+def connect_ro(db_path: str, immutable: bool = False, mmap_size: int = 0, shared_cache: bool = False,
+               cached_statements: int = 128) -> sqlite3.Connection:
+    """只读连接；immutable=True 时跳过文件锁与变更检测（仅限检查期间无人写入的库）"""
+    uri = Path(db_path).resolve().as_uri() + "?mode=ro" + ("&immutable=1" if immutable else "") \
+        + ("&cache=shared" if shared_cache else "")
+    conn = sqlite3.connect(uri, uri=True, isolation_level=None, check_same_thread=False,
+                           cached_statements=cached_statements)
+    if mmap_size:
+        conn.execute(f"PRAGMA mmap_size={int(mmap_size)}")
+    register_udfs(conn)
+    return conn
+
+def wilson_interval(x: int, n: int, confidence: float) -> Tuple[float, float]:
+    """比例 x/n 的 Wilson 置信区间"""
+    z = NormalDist().inv_cdf(0.5 + confidence / 2)
+    p = x / n
+    d = 1 + z * z / n
+    centre = (p + z * z / (2 * n)) / d
+    half = z * math.sqrt(p * (1 - p) / n + z * z / (4 * n * n)) / d
+    return max(0.0, centre - half), min(1.0, centre + half)
+
+def indexed(conn: sqlite3.Connection, table: str, column: str | None) -> bool:
+    """column 能否按索引查找：rowid / INTEGER PRIMARY KEY，或是某个索引的首列"""
+    lit = qlit(table)
+    if column is None or column.lower() in ("rowid", "_rowid_", "oid"):
+        return True
+    try:
+        cols = conn.execute(f"PRAGMA table_info({lit})").fetchall()
+        if any(c[1] == column and c[5] == 1 and str(c[2]).upper() == "INTEGER" for c in cols) \
+                and sum(c[5] > 0 for c in cols) == 1:
+            return True
+        for idx in conn.execute(f"PRAGMA index_list({lit})").fetchall():
+            first = conn.execute(f"PRAGMA index_info({qlit(idx[1])})").fetchall()
+            if first and first[0][2] == column:
+                return True
+    except sqlite3.DatabaseError:
+        pass
+    return False
+
+def table_info(conn: sqlite3.Connection, table: str) -> Dict[str, Any]:
+    """规则 evaluate 所需的表元数据：PRAGMA table_info / foreign_key_list 的原始行；
+    fk_indexed 与 fks 对齐，标记被引用列是否有索引"""
+    lit = qlit(table)
+    fks = conn.execute(f"PRAGMA foreign_key_list({lit})").fetchall()
+    return {"columns": conn.execute(f"PRAGMA table_info({lit})").fetchall(), "fks": fks,
+            "fk_indexed": [indexed(conn, fk[2], fk[4]) for fk in fks]}
+
+class AggregateRule:
+    """声明式规则：aggregates() 返回本规则在某表上需要的 {key: SQL 聚合表达式}，
+    引擎把所有规则的表达式（相同表达式只算一次）拼成每表一条 SELECT，结果按 key 交回 evaluate()。
+    只看元数据的规则 aggregates() 返回空即可。
+
+    近似模式：sampling=True 的规则在大表上先用 sample_size 行随机样本计算同样的聚合，交给 estimate()；
+    estimate() 只在置信区间（confidence）足以下结论时返回结果，否则返回 None，引擎对该表改做精确检查。"""
+
+    id = ""
+    scope = "table"
+    sampling = False
+    sample_size = 10000
+    confidence = 0.95
+
+    def aggregates(self, table: str, info: Dict[str, Any]) -> Dict[str, str]:
+        return {}
+
+    def evaluate(self, table: str, info: Dict[str, Any], agg: Dict[str, Any], ctx: Dict[str, Any]) -> List[dict]:
+        raise NotImplementedError
+
+    def estimate(self, table: str, info: Dict[str, Any], agg: Dict[str, Any], ctx: Dict[str, Any]) -> List[dict] | None:
+        return None
+
+    def verdict(self, x: int, n: int, max_rate: float) -> Tuple[bool | None, Tuple[float, float]]:
+        """样本中 x/n 违规：区间整体 <= max_rate 判通过，整体 > max_rate 判失败，否则 None"""
+        if not n:
+            return None, (0.0, 1.0)
+        lo, hi = wilson_interval(x, n, self.confidence)
+        if hi <= max_rate:
+            return True, (lo, hi)
+        if lo > max_rate:
+            return False, (lo, hi)
+        return None, (lo, hi)
+
+    def run(self, db_path: str, ctx: Dict[str, Any]):
+        # 兼容旧接口：单独调用时也走融合路径
+        conn = ctx.get("conn")
+        own = conn is None
+        if own:
+            conn = connect_ro(db_path)
+        try:
+            return run_fused([(self, list(ctx["tables"]))], conn, ctx.get("table_info"), ctx)[0]
+        finally:
+            if own:
+                conn.close()
+
+def _rowid_span(conn: sqlite3.Connection, table: str) -> Tuple[int, int] | None:
+    # MIN/MAX(rowid) 走 B 树两端，O(log n)；WITHOUT ROWID 表返回 None
+    try:
+        lo, hi = conn.execute(f"SELECT MIN(rowid), MAX(rowid) FROM {qname(table)}").fetchall()[0]
+    except sqlite3.OperationalError:
+        return None
+    return None if lo is None else (lo, hi)
+
+def _scan(conn: sqlite3.Connection, table: str, info: Dict[str, Any], users: List[Tuple[int, AggregateRule]],
+          where: str = "", params: tuple = ()) -> List[Tuple[int, AggregateRule, Dict[str, Any]]]:
+    """把 users 的聚合表达式拼成一次扫描（超长时分段）"""
+    exprs: Dict[str, str] = {}   # SQL 表达式 -> 列别名
+    keyed = []
+    for i, rule in users:
+        keys = {k: exprs.setdefault(sql, f"a{len(exprs)}") for k, sql in rule.aggregates(table, info).items()}
+        keyed.append((i, rule, keys))
+    values: Dict[str, Any] = {}
+    items = list(exprs.items())
+    for s in range(0, len(items), MAX_EXPRS_PER_SCAN):
+        chunk = items[s:s + MAX_EXPRS_PER_SCAN]
+        row = conn.execute(f"SELECT {', '.join(f'{sql} AS {a}' for sql, a in chunk)} FROM {qname(table)}{where}",
+                           params).fetchall()[0]
+        values.update(zip((a for _, a in chunk), row))
+    return [(i, rule, {k: values[a] for k, a in keys.items()}) for i, rule, keys in keyed]
+
+def run_fused(plan: List[Tuple[AggregateRule, List[str]]], conn: sqlite3.Connection,
+              info: Dict[str, Dict[str, Any]] | None = None, ctx: Dict[str, Any] | None = None,
+              approx: bool = False) -> List[List[dict]]:
+    """plan: [(规则, 该规则要检查的表)]；每张表只扫描一次（approx 时另有一次样本扫描）。
+    返回与 plan 对齐的结果列表（规则内按表顺序）"""
+    info = {} if info is None else info
+    ctx = {**(ctx or {}), "conn": conn, "table_info": info}
+    wanted = [set(ts) for _, ts in plan]
+    tables = list(dict.fromkeys(t for _, ts in plan for t in ts))
+    found: List[Dict[str, List[dict]]] = [{} for _ in plan]
+    for t in tables:
+        ti = info.get(t)
+        if ti is None:
+            ti = info[t] = table_info(conn, t)
+        users = [(i, rule) for i, (rule, _) in enumerate(plan) if t in wanted[i]]
+        exact = users
+        if approx and any(rule.sampling for _, rule in users):
+            exact = [(i, rule) for i, rule in users if not rule.sampling]
+            span = _rowid_span(conn, t)
+            groups: Dict[int, List[Tuple[int, AggregateRule]]] = {}
+            for i, rule in users:
+                if rule.sampling:
+                    groups.setdefault(int(rule.sample_size), []).append((i, rule))
+            for size, group in groups.items():
+                # 表不比样本大多少时直接精确扫描
+                if span is None or span[1] - span[0] + 1 <= 2 * size:
+                    exact += group
+                    continue
+                rng = random.Random(f"{t}:{span[0]}:{span[1]}:{size}")
+                ids = json.dumps(rng.sample(range(span[0], span[1] + 1), size))
+                where = " WHERE rowid IN (SELECT value FROM json_each(?))"
+                for i, rule, agg in _scan(conn, t, ti, group, where, (ids,)):
+                    items = rule.estimate(t, ti, agg, ctx)
+                    if items is None:
+                        exact.append((i, rule))   # 不确定：升级为精确检查
+                    else:
+                        found[i][t] = items
+        if exact:
+            for i, rule, agg in _scan(conn, t, ti, sorted(exact, key=lambda u: u[0])):
+                found[i][t] = rule.evaluate(t, ti, agg, ctx)
+    return [[it for t in ts for it in found[i].get(t, [])] for i, (_, ts) in enumerate(plan)]
@@ -1,250 +1,286 @@
 from __future__ import annotations
 from typing import List, Dict, Any
-import sqlite3
 import re
+from .base import AggregateRule, connect_ro, table_info, qname
 
-class RowCountRule:
+class RowCountRule(AggregateRule):
     id = "row_count"
+    scope = "table"
     def __init__(self, min_records_per_table: int = 20):
         self.min_records = min_records_per_table
-    def run(self, db_path: str, ctx: Dict[str, Any]):
-        out = []
-        with sqlite3.connect(db_path) as conn:
-            cur = conn.cursor()
-            for t in ctx["tables"]:
-                cur.execute(f"SELECT COUNT(*) FROM '{t}'")
-                cnt = cur.fetchone()[0]
-                passed = cnt >= self.min_records
-                out.append({"rule_id": self.id, "table": t, "passed": passed,
-                            "severity": "error" if not passed else "info",
-                            "message": f"{t} has {cnt} rows (min={self.min_records})", "details": {"count": cnt}})
-        return out
+    def aggregates(self, t, info):
+        return {"count": "COUNT(*)"}
+    def evaluate(self, t, info, agg, ctx):
+        cnt = agg["count"]
+        passed = cnt >= self.min_records
+        return [{"rule_id": self.id, "table": t, "passed": passed,
+                 "severity": "error" if not passed else "info",
+                 "message": f"{t} has {cnt} rows (min={self.min_records})", "details": {"count": cnt}}]
 
-class NullRateRule:
+class NullRateRule(AggregateRule):
     id = "null_rate"
+    scope = "table"
+    sampling = True
     def __init__(self, max_null_rate: float = 0.3):
         self.max_null_rate = max_null_rate
-    def run(self, db_path: str, ctx: Dict[str, Any]):
+    def aggregates(self, t, info):
+        aggs = {"total": "COUNT(*)"}
+        for _, name, *_ in info["columns"]:
+            aggs[f"nulls:{name}"] = f"SUM({qname(name)} IS NULL OR {qname(name)} = '')"
+        return aggs
+    def evaluate(self, t, info, agg, ctx):
         out = []
-        with sqlite3.connect(db_path) as conn:
-            cur = conn.cursor()
-            for t in ctx["tables"]:
-                cur.execute(f"PRAGMA table_info('{t}')"); cols = cur.fetchall()
-                for _, name, *_ in cols:
-                    cur.execute(f"SELECT COUNT(*) FROM '{t}'")
-                    total = cur.fetchone()[0]
-                    cur.execute(f"SELECT COUNT(*) FROM '{t}' WHERE \"{name}\" IS NULL OR \"{name}\" = ''")
-                    nulls = cur.fetchone()[0]
-                    rate = (nulls / total) if total else 0.0
-                    passed = rate <= self.max_null_rate
-                    out.append({"rule_id": self.id, "table": t, "column": name, "passed": passed,
-                                "severity": "warn" if not passed else "info",
-                                "message": f"{t}.{name} null/empty rate={rate:.3f} (max={self.max_null_rate})",
-                                "details": {"total": total, "nulls": nulls, "rate": rate}})
+        total = agg["total"]
+        for _, name, *_ in info["columns"]:
+            nulls = agg[f"nulls:{name}"] or 0
+            rate = (nulls / total) if total else 0.0
+            passed = rate <= self.max_null_rate
+            out.append({"rule_id": self.id, "table": t, "column": name, "passed": passed,
+                        "severity": "warn" if not passed else "info",
+                        "message": f"{t}.{name} null/empty rate={rate:.3f} (max={self.max_null_rate})",
+                        "details": {"total": total, "nulls": nulls, "rate": rate}})
+        return out
+    def estimate(self, t, info, agg, ctx):
+        out = []
+        n = agg["total"]
+        for _, name, *_ in info["columns"]:
+            nulls = agg[f"nulls:{name}"] or 0
+            passed, (lo, hi) = self.verdict(nulls, n, self.max_null_rate)
+            if passed is None:
+                return None
+            out.append({"rule_id": self.id, "table": t, "column": name, "passed": passed,
+                        "severity": "warn" if not passed else "info",
+                        "message": f"{t}.{name} null/empty rate~{nulls / n:.3f} [{lo:.3f}, {hi:.3f}] "
+                                   f"(max={self.max_null_rate}, {n} sampled rows)",
+                        "details": {"sampled": n, "nulls": nulls, "rate": nulls / n, "interval": [lo, hi],
+                                    "confidence": self.confidence, "approximate": True}})
         return out
 
-class ForeignKeyRule:
+class ForeignKeyRule(AggregateRule):
+    """被引用列有索引时，违规计数内联进融合扫描（每行一次索引查找）；
+    没有索引时相关子查询会对每行扫描一遍父表，改为单独的 LEFT JOIN 反连接（SQLite 自动建临时索引）"""
     id = "fk_integrity"
-    def run(self, db_path: str, ctx: Dict[str, Any]):
+    scope = "fk"
+    sampling = True
+    max_invalid_rate = 0.0
+    def aggregates(self, t, info):
+        aggs = {"total": "COUNT(*)"}
+        for k, fk in enumerate(info["fks"]):
+            if not self._inline(info, k):
+                continue
+            # fk: (id, seq, table, from, to, on_update, on_delete, match)
+            _, _, ref_table, fk_col, ref_col, *_ = fk
+            col = f"{qname(t)}.{qname(fk_col)}"
+            aggs[f"broken:{k}"] = (f"SUM({col} IS NOT NULL AND NOT EXISTS "
+                                   f"(SELECT 1 FROM {qname(ref_table)} r WHERE r.{qname(ref_col or 'rowid')} = {col}))")
+        return aggs
+    @staticmethod
+    def _inline(info, k):
+        return (info.get("fk_indexed") or [False] * len(info["fks"]))[k]
+    @staticmethod
+    def _anti_join(conn, t, fk):
+        _, _, ref_table, fk_col, ref_col, *_ = fk
+        col = f"c.{qname(fk_col)}"
+        ref = f"r.{qname(ref_col or 'rowid')}"
+        return conn.execute(f"SELECT COUNT(*) FROM {qname(t)} c LEFT JOIN {qname(ref_table)} r ON {ref} = {col} "
+                            f"WHERE {col} IS NOT NULL AND {ref} IS NULL").fetchone()[0]
+    def _exact(self, t, fk, bad, total):
+        _, _, ref_table, fk_col, ref_col, *_ = fk
+        passed = bad <= self.max_invalid_rate * total
+        return {"rule_id": self.id, "table": t, "passed": passed,
+                "severity": "error" if not passed else "info",
+                "message": f"{t}.{fk_col} -> {ref_table}.{ref_col} broken={bad}",
+                "details": {"violations": bad}}
+    def evaluate(self, t, info, agg, ctx):
         out = []
-        with sqlite3.connect(db_path) as conn:
-            cur = conn.cursor()
-            for t in ctx["tables"]:
-                cur.execute(f"PRAGMA foreign_key_list('{t}')")
-                fks = cur.fetchall()
-                for fk in fks:
-                    # fk: (id, seq, table, from, to, on_update, on_delete, match)
-                    _, _, ref_table, fk_col, ref_col, *_ = fk
-                    q = f"""
-                        SELECT COUNT(*) FROM '{t}' a
-                        LEFT JOIN '{ref_table}' b ON a."{fk_col}" = b."{ref_col}"
-                        WHERE a."{fk_col}" IS NOT NULL AND b."{ref_col}" IS NULL
-                    """
-                    cur.execute(q); bad = cur.fetchone()[0]
-                    passed = bad == 0
-                    out.append({"rule_id": self.id, "table": t, "passed": passed,
-                                "severity": "error" if not passed else "info",
-                                "message": f"{t}.{fk_col} -> {ref_table}.{ref_col} broken={bad}",
-                                "details": {"violations": bad}})
+        for k, fk in enumerate(info["fks"]):
+            bad = agg[f"broken:{k}"] if self._inline(info, k) else self._anti_join(ctx["conn"], t, fk)
+            out.append(self._exact(t, fk, bad or 0, agg["total"]))
         return out
+    def estimate(self, t, info, agg, ctx):
+        n = agg["total"]
+        items = {}
+        for k, fk in enumerate(info["fks"]):
+            if not self._inline(info, k):
+                continue
+            _, _, ref_table, fk_col, ref_col, *_ = fk
+            bad = agg[f"broken:{k}"] or 0
+            passed, (lo, hi) = self.verdict(bad, n, self.max_invalid_rate)
+            if passed is None:
+                return None
+            items[k] = {"rule_id": self.id, "table": t, "passed": passed,
+                        "severity": "error" if not passed else "info",
+                        "message": f"{t}.{fk_col} -> {ref_table}.{ref_col} broken={bad} in {n} sampled rows "
+                                   f"(rate [{lo:.4f}, {hi:.4f}])",
+                        "details": {"violations_sampled": bad, "sampled": n, "interval": [lo, hi],
+                                    "confidence": self.confidence, "approximate": True}}
+        if len(items) < len(info["fks"]):
+            # 无索引的外键：反连接本身就是一次全表扫描，直接给精确结果
+            total = ctx["conn"].execute(f"SELECT COUNT(*) FROM {qname(t)}").fetchone()[0]
+            for k, fk in enumerate(info["fks"]):
+                if k not in items:
+                    items[k] = self._exact(t, fk, self._anti_join(ctx["conn"], t, fk), total)
+        return [items[k] for k in range(len(info["fks"]))]
 
-class VarcharLengthRule:
+class VarcharLengthRule(AggregateRule):
     id = "varchar_length"
+    scope = "table"
     def __init__(self, min_length: int = 255):
         self.min_length = min_length
-    def run(self, db_path: str, ctx: Dict[str, Any]):
-        out = []
-        with sqlite3.connect(db_path) as conn:
-            cur = conn.cursor()
-            for t in ctx["tables"]:
-                cur.execute(f"PRAGMA table_info('{t}')")
-                cols = cur.fetchall()
-                for _, name, col_type, *_ in cols:
-                    col_type_str = str(col_type).upper()
-                    if col_type_str.startswith("VARCHAR"):
-                        length_match = re.search(r'VARCHAR\((\d+)\)', col_type_str)
-                        if length_match:
-                            length = int(length_match.group(1))
-                            passed = length >= self.min_length
-                            out.append({
-                                "rule_id": self.id,
-                                "table": t,
-                                "column": name,
-                                "passed": passed,
-                                "severity": "warn" if not passed else "info",
-                                "message": f"{t}.{name} VARCHAR length={length} (min={self.min_length})",
-                                "details": {"length": length}
-                            })
-        return out
-
-class PrimaryKeyAutoincrementRule:
-    id = "primary_key_autoincrement"
-    def __init__(self):
-        pass
-    def run(self, db_path: str, ctx: Dict[str, Any]):
+    def evaluate(self, t, info, agg, ctx):
         out = []
-        with sqlite3.connect(db_path) as conn:
-            cur = conn.cursor()
-            for t in ctx["tables"]:
-                cur.execute(f"PRAGMA table_info('{t}')")
-                cols = cur.fetchall()
-                pk_cols = [col for col in cols if col[5] == 1]  # pk flag is in the 6th position
-                if not pk_cols:
-                    out.append({
-                        "rule_id": self.id,
-                        "table": t,
-                        "passed": False,
-                        "severity": "error",
-                        "message": f"{t} has no primary key defined",
-                        "details": {}
-                    })
-                else:
-                    pk_col = pk_cols[0]
-                    col_type = str(pk_col[2]).upper()
-                    is_autoincrement = "INTEGER" in col_type  # SQLite autoincrement requires INTEGER
-                    passed = is_autoincrement and len(pk_cols) == 1
+        for _, name, col_type, *_ in info["columns"]:
+            col_type_str = str(col_type).upper()
+            if col_type_str.startswith("VARCHAR"):
+                length_match = re.search(r'VARCHAR\((\d+)\)', col_type_str)
+                if length_match:
+                    length = int(length_match.group(1))
+                    passed = length >= self.min_length
                     out.append({
                         "rule_id": self.id,
                         "table": t,
+                        "column": name,
                         "passed": passed,
-                        "severity": "error" if not passed else "info",
-                        "message": f"{t} primary key {pk_col[1]} type={col_type}, autoincrement={'supported' if is_autoincrement else 'not supported'}",
-                        "details": {"pk_count": len(pk_cols), "type": col_type}
+                        "severity": "warn" if not passed else "info",
+                        "message": f"{t}.{name} VARCHAR length={length} (min={self.min_length})",
+                        "details": {"length": length}
                     })
         return out
 
+class PrimaryKeyAutoincrementRule(AggregateRule):
+    id = "primary_key_autoincrement"
+    scope = "table"
+    def __init__(self):
+        pass
+    def evaluate(self, t, info, agg, ctx):
+        pk_cols = [col for col in info["columns"] if col[5] == 1]  # pk flag is in the 6th position
+        if not pk_cols:
+            return [{
+                "rule_id": self.id,
+                "table": t,
+                "passed": False,
+                "severity": "error",
+                "message": f"{t} has no primary key defined",
+                "details": {}
+            }]
+        pk_col = pk_cols[0]
+        col_type = str(pk_col[2]).upper()
+        is_autoincrement = "INTEGER" in col_type  # SQLite autoincrement requires INTEGER
+        passed = is_autoincrement and len(pk_cols) == 1
+        return [{
+            "rule_id": self.id,
+            "table": t,
+            "passed": passed,
+            "severity": "error" if not passed else "info",
+            "message": f"{t} primary key {pk_col[1]} type={col_type}, autoincrement={'supported' if is_autoincrement else 'not supported'}",
+            "details": {"pk_count": len(pk_cols), "type": col_type}
+        }]
+
 class DataIsolationRule:
     id = "data_isolation"
+    scope = "database"
     def __init__(self):
         pass
     def run(self, db_path: str, ctx: Dict[str, Any]):
         out = []
-        with sqlite3.connect(db_path) as conn:
-            cur = conn.cursor()
-            tables = ctx["tables"]
-            referenced_tables = set()
-            referencing_tables = set()
+        tables = ctx["tables"]
+        info = ctx.get("table_info") or {}
+        conn = ctx.get("conn") or connect_ro(db_path)
+        referenced_tables = set()
+        referencing_tables = set()
+        try:
             for t in tables:
-                cur.execute(f"PRAGMA foreign_key_list('{t}')")
-                fks = cur.fetchall()
+                fks = (info.get(t) or table_info(conn, t))["fks"]
                 if fks:
                     referencing_tables.add(t)
                     for fk in fks:
                         referenced_tables.add(fk[2])  # referred_table is in the 3rd position
-            isolated_tables = set(tables) - referenced_tables - referencing_tables
-            for t in isolated_tables:
-                out.append({
-                    "rule_id": self.id,
-                    "table": t,
-                    "passed": False,
-                    "severity": "warn",
-                    "message": f"{t} is an isolated table with no foreign key relationships",
-                    "details": {}
-                })
-            if not isolated_tables:
-                out.append({
-                    "rule_id": self.id,
-                    "table": "all",
-                    "passed": True,
-                    "severity": "info",
-                    "message": "No isolated tables found in the database",
-                    "details": {}
-                })
+        finally:
+            if conn is not ctx.get("conn"):
+                conn.close()
+        isolated_tables = set(tables) - referenced_tables - referencing_tables
+        for t in isolated_tables:
+            out.append({
+                "rule_id": self.id,
+                "table": t,
+                "passed": False,
+                "severity": "warn",
+                "message": f"{t} is an isolated table with no foreign key relationships",
+                "details": {}
+            })
+        if not isolated_tables:
+            out.append({
+                "rule_id": self.id,
+                "table": "all",
+                "passed": True,
+                "severity": "info",
+                "message": "No isolated tables found in the database",
+                "details": {}
+            })
         return out
 
-class CompositePrimaryKeyRule:
+class CompositePrimaryKeyRule(AggregateRule):
     id = "composite_primary_key"
+    scope = "table"
     def __init__(self):
         pass
-    def run(self, db_path: str, ctx: Dict[str, Any]):
-        out = []
-        with sqlite3.connect(db_path) as conn:
-            cur = conn.cursor()
-            for t in ctx["tables"]:
-                cur.execute(f"PRAGMA table_info('{t}')")
-                cols = cur.fetchall()
-                pk_cols = [col for col in cols if col[5] == 1]  # pk flag is in the 6th position
-                if len(pk_cols) > 1:
-                    out.append({
-                        "rule_id": self.id,
-                        "table": t,
-                        "passed": False,
-                        "severity": "error",
-                        "message": f"{t} has a composite primary key with {len(pk_cols)} fields",
-                        "details": {"pk_fields": [col[1] for col in pk_cols]}
-                    })
-                elif len(pk_cols) == 1:
-                    out.append({
-                        "rule_id": self.id,
-                        "table": t,
-                        "passed": True,
-                        "severity": "info",
-                        "message": f"{t} has a single primary key field",
-                        "details": {"pk_field": pk_cols[0][1]}
-                    })
-                else:
-                    out.append({
-                        "rule_id": self.id,
-                        "table": t,
-                        "passed": False,
-                        "severity": "error",
-                        "message": f"{t} has no primary key defined",
-                        "details": {}
-                    })
-        return out
+    def evaluate(self, t, info, agg, ctx):
+        pk_cols = [col for col in info["columns"] if col[5] == 1]  # pk flag is in the 6th position
+        if len(pk_cols) > 1:
+            return [{
+                "rule_id": self.id,
+                "table": t,
+                "passed": False,
+                "severity": "error",
+                "message": f"{t} has a composite primary key with {len(pk_cols)} fields",
+                "details": {"pk_fields": [col[1] for col in pk_cols]}
+            }]
+        elif len(pk_cols) == 1:
+            return [{
+                "rule_id": self.id,
+                "table": t,
+                "passed": True,
+                "severity": "info",
+                "message": f"{t} has a single primary key field",
+                "details": {"pk_field": pk_cols[0][1]}
+            }]
+        return [{
+            "rule_id": self.id,
+            "table": t,
+            "passed": False,
+            "severity": "error",
+            "message": f"{t} has no primary key defined",
+            "details": {}
+        }]
 
-class MultipleForeignKeyReferenceRule:
+class MultipleForeignKeyReferenceRule(AggregateRule):
     id = "multiple_foreign_key_reference"
+    scope = "table"
     def __init__(self):
         pass
-    def run(self, db_path: str, ctx: Dict[str, Any]):
+    def evaluate(self, t, info, agg, ctx):
         out = []
-        with sqlite3.connect(db_path) as conn:
-            cur = conn.cursor()
-            for t in ctx["tables"]:
-                cur.execute(f"PRAGMA foreign_key_list('{t}')")
-                fks = cur.fetchall()
-                ref_count = {}
-                for fk in fks:
-                    ref_table = fk[2]  # referred_table is in the 3rd position
-                    ref_count[ref_table] = ref_count.get(ref_table, 0) + 1
-                for ref_table, count in ref_count.items():
-                    if count > 1:
-                        out.append({
-                            "rule_id": self.id,
-                            "table": t,
-                            "passed": False,
-                            "severity": "error",
-                            "message": f"{t} references {ref_table} with {count} foreign keys",
-                            "details": {"reference_count": count}
-                        })
-                    else:
-                        out.append({
-                            "rule_id": self.id,
-                            "table": t,
-                            "passed": True,
-                            "severity": "info",
-                            "message": f"{t} references {ref_table} with a single foreign key",
-                            "details": {"reference_count": count}
-                        })
+        ref_count = {}
+        for fk in info["fks"]:
+            ref_table = fk[2]  # referred_table is in the 3rd position
+            ref_count[ref_table] = ref_count.get(ref_table, 0) + 1
+        for ref_table, count in ref_count.items():
+            if count > 1:
+                out.append({
+                    "rule_id": self.id,
+                    "table": t,
+                    "passed": False,
+                    "severity": "error",
+                    "message": f"{t} references {ref_table} with {count} foreign keys",
+                    "details": {"reference_count": count}
+                })
+            else:
+                out.append({
+                    "rule_id": self.id,
+                    "table": t,
+                    "passed": True,
+                    "severity": "info",
+                    "message": f"{t} references {ref_table} with a single foreign key",
+                    "details": {"reference_count": count}
+                })
         return out
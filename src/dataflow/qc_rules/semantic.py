@@ -1,258 +1,149 @@
 from __future__ import annotations
-from typing import Dict, Any
-import sqlite3, re, datetime
+from typing import Dict, Any, List
+import re
+from .base import AggregateRule, qname, qlit
+
+def _column_names(info: Dict[str, Any]) -> List[str]:
+    return [c[1] for c in info["columns"]]
+
+class _FormatRule(AggregateRule):
+    """整列格式检查：非空值中不合规的个数在一次扫描内由 SQL 聚合（配合引擎注册的 UDF）算出"""
+    scope = "table"
+    sampling = True
+    max_invalid_rate = 0.0
+    kind = ""
+    def check_columns(self, info) -> List[str]:
+        return [self.column] if self.column in _column_names(info) else []
+
+    def invalid_sql(self, c: str) -> str:
+        raise NotImplementedError
+
+    def aggregates(self, t, info):
+        aggs = {}
+        for col in self.check_columns(info):
+            c = qname(col)
+            aggs["total"] = "COUNT(*)"
+            aggs[f"nonnull:{col}"] = f"SUM({c} IS NOT NULL AND {c} <> '')"
+            aggs[f"invalid:{col}"] = f"SUM({c} IS NOT NULL AND {c} <> '' AND {self.invalid_sql(c)})"
+        return aggs
+
+    def evaluate(self, t, info, agg, ctx):
+        out = []
+        for col in self.check_columns(info):
+            nonnull, invalid = agg[f"nonnull:{col}"] or 0, agg[f"invalid:{col}"] or 0
+            passed = invalid <= self.max_invalid_rate * nonnull
+            out.append({"rule_id": self.id, "table": t, "column": col, "passed": passed,
+                        "severity": "warn" if not passed else "info",
+                        "message": f"{t}.{col} {self.kind} check: {invalid} invalid out of {nonnull} non-empty values",
+                        "details": {"total": agg["total"], "nonnull": nonnull, "invalid": invalid}})
+        return out
+
+    def estimate(self, t, info, agg, ctx):
+        out = []
+        for col in self.check_columns(info):
+            nonnull, invalid = agg[f"nonnull:{col}"] or 0, agg[f"invalid:{col}"] or 0
+            passed, (lo, hi) = self.verdict(invalid, nonnull, self.max_invalid_rate)
+            if passed is None:
+                return None
+            out.append({"rule_id": self.id, "table": t, "column": col, "passed": passed,
+                        "severity": "warn" if not passed else "info",
+                        "message": f"{t}.{col} {self.kind} check: {invalid} invalid out of {nonnull} sampled "
+                                   f"non-empty values (rate [{lo:.4f}, {hi:.4f}])",
+                        "details": {"sampled": agg["total"], "nonnull_sampled": nonnull, "invalid_sampled": invalid,
+                                    "interval": [lo, hi], "confidence": self.confidence, "approximate": True}})
+        return out
 
-class ZipCodeRule:
+class ZipCodeRule(_FormatRule):
     id = "semantic_zipcode"
+    kind = "zipcode format"
     def __init__(self, column: str = "Zip", country: str = "US"):
         self.column = column
         self.country = country
         self.pat = re.compile(r"^\d{5}(-\d{4})?$") if country=="US" else re.compile(r".*")
+    def invalid_sql(self, c):
+        return f"NOT ({c} REGEXP {qlit(self.pat.pattern)})"
 
-    def run(self, db_path: str, ctx: Dict[str, Any]):
-        out = []
-        with sqlite3.connect(db_path) as conn:
-            cur = conn.cursor()
-            for t in ctx["tables"]:
-                cur.execute(f"PRAGMA table_info('{t}')")
-                cols = [c[1] for c in cur.fetchall()]
-                if self.column not in cols: continue
-                cur.execute(f"SELECT COUNT(*) FROM '{t}'")
-                total = cur.fetchone()[0]
-                cur.execute(f"SELECT COUNT(*) FROM '{t}' WHERE \"{self.column}\" IS NOT NULL AND \"{self.column}\" <> ''")
-                nonnull = cur.fetchone()[0]
-                cur.execute(f"SELECT COUNT(*) FROM '{t}' WHERE \"{self.column}\" REGEXP '.*'")  # sqlite 无原生 regex，这里只是示意
-                # 简化：抽样检查（真实实现可注册 REGEXP 或拉到 Python 侧检查）
-                passed = True
-                out.append({"rule_id": self.id, "table": t, "passed": passed,
-                            "severity":"info", "message": f"{t}.{self.column} semantic check placeholder",
-                            "details":{"total": total, "nonnull": nonnull}})
-        return out
-
-class DateFormatRule:
+class DateFormatRule(_FormatRule):
     id = "semantic_date"
+    kind = "date format"
     def __init__(self, column: str = "Date", format: str = "%Y-%m-%d"):
         self.column = column
         self.format = format
+    def invalid_sql(self, c):
+        return f"NOT is_date({c}, {qlit(self.format)})"
 
-    def run(self, db_path: str, ctx: Dict[str, Any]):
-        out = []
-        with sqlite3.connect(db_path) as conn:
-            cur = conn.cursor()
-            for t in ctx["tables"]:
-                cur.execute(f"PRAGMA table_info('{t}')")
-                cols = [c[1] for c in cur.fetchall()]
-                if self.column not in cols: continue
-                cur.execute(f"SELECT COUNT(*) FROM '{t}'")
-                total = cur.fetchone()[0]
-                cur.execute(f"SELECT COUNT(*) FROM '{t}' WHERE \"{self.column}\" IS NOT NULL AND \"{self.column}\" <> ''")
-                nonnull = cur.fetchone()[0]
-                # 拉取数据到 Python 侧进行检查
-                cur.execute(f"SELECT \"{self.column}\" FROM '{t}' WHERE \"{self.column}\" IS NOT NULL AND \"{self.column}\" <> '' LIMIT 100")
-                values = [row[0] for row in cur.fetchall()]
-                invalid_count = 0
-                for val in values:
-                    try:
-                        datetime.datetime.strptime(val, self.format)
-                    except ValueError:
-                        invalid_count += 1
-                passed = invalid_count == 0
-                out.append({
-                    "rule_id": self.id,
-                    "table": t,
-                    "passed": passed,
-                    "severity": "warn" if not passed else "info",
-                    "message": f"{t}.{self.column} date format check: {invalid_count} invalid out of {len(values)} sampled",
-                    "details": {"total": total, "nonnull": nonnull, "invalid_sampled": invalid_count}
-                })
-        return out
-
-class DatetimeFormatRule:
+class DatetimeFormatRule(DateFormatRule):
     id = "semantic_datetime"
+    kind = "datetime format"
     def __init__(self, column: str = "Datetime", format: str = "%Y-%m-%d %H:%M:%S"):
-        self.column = column
-        self.format = format
+        super().__init__(column, format)
+
+class _ColumnTypeRule(AggregateRule):
+    """按列名关键词匹配列，检查声明类型"""
+    scope = "table"
+    expected = ""
+    def accepts(self, col_type: str) -> bool:
+        raise NotImplementedError
 
-    def run(self, db_path: str, ctx: Dict[str, Any]):
+    def evaluate(self, t, info, agg, ctx):
         out = []
-        with sqlite3.connect(db_path) as conn:
-            cur = conn.cursor()
-            for t in ctx["tables"]:
-                cur.execute(f"PRAGMA table_info('{t}')")
-                cols = [c[1] for c in cur.fetchall()]
-                if self.column not in cols: continue
-                cur.execute(f"SELECT COUNT(*) FROM '{t}'")
-                total = cur.fetchone()[0]
-                cur.execute(f"SELECT COUNT(*) FROM '{t}' WHERE \"{self.column}\" IS NOT NULL AND \"{self.column}\" <> ''")
-                nonnull = cur.fetchone()[0]
-                # 拉取数据到 Python 侧进行检查
-                cur.execute(f"SELECT \"{self.column}\" FROM '{t}' WHERE \"{self.column}\" IS NOT NULL AND \"{self.column}\" <> '' LIMIT 100")
-                values = [row[0] for row in cur.fetchall()]
-                invalid_count = 0
-                for val in values:
-                    try:
-                        datetime.datetime.strptime(val, self.format)
-                    except ValueError:
-                        invalid_count += 1
-                passed = invalid_count == 0
+        col_types = {c[1]: str(c[2]).upper() for c in info["columns"]}
+        for col in col_types:
+            if col in self.columns or any(col.lower().find(term.lower()) != -1 for term in self.columns):
+                col_type = col_types.get(col, "")
+                passed = self.accepts(col_type)
                 out.append({
                     "rule_id": self.id,
                     "table": t,
+                    "column": col,
                     "passed": passed,
                     "severity": "warn" if not passed else "info",
-                    "message": f"{t}.{self.column} datetime format check: {invalid_count} invalid out of {len(values)} sampled",
-                    "details": {"total": total, "nonnull": nonnull, "invalid_sampled": invalid_count}
+                    "message": f"{t}.{col} type={col_type}, expected {self.expected}",
+                    "details": {"type": col_type}
                 })
         return out
 
-class StringTypeRule:
+class StringTypeRule(_ColumnTypeRule):
     id = "semantic_string_type"
+    expected = "VARCHAR or TEXT"
     def __init__(self, columns: list = None):
         self.columns = columns or ["Name", "Description", "Title", "Text"]
+    def accepts(self, col_type):
+        return "VARCHAR" in col_type or "TEXT" in col_type
 
-    def run(self, db_path: str, ctx: Dict[str, Any]):
-        out = []
-        with sqlite3.connect(db_path) as conn:
-            cur = conn.cursor()
-            for t in ctx["tables"]:
-                cur.execute(f"PRAGMA table_info('{t}')")
-                cols = cur.fetchall()
-                col_names = [c[1] for c in cols]
-                col_types = {c[1]: str(c[2]).upper() for c in cols}
-                for col in col_names:
-                    if col in self.columns or any(col.lower().find(term.lower()) != -1 for term in self.columns):
-                        col_type = col_types.get(col, "")
-                        passed = "VARCHAR" in col_type or "TEXT" in col_type
-                        out.append({
-                            "rule_id": self.id,
-                            "table": t,
-                            "column": col,
-                            "passed": passed,
-                            "severity": "warn" if not passed else "info",
-                            "message": f"{t}.{col} type={col_type}, expected VARCHAR or TEXT",
-                            "details": {"type": col_type}
-                        })
-        return out
-
-class DecimalTypeRule:
+class DecimalTypeRule(_ColumnTypeRule):
     id = "semantic_decimal_type"
+    expected = "DECIMAL, REAL or FLOAT"
     def __init__(self, columns: list = None):
         self.columns = columns or ["Price", "Amount", "Rate", "Cost"]
+    def accepts(self, col_type):
+        return "DECIMAL" in col_type or "REAL" in col_type or "FLOAT" in col_type
 
-    def run(self, db_path: str, ctx: Dict[str, Any]):
-        out = []
-        with sqlite3.connect(db_path) as conn:
-            cur = conn.cursor()
-            for t in ctx["tables"]:
-                cur.execute(f"PRAGMA table_info('{t}')")
-                cols = cur.fetchall()
-                col_names = [c[1] for c in cols]
-                col_types = {c[1]: str(c[2]).upper() for c in cols}
-                for col in col_names:
-                    if col in self.columns or any(col.lower().find(term.lower()) != -1 for term in self.columns):
-                        col_type = col_types.get(col, "")
-                        passed = "DECIMAL" in col_type or "REAL" in col_type or "FLOAT" in col_type
-                        out.append({
-                            "rule_id": self.id,
-                            "table": t,
-                            "column": col,
-                            "passed": passed,
-                            "severity": "warn" if not passed else "info",
-                            "message": f"{t}.{col} type={col_type}, expected DECIMAL, REAL or FLOAT",
-                            "details": {"type": col_type}
-                        })
-        return out
-
-class IntegerTypeRule:
+class IntegerTypeRule(_ColumnTypeRule):
     id = "semantic_integer_type"
+    expected = "INT"
     def __init__(self, columns: list = None):
         self.columns = columns or ["Count", "Number", "Quantity", "ID"]
+    def accepts(self, col_type):
+        return "INT" in col_type
 
-    def run(self, db_path: str, ctx: Dict[str, Any]):
-        out = []
-        with sqlite3.connect(db_path) as conn:
-            cur = conn.cursor()
-            for t in ctx["tables"]:
-                cur.execute(f"PRAGMA table_info('{t}')")
-                cols = cur.fetchall()
-                col_names = [c[1] for c in cols]
-                col_types = {c[1]: str(c[2]).upper() for c in cols}
-                for col in col_names:
-                    if col in self.columns or any(col.lower().find(term.lower()) != -1 for term in self.columns):
-                        col_type = col_types.get(col, "")
-                        passed = "INT" in col_type
-                        out.append({
-                            "rule_id": self.id,
-                            "table": t,
-                            "column": col,
-                            "passed": passed,
-                            "severity": "warn" if not passed else "info",
-                            "message": f"{t}.{col} type={col_type}, expected INT",
-                            "details": {"type": col_type}
-                        })
-        return out
-
-class EmailFormatRule:
+class EmailFormatRule(_FormatRule):
     id = "semantic_email"
+    kind = "email format"
     def __init__(self, column: str = "Email"):
         self.column = column
         self.pat = re.compile(r"^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$")
+    def invalid_sql(self, c):
+        return f"NOT ({c} REGEXP {qlit(self.pat.pattern)})"
 
-    def run(self, db_path: str, ctx: Dict[str, Any]):
-        out = []
-        with sqlite3.connect(db_path) as conn:
-            cur = conn.cursor()
-            for t in ctx["tables"]:
-                cur.execute(f"PRAGMA table_info('{t}')")
-                cols = [c[1] for c in cur.fetchall()]
-                if self.column not in cols: continue
-                cur.execute(f"SELECT COUNT(*) FROM '{t}'")
-                total = cur.fetchone()[0]
-                cur.execute(f"SELECT COUNT(*) FROM '{t}' WHERE \"{self.column}\" IS NOT NULL AND \"{self.column}\" <> ''")
-                nonnull = cur.fetchone()[0]
-                # 拉取数据到 Python 侧进行检查
-                cur.execute(f"SELECT \"{self.column}\" FROM '{t}' WHERE \"{self.column}\" IS NOT NULL AND \"{self.column}\" <> '' LIMIT 100")
-                values = [row[0] for row in cur.fetchall()]
-                invalid_count = sum(1 for val in values if not self.pat.match(val))
-                passed = invalid_count == 0
-                out.append({"rule_id": self.id, "table": t, "passed": passed,
-                            "severity": "warn" if not passed else "info",
-                            "message": f"{t}.{self.column} email format check: {invalid_count} invalid out of {len(values)} sampled",
-                            "details": {"total": total, "nonnull": nonnull, "invalid_sampled": invalid_count}})
-        return out
-
-class PunctuationEndingRule:
+class PunctuationEndingRule(_FormatRule):
     id = "semantic_punctuation_ending"
+    kind = "punctuation ending"
     def __init__(self, columns: list = None, punctuation: str = ".!?,;:"):
         self.columns = columns or []
         self.punctuation = punctuation
-
-    def run(self, db_path: str, ctx: Dict[str, Any]):
-        out = []
-        with sqlite3.connect(db_path) as conn:
-            cur = conn.cursor()
-            for t in ctx["tables"]:
-                cur.execute(f"PRAGMA table_info('{t}')")
-                cols = [c[1] for c in cur.fetchall()]
-                check_cols = self.columns if self.columns else cols
-                for col in check_cols:
-                    if col not in cols: continue
-                    cur.execute(f"SELECT COUNT(*) FROM '{t}'")
-                    total = cur.fetchone()[0]
-                    cur.execute(f"SELECT COUNT(*) FROM '{t}' WHERE \"{col}\" IS NOT NULL AND \"{col}\" <> ''")
-                    nonnull = cur.fetchone()[0]
-                    # 拉取数据到 Python 侧进行检查
-                    cur.execute(f"SELECT \"{col}\" FROM '{t}' WHERE \"{col}\" IS NOT NULL AND \"{col}\" <> '' LIMIT 100")
-                    values = [row[0] for row in cur.fetchall()]
-                    invalid_count = sum(1 for val in values if val and any(val.strip().endswith(p) for p in self.punctuation))
-                    passed = invalid_count == 0
-                    out.append({
-                        "rule_id": self.id,
-                        "table": t,
-                        "column": col,
-                        "passed": passed,
-                        "severity": "warn" if not passed else "info",
-                        "message": f"{t}.{col} punctuation ending check: {invalid_count} invalid out of {len(values)} sampled",
-                        "details": {"total": total, "nonnull": nonnull, "invalid_sampled": invalid_count}
-                    })
-        return out
+    def check_columns(self, info):
+        cols = _column_names(info)
+        return [c for c in (self.columns or cols) if c in cols]
+    def invalid_sql(self, c):
+        return f"ends_with_punct({c}, {qlit(self.punctuation)})"
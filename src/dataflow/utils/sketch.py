@@ -0,0 +1,168 @@
+from __future__ import annotations
+from typing import Any, Dict, List, Tuple
+import bisect
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+# 列级草图：MinHash（集合相似度/包含度）+ HyperLogLog（基数），均可按批增量更新、可合并
+
+_GOLDEN = np.uint64(0x9E3779B97F4A7C15)
+
+def _mix(x: np.ndarray) -> np.ndarray:
+    # splitmix64 终结器（uint64 按位运算，溢出即回绕）
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+def canonical(arr: pa.Array | pa.ChunkedArray) -> Tuple[pa.Array, bool]:
+    """去掉空值后的规范字符串形式，使 CSV 读成 int / float(1.0) / str 的同一值可跨表比较。
+    返回 (值, 是否可作键)：浮点非整数、布尔等不参与键发现"""
+    if isinstance(arr, pa.ChunkedArray):
+        arr = arr.combine_chunks()
+    if pa.types.is_dictionary(arr.type):
+        arr = arr.cast(arr.type.value_type)
+    arr = pc.drop_null(arr)
+    t = arr.type
+    keyable = pa.types.is_integer(t) or pa.types.is_string(t) or pa.types.is_large_string(t)
+    if pa.types.is_floating(t):
+        arr = arr.filter(pc.invert(pc.is_nan(arr)))
+        vals = arr.to_numpy(zero_copy_only=False)
+        keyable = bool(np.all(np.isfinite(vals)) and np.all(vals == np.round(vals)))
+        if keyable:
+            arr = pa.array(vals.astype(np.int64))
+    if arr.type != pa.string():
+        try:
+            arr = arr.cast(pa.string())
+        except (pa.ArrowInvalid, pa.ArrowNotImplementedError):
+            arr = pa.array([str(v) for v in arr.to_pylist()], type=pa.string())
+    return arr, keyable
+
+def hash_values(arr: pa.Array) -> np.ndarray:
+    """字符串数组 -> uint64 哈希（pandas 向量化 siphash）"""
+    return pd.util.hash_array(arr.to_numpy(zero_copy_only=False).astype(object), categorize=False)
+
+class ColumnSketch:
+    """num_perm 个置换的 MinHash 签名 + 2**p 个寄存器的 HLL；rows/nulls 为精确计数"""
+
+    def __init__(self, num_perm: int = 128, p: int = 12):
+        self.p = p
+        self.seeds = _mix(np.arange(1, num_perm + 1, dtype=np.uint64) * _GOLDEN)
+        self.sig = np.full(num_perm, np.iinfo(np.uint64).max, dtype=np.uint64)
+        self.reg = np.zeros(1 << p, dtype=np.uint8)
+        self.rows = 0
+        self.nulls = 0
+        self.keyable = True
+
+    def update(self, h: np.ndarray, chunk: int = 8192):
+        if not len(h):
+            return
+        for s in range(0, len(h), chunk):
+            block = h[s:s + chunk]
+            self.sig = np.minimum(self.sig, _mix(block[:, None] ^ self.seeds[None, :]).min(axis=0))
+        g = _mix(h)   # HLL 用与置换独立的一组哈希位
+        idx = (g >> np.uint64(64 - self.p)).astype(np.int64)
+        w = g << np.uint64(self.p)
+        # 前导零个数：frexp 指数即位长（float64 舍入只会在 2 的幂附近偏 1，对 HLL 无碍）
+        bits = np.frexp(w.astype(np.float64))[1]
+        rank = np.where(w == 0, 64 - self.p + 1, 64 - bits + 1).astype(np.uint8)
+        np.maximum.at(self.reg, idx, rank)
+
+    def merge(self, other: "ColumnSketch"):
+        self.sig = np.minimum(self.sig, other.sig)
+        self.reg = np.maximum(self.reg, other.reg)
+        self.rows += other.rows
+        self.nulls += other.nulls
+        self.keyable = self.keyable and other.keyable
+
+    def cardinality(self) -> float:
+        m = float(len(self.reg))
+        est = (0.7213 / (1 + 1.079 / m)) * m * m / float(np.sum(np.ldexp(1.0, -self.reg.astype(np.int64))))
+        zeros = int(np.count_nonzero(self.reg == 0))
+        if est <= 2.5 * m and zeros:
+            est = m * np.log(m / zeros)   # 小基数：线性计数
+        return float(est)
+
+    def jaccard(self, other: "ColumnSketch") -> float:
+        return float(np.mean(self.sig == other.sig))
+
+    def containment(self, other: "ColumnSketch") -> float:
+        """估计 |A ∩ B| / |A|（A=self）：由 Jaccard 与两侧基数换算"""
+        a, b = self.cardinality(), other.cardinality()
+        if a <= 0:
+            return 0.0
+        j = self.jaccard(other)
+        return min(1.0, j * (a + b) / ((1 + j) * a))
+
+    def bands(self, bands: int) -> List[bytes]:
+        """LSH 分段键：签名切成 bands 段，每段字节串即桶键"""
+        r = len(self.sig) // bands
+        return [i.to_bytes(2, "little") + self.sig[i * r:(i + 1) * r].tobytes() for i in range(bands)]
+
+class LSHIndex:
+    """MinHash 分段 LSH：任一分段完全相同即为候选"""
+
+    def __init__(self, bands: int = 64):
+        self.bands = bands
+        self.buckets: Dict[bytes, List[str]] = {}
+
+    def add(self, key, sk: ColumnSketch):
+        for b in sk.bands(self.bands):
+            self.buckets.setdefault(b, []).append(key)
+
+    def query(self, sk: ColumnSketch) -> List:
+        return list(dict.fromkeys(k for b in sk.bands(self.bands) for k in self.buckets.get(b, ())))
+
+class ContainmentIndex:
+    """按包含度 |A∩B|/|A|（A 为查询列）取候选并估计。
+    缺省经 MinHash 分段（bands 段，缺省每段一个槽位，对低 Jaccard 的小列⊂大列也敏感）取候选，只对命中的键
+    估计包含度，查询代价只与命中的桶有关；exhaustive=True 时与基数足够大的全部键一次向量化比较（键少或需穷举时用）。
+    父列远大于子列时签名几乎没有相同槽位（期望相同槽位 num_perm·|A|/|B| < min_signal），估计不可信，记为 None，
+    由调用方决定是否精确校验；这类配对可经 query 的 extra 传入（如按列名找到的键）"""
+
+    def __init__(self, bands: int | None = None, exhaustive: bool = False):
+        self.bands = bands
+        self.exhaustive = exhaustive
+        self.lsh: LSHIndex | None = None
+        self.sketches: Dict[Any, ColumnSketch] = {}
+        self.card: Dict[Any, float] = {}
+        self._built = False
+
+    def add(self, key, sk: ColumnSketch):
+        if not self.exhaustive:
+            if self.lsh is None:
+                self.lsh = LSHIndex(max(1, min(self.bands or len(sk.sig), len(sk.sig))))
+            self.lsh.add(key, sk)
+        self.sketches[key] = sk
+        self.card[key] = sk.cardinality()
+        self._built = False
+
+    def _build(self):
+        keys = sorted(self.card, key=self.card.get)
+        self.keys = keys
+        self.cards = np.array([self.card[k] for k in keys], dtype=float)
+        self.sigs = np.stack([self.sketches[k].sig for k in keys]) if keys else np.zeros((0, 0), dtype=np.uint64)
+        self._built = True
+
+    def query(self, sk: ColumnSketch, threshold: float, min_signal: float = 4.0,
+              extra=()) -> List[Tuple[Any, float | None]]:
+        """基数不小于 threshold·|A| 的候选中估计包含度 ≥ threshold 的 (key, 估计)，估计不可信的记 None"""
+        a = sk.cardinality()
+        if a <= 0 or not self.card:
+            return []
+        if self.exhaustive:
+            if not self._built:
+                self._build()
+            lo = bisect.bisect_left(self.cards, threshold * a)
+            keys, b = self.keys[lo:], self.cards[lo:]
+            j = (self.sigs[lo:] == sk.sig[None, :]).mean(axis=1) if len(keys) else np.zeros(0)
+        else:
+            keys = [k for k in dict.fromkeys([*self.lsh.query(sk), *extra])
+                    if k in self.card and self.card[k] >= threshold * a]
+            b = np.array([self.card[k] for k in keys], dtype=float)
+            j = np.array([float(np.mean(self.sketches[k].sig == sk.sig)) for k in keys])
+        est = np.minimum(1.0, j * (a + b) / ((1 + j) * a))
+        weak = len(sk.sig) * a / np.maximum(b, 1.0) < min_signal
+        return [(k, None if weak[i] else float(est[i]))
+                for i, k in enumerate(keys) if weak[i] or est[i] >= threshold]
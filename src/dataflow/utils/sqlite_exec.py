@@ -1,5 +1,6 @@
 from __future__ import annotations
-import subprocess, os, signal
+from typing import Dict, List, Optional, Tuple
+import subprocess, os, signal, json, queue, threading
 
 def exec_python_code(code: str, env: dict, timeout: int = 300):
     proc = subprocess.Popen(
@@ -14,3 +15,175 @@ def exec_python_code(code: str, env: dict, timeout: int = 300):
         except Exception:
             proc.kill()
         return None, "Execution timeout"
+
+DEFAULT_PRELOAD = ["sqlite3", "random", "json", "datetime", "math", "re", "string", "uuid", "decimal",
+                   "itertools", "collections", "faker"]
+
+# zygote：预导入常用库后按行读取任务，每个任务 fork 一个子进程执行；
+# 子进程设置 rlimit、独立会话，stdout/stderr 落临时文件，超时整组 SIGKILL
+_ZYGOTE = r'''
+import sys, os, json, time, signal, resource, tempfile, traceback, importlib
+cfg = json.loads(sys.argv[1])
+for _m in cfg["preload"]:
+    try:
+        importlib.import_module(_m)
+    except Exception:
+        pass
+reply = os.fdopen(os.dup(1), "w")
+os.dup2(os.open(os.devnull, os.O_WRONLY), 1)
+
+def reseed():
+    # fork 出的子进程继承 zygote 的随机状态：stdlib random 由 CPython 的 at-fork 钩子自动重播种，
+    # numpy 的全局 RandomState 与 Faker 各实例共享的 random.Random 不会，否则每个任务生成同一批"随机"数据
+    seed = int.from_bytes(os.urandom(8), "little")
+    np = sys.modules.get("numpy")
+    if np is not None:
+        np.random.seed(seed % (1 << 32))
+    fg = sys.modules.get("faker.generator")
+    if fg is not None:
+        fg.random.seed(seed)
+
+def child(task, fo, fe):
+    os.setsid()
+    reseed()
+    os.dup2(os.open(os.devnull, os.O_RDONLY), 0)
+    os.dup2(fo.fileno(), 1); os.dup2(fe.fileno(), 2)
+    sys.stdin = open(os.devnull)
+    lim = task["limits"]
+    if lim.get("cpu_seconds"):
+        resource.setrlimit(resource.RLIMIT_CPU, (lim["cpu_seconds"], lim["cpu_seconds"] + 1))
+    if lim.get("memory_mb"):
+        n = lim["memory_mb"] << 20
+        resource.setrlimit(resource.RLIMIT_AS, (n, n))
+    if lim.get("max_open_files"):
+        n = lim["max_open_files"]
+        resource.setrlimit(resource.RLIMIT_NOFILE, (n, n))
+    os.environ.update(task["env"])
+    rc = 0
+    try:
+        exec(compile(task["code"], "<string>", "exec"), {"__name__": "__main__", "__builtins__": __builtins__})
+    except SystemExit as e:
+        rc = e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+    except BaseException as e:
+        # 去掉 zygote 自身的栈帧，与 python -c 的回溯保持一致
+        traceback.print_exception(type(e), e, e.__traceback__.tb_next)
+        rc = 1
+    try:
+        sys.stdout.flush(); sys.stderr.flush()
+    finally:
+        os._exit(rc)
+
+for line in sys.stdin:
+    task = json.loads(line)
+    fo, fe = tempfile.TemporaryFile(), tempfile.TemporaryFile()
+    sys.stdout.flush(); sys.stderr.flush()
+    pid = os.fork()
+    if pid == 0:
+        child(task, fo, fe)
+    deadline = time.monotonic() + task["timeout"]
+    delay, status, timed_out = 0.001, None, False
+    while status is None:
+        done, st = os.waitpid(pid, os.WNOHANG)
+        if done:
+            status = st
+        elif time.monotonic() > deadline:
+            try:
+                os.killpg(pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+            _, status = os.waitpid(pid, 0)
+            timed_out = True
+        else:
+            time.sleep(delay); delay = min(delay * 2, 0.02)
+    outs = []
+    for f in (fo, fe):
+        f.seek(0); outs.append(f.read().decode("utf-8", "replace")); f.close()
+    rc = os.waitstatus_to_exitcode(status) if hasattr(os, "waitstatus_to_exitcode") else status
+    if rc < 0 and not timed_out:
+        outs[1] += f"\nProcess killed by signal {signal.Signals(-rc).name}"
+    reply.write(json.dumps({"stdout": outs[0], "stderr": outs[1], "returncode": rc, "timeout": timed_out}) + "\n")
+    reply.flush()
+'''
+
+class SandboxWorker:
+    """一个常驻 zygote 进程；每次 run 由 zygote fork 出隔离子进程执行代码"""
+
+    def __init__(self, preload: List[str], limits: Dict[str, int], python: str = "python3", max_tasks: int = 1000):
+        self.preload = preload
+        self.limits = limits
+        self.python = python
+        self.max_tasks = max_tasks
+        self.proc: Optional[subprocess.Popen] = None
+        self.tasks = 0
+
+    def _spawn(self):
+        self.close()
+        self.proc = subprocess.Popen(
+            [self.python, "-c", _ZYGOTE, json.dumps({"preload": self.preload})],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True,
+            start_new_session=True, env={**os.environ, "PYTHONNOUSERSITE": "1"})
+        self.tasks = 0
+
+    def run(self, code: str, env: dict, timeout: int = 300) -> Dict[str, object]:
+        if self.proc is None or self.proc.poll() is not None or self.tasks >= self.max_tasks:
+            self._spawn()
+        task = {"code": code, "env": {k: str(v) for k, v in env.items()}, "timeout": timeout, "limits": self.limits}
+        try:
+            self.proc.stdin.write(json.dumps(task) + "\n")
+            self.proc.stdin.flush()
+            line = self.proc.stdout.readline()
+        except (BrokenPipeError, OSError):
+            line = ""
+        self.tasks += 1
+        if not line:
+            # zygote 异常退出：下次调用时重建
+            self.close()
+            return {"stdout": None, "stderr": "Sandbox worker died", "returncode": -1, "timeout": False}
+        return json.loads(line)
+
+    def close(self):
+        if self.proc is not None:
+            try:
+                self.proc.stdin.close()
+                self.proc.wait(timeout=5)
+            except Exception:
+                try:
+                    os.killpg(self.proc.pid, signal.SIGKILL)
+                except Exception:
+                    self.proc.kill()
+            self.proc = None
+
+class SandboxPool:
+    """预热的沙箱进程池：size 个 zygote，fork-per-task，资源受 rlimit 约束。
+    run() 与 exec_python_code 返回约定一致：(stdout, stderr)，超时为 (None, "Execution timeout")"""
+
+    def __init__(self, size: int = 4, preload: Optional[List[str]] = None, cpu_seconds: int = 300,
+                 memory_mb: int = 2048, max_open_files: int = 256, python: str = "python3"):
+        limits = {"cpu_seconds": cpu_seconds, "memory_mb": memory_mb, "max_open_files": max_open_files}
+        self.workers: List[SandboxWorker] = [
+            SandboxWorker(DEFAULT_PRELOAD if preload is None else preload, limits, python) for _ in range(max(1, size))]
+        self.idle: "queue.Queue[SandboxWorker]" = queue.Queue()
+        for w in self.workers:
+            self.idle.put(w)
+        self.lock = threading.Lock()
+
+    def run(self, code: str, env: dict, timeout: int = 300) -> Tuple[Optional[str], str]:
+        w = self.idle.get()
+        try:
+            res = w.run(code, env, timeout)
+        finally:
+            self.idle.put(w)
+        if res.get("timeout"):
+            return None, "Execution timeout"
+        return res["stdout"], res["stderr"]
+
+    def close(self):
+        with self.lock:
+            for w in self.workers:
+                w.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
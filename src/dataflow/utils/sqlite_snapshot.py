@@ -0,0 +1,32 @@
+from __future__ import annotations
+import sqlite3
+
+# 基于 SQLite online backup API 的快照：整库按页拷贝到内存或文件，恢复时再整库写回
+
+def snapshot_db(db_path: str, dest: str = ":memory:") -> sqlite3.Connection:
+    """把 db_path 拷贝为一个内存库（或 dest 文件）并返回其连接"""
+    mem = sqlite3.connect(dest, check_same_thread=False)
+    src = sqlite3.connect(db_path)
+    try:
+        src.backup(mem)
+    finally:
+        src.close()
+    return mem
+
+def restore_db(snap: sqlite3.Connection, db_path: str):
+    """用快照覆盖 db_path（文件不存在则创建）"""
+    dst = sqlite3.connect(db_path)
+    try:
+        snap.backup(dst)
+    finally:
+        dst.close()
+
+def backup_db(src_path: str, dst_path: str):
+    """文件到文件的整库拷贝（源库可正被其他连接打开）"""
+    src = sqlite3.connect(src_path)
+    dst = sqlite3.connect(dst_path)
+    try:
+        src.backup(dst)
+    finally:
+        dst.close()
+        src.close()
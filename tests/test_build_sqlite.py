@@ -0,0 +1,72 @@
+import json, os
+import pandas as pd
+from dataflow.core.artifact import Artifact
+from dataflow.ir.schema import new_ir
+from dataflow.operators.build_sqlite import MANIFEST, BuildSQLite, _file_digest
+
+def _stage(tmp_path, table, df):
+    d = tmp_path / "staging" / table
+    d.mkdir(parents=True, exist_ok=True)
+    df.to_parquet(d / "part_0.parquet")
+    return d
+
+def _run(tmp_path, logical, ir):
+    out = BuildSQLite().run({"LogicalDB": Artifact(kind="LogicalDB", data=logical), "IR": Artifact(kind="IR", data=ir)},
+                            load_data=True, workers=1, workdir=str(tmp_path))
+    manifest = json.loads((tmp_path / "sqlite_dbs" / MANIFEST).read_text("utf-8"))
+    return out["AgentReadyMeta"].data, manifest
+
+def _setup(tmp_path):
+    ir = new_ir("ds")
+    for t in ("a", "b"):
+        d = _stage(tmp_path, t, pd.DataFrame({"id": [1, 2, 3]}))
+        ir["table_content"][t] = {"data_uri": str(d)}
+    logical = {f"db_{t}": {"table_meta": {t: f'CREATE TABLE "{t}" ("id" INTEGER PRIMARY KEY);'}, "index_meta": {}}
+               for t in ("a", "b")}
+    return logical, ir
+
+def test_manifest_new_changed_unchanged(tmp_path):
+    logical, ir = _setup(tmp_path)
+    meta, _ = _run(tmp_path, logical, ir)
+    assert {k: m["build_status"] for k, m in meta.items()} == {"db_a": "new", "db_b": "new"}
+
+    # 重新写出同内容的 parquet：mtime 变了，内容哈希重算一次后仍判为未变
+    _stage(tmp_path, "a", pd.DataFrame({"id": [1, 2, 3]}))
+    meta, _ = _run(tmp_path, logical, ir)
+    assert {k: m["build_status"] for k, m in meta.items()} == {"db_a": "unchanged", "db_b": "unchanged"}
+    assert meta["db_a"]["table_content"]["a"]["row_count"] == 3
+
+    _stage(tmp_path, "b", pd.DataFrame({"id": [1, 2, 3, 4]}))
+    meta, manifest = _run(tmp_path, logical, ir)
+    assert {k: m["build_status"] for k, m in meta.items()} == {"db_a": "unchanged", "db_b": "changed"}
+    assert manifest["dbs"]["db_b"]["counts"] == {"b": 4}
+
+    # 库文件被删：即使指纹未变也重建
+    os.remove(manifest["dbs"]["db_a"]["db_path"])
+    meta, _ = _run(tmp_path, logical, ir)
+    assert meta["db_a"]["build_status"] == "changed"
+
+def test_digest_cache_keyed_by_size_and_mtime(tmp_path):
+    p = tmp_path / "x.parquet"
+    p.write_bytes(b"abc")
+    cache = {}
+    h = _file_digest(str(p), cache)
+    st = os.stat(p)
+    assert cache[str(p)] == {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "hash": h}
+    # (size, mtime) 相同则不读文件
+    cache[str(p)]["hash"] = "cached"
+    assert _file_digest(str(p), cache) == "cached"
+    os.utime(p, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+    assert _file_digest(str(p), cache) == h
+
+def test_failed_database_does_not_abort_build(tmp_path):
+    logical, ir = _setup(tmp_path)
+    logical["db_b"]["index_meta"] = {"b": ['CREATE INDEX i ON b (missing);']}
+    meta, manifest = _run(tmp_path, logical, ir)
+    assert list(meta) == ["db_a"] and meta["db_a"]["build_status"] == "new"
+    assert manifest["dbs"]["db_b"]["status"] == "failed" and manifest["dbs"]["db_b"]["fingerprint"] is None
+    assert not (tmp_path / "sqlite_dbs" / "db_b.sqlite").exists()
+    # 修好后下次重建
+    logical["db_b"]["index_meta"] = {}
+    meta, manifest = _run(tmp_path, logical, ir)
+    assert meta["db_b"]["build_status"] == "changed" and manifest["dbs"]["db_b"]["counts"] == {"b": 3}
@@ -0,0 +1,65 @@
+import pandas as pd
+import pytest
+from dataflow.core.artifact import Artifact
+from dataflow.ir.schema import new_ir
+from dataflow.operators.build_sqlite import BuildSQLite, build_one
+from dataflow.operators.consolidate_schema import fk_index_name, source_table_map, typed_table_meta, validate_ddl
+from dataflow.operators.quality_check import quality_check_db
+
+PK_RULE = [("dataflow.qc_rules.basic.PrimaryKeyAutoincrementRule", {})]
+
+def _build(tmp_path, ids):
+    ir = new_ir("ds")
+    ir["table_header"]["items"] = ["id", "name"]
+    ir["table_schema"]["items"] = {"primary_key": ["id"]}
+    # 样本只看到整数：推断为 INTEGER
+    ir["table_content"]["items"] = {"samples": [[1, "a"], [2, "b"]]}
+    table_meta, index_meta = typed_table_meta(ir, ["items"])
+    part = tmp_path / "items.parquet"
+    pd.DataFrame({"id": ids, "name": [f"n{i}" for i in range(len(ids))]}).to_parquet(part)
+    db = tmp_path / "db.sqlite"
+    counts = build_one(str(db), table_meta, index_meta, {"items": [str(part)]})
+    return table_meta["items"], counts, quality_check_db(str(db), PK_RULE)[0]
+
+def test_inferred_integer_key_is_rowid_alias(tmp_path):
+    ddl, counts, ok = _build(tmp_path, ["1", "2", "3"])
+    assert '"id" INTEGER PRIMARY KEY' in ddl
+    assert counts == {"items": 3} and ok
+
+def test_non_integer_key_falls_back_at_load_time(tmp_path):
+    # 样本之外出现非整数键：不中止装载，退回 INT PRIMARY KEY，主键规则如实报错
+    ddl, counts, ok = _build(tmp_path, ["1", "2", "A-7"])
+    assert '"id" INTEGER PRIMARY KEY' in ddl
+    assert counts == {"items": 3} and not ok
+
+def test_fk_index_added_only_when_no_index_leads_with_column():
+    _, index_meta = validate_ddl("""
+        CREATE TABLE customers (id INTEGER PRIMARY KEY);
+        CREATE TABLE products (sku TEXT UNIQUE);
+        CREATE TABLE orders (id INTEGER PRIMARY KEY, cust INTEGER REFERENCES customers(id),
+                             sku TEXT REFERENCES products(sku), ref INTEGER REFERENCES customers(id));
+        CREATE INDEX by_cust ON orders (cust, id);
+        CREATE TABLE shipments (order_id INTEGER PRIMARY KEY REFERENCES orders(id));""")
+    # cust 已由另一名字的索引覆盖；rowid 别名主键本身即索引
+    assert [fk_index_name("orders", c) in " ".join(index_meta["orders"]) for c in ("cust", "sku", "ref")] == [
+        False, True, True]
+    assert index_meta["shipments"] == []
+
+def test_llm_table_names_map_to_staged_tables(tmp_path):
+    table_meta, index_meta = validate_ddl("CREATE TABLE Customer (id INTEGER PRIMARY KEY, name TEXT);"
+                                          "CREATE TABLE customer_notes (id INTEGER PRIMARY KEY, note TEXT);")
+    mapping = source_table_map(table_meta, ["customers"])
+    assert mapping == {"Customer": "customers"}
+    with pytest.raises(ValueError):
+        source_table_map(table_meta, ["customers", "invoices"])
+
+    d = tmp_path / "staging" / "customers"
+    d.mkdir(parents=True)
+    pd.DataFrame({"id": [1, 2, 3], "name": ["a", "b", "c"]}).to_parquet(d / "part_0.parquet")
+    ir = new_ir("ds")
+    ir["table_content"]["customers"] = {"data_uri": str(d)}
+    logical = {"db_0": {"table_meta": table_meta, "index_meta": index_meta, "table_sources": mapping}}
+    out = BuildSQLite().run({"LogicalDB": Artifact(kind="LogicalDB", data=logical), "IR": Artifact(kind="IR", data=ir)},
+                            load_data=True, workers=1, workdir=str(tmp_path))
+    tc = out["AgentReadyMeta"].data["db_0"]["table_content"]
+    assert tc["Customer"]["row_count"] == 3 and tc["customer_notes"]["is_empty"]
@@ -0,0 +1,69 @@
+import pandas as pd
+import pyarrow as pa
+from dataflow.core.artifact import Artifact
+from dataflow.ir.schema import new_ir
+from dataflow.operators.discover_keys import DiscoverKeys
+from dataflow.utils.sketch import ColumnSketch, ContainmentIndex, hash_values
+
+def _ir(tmp_path, tables):
+    ir = new_ir("ds")
+    for t, df in tables.items():
+        d = tmp_path / t
+        d.mkdir(parents=True)
+        df.to_parquet(d / "part_0.parquet")
+        ir["table_header"][t] = list(df.columns)
+        ir["table_schema"][t] = {}
+        ir["table_content"][t] = {"row_count": len(df), "data_uri": str(d)}
+    return Artifact(kind="IR", data=ir)
+
+def _fks(ir):
+    return {t: [(fk["column"], fk["ref_table"], fk["ref_column"]) for fk in s.get("foreign_keys", [])]
+            for t, s in ir["table_schema"].items() if s.get("foreign_keys")}
+
+def test_small_child_in_large_parent(tmp_path):
+    n = 20000
+    ir = _ir(tmp_path, {
+        "customers": pd.DataFrame({"id": range(1, n + 1), "name": [f"c{i}" for i in range(n)]}),
+        # 只引用 40 个客户：与父列的 Jaccard 约 0.002，固定 64×2 分段的 LSH 找不到
+        "vip_orders": pd.DataFrame({"order_no": [f"v{i}" for i in range(200)],
+                                    "customer_id": [7 + 97 * (i % 40) for i in range(200)],
+                                    "bucket": [1001 + i % 40 for i in range(200)]}),
+        # 与子列同量级的父列：草图可估计，照常发现
+        "regions": pd.DataFrame({"region_id": range(1, 51)}),
+        "stores": pd.DataFrame({"store_id": range(300), "region_id": [1 + i % 50 for i in range(300)]}),
+    })
+    out = DiscoverKeys().run({"IR": ir}, workers=1)["IR"].data
+    fks = _fks(out)
+    assert ("customer_id", "customers", "id") in fks["vip_orders"]
+    assert ("region_id", "regions", "region_id") in fks["stores"]
+    # 草图无法估计的配对只凭列名相关进入校验：bucket 虽然也落在 customers.id 里，但不算外键
+    assert all(c != "bucket" for c, _, _ in fks["vip_orders"])
+
+def test_exhaustive_scan_agrees(tmp_path):
+    n = 20000
+    tables = {
+        "customers": pd.DataFrame({"id": range(1, n + 1)}),
+        "vip_orders": pd.DataFrame({"order_no": [f"v{i}" for i in range(200)],
+                                    "customer_id": [7 + 97 * (i % 40) for i in range(200)]}),
+        "regions": pd.DataFrame({"region_id": range(1, 51)}),
+        "stores": pd.DataFrame({"store_id": range(300), "area": [1 + i % 50 for i in range(300)]}),
+    }
+    banded = DiscoverKeys().run({"IR": _ir(tmp_path / "a", tables)}, workers=1)["IR"].data
+    full = DiscoverKeys().run({"IR": _ir(tmp_path / "b", tables)}, workers=1, exhaustive=True)["IR"].data
+    assert _fks(banded) == _fks(full)
+    assert ("area", "regions", "region_id") in _fks(banded)["stores"]
+
+def _sketch(values):
+    sk = ColumnSketch()
+    sk.update(hash_values(pa.array([str(v) for v in values])))
+    return sk
+
+def test_banded_lookup_only_touches_overlapping_keys():
+    # 3000 个互不相交的主键：分段查询只命中真正有交集的那个，穷举则比较全部
+    index = ContainmentIndex()
+    for k in range(3000):
+        index.add(k, _sketch(range(k * 1000, k * 1000 + 500)))
+    child = _sketch(range(1234 * 1000, 1234 * 1000 + 300))
+    assert index.lsh.query(child) == [1234]
+    assert [k for k, est in index.query(child, 0.7)] == [1234]
+    assert index.query(child, 0.7)[0][1] > 0.7
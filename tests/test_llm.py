@@ -0,0 +1,127 @@
+import json, socket, threading, time
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+from dataflow.providers import llm
+from dataflow.providers.llm import (CachedLLMClient, HTTPClient, LLMClient, LLMError, LLMCacheMiss, LLMHTTPError,
+                                   LLMRateLimitError)
+
+class FakeLLM(LLMClient):
+    endpoint = "http://fake"
+
+    def __init__(self, chunks, fail_after=None):
+        self.chunks = chunks
+        self.fail_after = fail_after
+        self.calls = 0
+
+    def complete(self, prompt: str) -> str:
+        self.calls += 1
+        return "".join(self.chunks)
+
+    def stream(self, prompt: str):
+        self.calls += 1
+        for i, c in enumerate(self.chunks):
+            if i == self.fail_after:
+                raise LLMError("stream interrupted: connection reset")
+            yield c
+
+def test_cache_modes(tmp_path):
+    inner = FakeLLM(["hello ", "world"])
+    rw = CachedLLMClient(inner, tmp_path, mode="readwrite")
+    assert rw.complete("p") == "hello world" and rw.complete("p") == "hello world"
+    assert inner.calls == 1 and (rw.hits, rw.misses) == (1, 1)
+    # record 总是请求并覆盖；replay 只读缓存，未命中报错
+    rec = CachedLLMClient(inner, tmp_path, mode="record")
+    rec.complete("p")
+    assert inner.calls == 2
+    rp = CachedLLMClient(FakeLLM([]), tmp_path, mode="replay")
+    assert rp.complete("p") == "hello world"
+    with pytest.raises(LLMCacheMiss):
+        rp.complete("other")
+
+def test_stream_closed_by_consumer_is_cached_as_partial(tmp_path):
+    inner = FakeLLM(["a", "b", "c"])
+    c = CachedLLMClient(inner, tmp_path)
+    gen = c.stream("p")
+    assert next(gen) == "a"
+    gen.close()
+    # 流式复用前缀；complete() 不复用 partial，重新请求
+    assert list(c.stream("p")) == ["a"] and inner.calls == 1
+    assert c.complete("p") == "abc" and inner.calls == 2
+
+def test_stream_upstream_error_is_not_cached(tmp_path):
+    inner = FakeLLM(["a", "b", "c"], fail_after=2)
+    c = CachedLLMClient(inner, tmp_path)
+    with pytest.raises(LLMError):
+        list(c.stream("p"))
+    assert c.get("p", allow_partial=True) is None
+    # 恢复后重新请求，完整响应入缓存
+    inner.fail_after = None
+    assert "".join(c.stream("p")) == "abc" and inner.calls == 2
+    assert list(c.stream("p")) == ["abc"] and inner.calls == 2
+
+class _Scripted(BaseHTTPRequestHandler):
+    """依次返回 script 中的 (状态码, 额外头)；用尽后返回 200"""
+    def do_POST(self):
+        self.rfile.read(int(self.headers["Content-Length"]))
+        srv = self.server
+        srv.requests += 1
+        status, headers = srv.script.pop(0) if srv.script else (200, {})
+        body = json.dumps({"answer": "ok"} if status == 200 else {"error": status}).encode()
+        self.send_response(status)
+        for k, v in headers.items():
+            self.send_header(k, v)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *_):
+        pass
+
+@pytest.fixture
+def server():
+    srv = ThreadingHTTPServer(("127.0.0.1", 0), _Scripted)
+    srv.script, srv.requests = [], 0
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    yield srv
+    srv.shutdown()
+    srv.server_close()
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    out = []
+    monkeypatch.setattr(llm.time, "sleep", out.append)
+    return out
+
+def _client(srv, **kw):
+    return HTTPClient(f"http://127.0.0.1:{srv.server_address[1]}/", "t", timeout=5, backoff_base=0.01, **kw)
+
+def test_retries_transient_errors_and_honours_retry_after(server, sleeps):
+    server.script = [(503, {"Retry-After": "7"}), (502, {}), (429, {"Retry-After": formatdate(time.time() + 30)})]
+    assert _client(server, max_retries=3).complete("p") == "ok"
+    assert server.requests == 4 and len(sleeps) == 3
+    # 秒数与 HTTP 日期两种 Retry-After 都作为等待下限；没有时按 full jitter 退避（backoff_base * 2**attempt 以内）
+    assert sleeps[0] == 7 and 0 <= sleeps[1] <= 0.02 and 28 < sleeps[2] <= 30
+
+def test_gives_up_with_typed_errors(server, sleeps):
+    server.script = [(429, {})] * 3
+    with pytest.raises(LLMRateLimitError) as e:
+        _client(server, max_retries=2).complete("p")
+    assert e.value.status == 429 and server.requests == 3 and len(sleeps) == 2
+
+    # 4xx（429 除外）不重试
+    server.script, server.requests = [(400, {})], 0
+    with pytest.raises(LLMHTTPError) as e:
+        _client(server, max_retries=2).complete("p")
+    assert e.value.status == 400 and not isinstance(e.value, LLMRateLimitError) and server.requests == 1
+
+def test_connection_errors_are_retried(sleeps):
+    # 绑定后立即关闭：该端口上无人监听，连接被拒
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    c = HTTPClient(f"http://127.0.0.1:{port}/", "t", timeout=5, max_retries=2, backoff_base=0.01)
+    with pytest.raises(LLMError, match="connection failed"):
+        c.complete("p")
+    assert len(sleeps) == 2
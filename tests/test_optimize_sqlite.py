@@ -0,0 +1,35 @@
+import sqlite3
+import pytest
+from dataflow.operators.optimize_sqlite import optimize_db
+
+@pytest.mark.parametrize("journal_mode", ["delete", "wal"])
+def test_page_size_and_indexes_survive_vacuum_into(tmp_path, journal_mode):
+    path = tmp_path / "db.sqlite"
+    conn = sqlite3.connect(path)
+    conn.execute(f"PRAGMA journal_mode={journal_mode}")
+    conn.executescript("""
+        CREATE TABLE customers (id INTEGER PRIMARY KEY, region TEXT);
+        CREATE TABLE orders (id INTEGER PRIMARY KEY, customer_id INTEGER REFERENCES customers(id), day TEXT);
+    """)
+    conn.executemany("INSERT INTO customers VALUES (?, ?)", [(i, f"r{i % 7}") for i in range(500)])
+    conn.executemany("INSERT INTO orders VALUES (?, ?, ?)", [(i, i % 500, f"d{i % 30}") for i in range(3000)])
+    conn.commit()
+    conn.close()
+
+    report = optimize_db(str(path), page_size=8192, index_columns={"orders": ["day"]}, repeat=1)
+    assert report["page_size"] == 8192
+    assert sorted(report["indexes_added"]) == ["idx_orders_customer_id", "idx_orders_day"]
+    assert not (tmp_path / "db.sqlite.vacuum").exists()
+
+    # 替换后的文件：新连接读到的页大小、索引、统计信息与数据
+    conn = sqlite3.connect(path)
+    try:
+        assert conn.execute("PRAGMA page_size").fetchone()[0] == 8192
+        indexes = {r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type='index'")}
+        assert {"idx_orders_customer_id", "idx_orders_day"} <= indexes
+        assert conn.execute("SELECT COUNT(*) FROM sqlite_stat1").fetchone()[0] > 0
+        assert conn.execute("SELECT COUNT(*) FROM orders").fetchone()[0] == 3000
+        plan = " ".join(r[-1] for r in conn.execute("EXPLAIN QUERY PLAN SELECT * FROM orders WHERE day = 'd3'"))
+        assert "idx_orders_day" in plan
+    finally:
+        conn.close()
@@ -0,0 +1,118 @@
+import sqlite3
+from dataflow.core.artifact import Artifact
+from dataflow.core.pipeline import Pipeline
+from dataflow.core.plan import plan
+from dataflow.providers.llm import LLMClient
+import dataflow.operators.augment_llm as augment_llm
+
+GOOD = """```python
+import os, sqlite3
+def extend_database():
+    conn = sqlite3.connect(os.environ["SQLITE_PATH"])
+    conn.executemany("INSERT INTO {t} (id, name) VALUES (?, ?)", [(i, f"n{{i}}") for i in range(1, 31)])
+    conn.commit()
+    return True
+```"""
+BAD = """```python
+def extend_database():
+    raise RuntimeError("boom")
+```"""
+
+class ScriptedLLM(LLMClient):
+    """t_ok 首轮即通过；t_fix 初始代码报错、修复一次后通过；t_never 始终报错"""
+    def complete(self, prompt: str) -> str:
+        t = next(t for t in ("t_ok", "t_fix", "t_never") if f"TABLE {t} " in prompt)
+        if t == "t_ok" or t == "t_fix" and "<ERROR>" in prompt:
+            return GOOD.format(t=t)
+        return BAD
+
+    def stream(self, prompt: str):
+        yield self.complete(prompt)
+
+def _meta(tmp_path):
+    meta = {}
+    for i, t in enumerate(("t_ok", "t_fix", "t_never")):
+        ddl = f"CREATE TABLE {t} (id INTEGER PRIMARY KEY, name TEXT NOT NULL)"
+        path = tmp_path / f"db_{i}.sqlite"
+        conn = sqlite3.connect(path)
+        conn.execute(ddl)
+        conn.close()
+        meta[f"db_{i}"] = {"sqlite_path": str(path), "table_meta": {t: ddl}}
+    return meta
+
+def _cfg(tmp_path, monkeypatch, max_iterations):
+    # input_globs 与配置一样按当前目录解析
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "input").mkdir(exist_ok=True)
+    for t in ("t_ok", "t_fix", "t_never"):
+        (tmp_path / "input" / f"{t}.csv").write_text("id,name\n1,a\n", encoding="utf-8")
+    return {"workdir": "wd", "steps": [
+        {"op": "IngestFiles", "params": {"input_globs": ["input/*.csv"], "dataset_id": "ds"}},
+        {"op": "AdaptiveCluster", "params": {"initial_k": 3}},
+        {"op": "ConsolidateSchema", "params": {"provider": "ir"}},
+        {"op": "AugmentWithLLM", "params": {"max_iterations": max_iterations}}]}
+
+def test_augment_plan_matches_run_metrics(tmp_path, monkeypatch):
+    m = 3
+    runs = []
+    real_exec = augment_llm.exec_python_code
+    def counting_exec(code, env, timeout=300):
+        runs.append(env["SQLITE_PATH"])
+        return real_exec(code, env, timeout)
+    monkeypatch.setattr(augment_llm, "exec_python_code", counting_exec)
+    monkeypatch.setattr(augment_llm, "get_llm_client", lambda provider, **cfg: ScriptedLLM())
+
+    cfg = _cfg(tmp_path, monkeypatch, m)
+    before = plan(cfg)["totals"]
+    assert (before["llm_calls_min"], before["llm_calls_max"], before["sandbox_runs_max"]) == (3, 3 * (1 + m), 3 * m)
+    assert before["llm_calls_expected"] == 3 * (1 + m)
+
+    pl = Pipeline(workdir=cfg["workdir"])
+    pl.ctx["AgentReadyMeta"] = Artifact(kind="AgentReadyMeta", data=_meta(tmp_path))
+    pl.run_step({"op": "AugmentWithLLM", "params": {"max_iterations": m, "sandbox": "subprocess",
+                                                    "stream_responses": False, "parallelism": 1}})
+    res = pl.ctx["AugmentResult"].data
+    assert {k: (r["success"], r["iterations"], r["llm_calls"]) for k, r in res.items()} == {
+        "db_0": (True, 1, 1), "db_1": (True, 2, 2), "db_2": (False, m, 1 + m)}
+    llm_calls = sum(r["llm_calls"] for r in res.values())
+
+    after = plan(cfg)["totals"]
+    assert after["llm_calls_min"] <= llm_calls <= after["llm_calls_max"]
+    assert len(runs) <= after["sandbox_runs_max"]
+    # 始终失败的库正好用满上限
+    assert res["db_2"]["llm_calls"] == 1 + m and runs.count(res["db_2"]["sqlite_path"]) == m
+    # 有历史后期望值按实际每库调用数估计
+    assert after["llm_calls_expected"] == llm_calls
+    step = next(s for s in plan(cfg)["steps"] if s["op"] == "AugmentWithLLM")
+    assert step["units"] == sum(r["iterations"] for r in res.values())
+
+def test_plan_expected_falls_back_to_iterations(tmp_path, monkeypatch):
+    # 旧版历史只记录了 iterations：期望调用数 = 每库 (1 + 平均轮数)
+    cfg = _cfg(tmp_path, monkeypatch, 5)
+    wd = tmp_path / "wd"
+    wd.mkdir()
+    (wd / "run_metrics.jsonl").write_text(
+        '{"op": "AugmentWithLLM", "seconds": 6.0, "units": {"dbs": 2, "iterations": 4}, "params": {}}\n', encoding="utf-8")
+    totals = plan(cfg)["totals"]
+    assert totals["llm_calls_expected"] == 3 * (1 + 2)
+    assert totals["llm_calls_max"] == 3 * 6
+
+def test_partitions_share_augment_budget_and_cache(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    dirs = []
+    def client(provider, workdir="", **cfg):
+        dirs.append(workdir)
+        return ScriptedLLM()
+    monkeypatch.setattr(augment_llm, "get_llm_client", client)
+    pl = Pipeline(workdir="wd", partition_workers=1)
+    pl.ctx["AgentReadyMeta"] = Artifact(kind="AgentReadyMeta", data=_meta(tmp_path))
+    pl.run_steps([{"op": "AugmentWithLLM", "partition_by": "AgentReadyMeta",
+                   "params": {"max_iterations": 3, "sandbox": "subprocess", "stream_responses": False,
+                              "parallelism": 1, "llm_call_budget": 2}}])
+    res = pl.ctx["AugmentResult"].data
+    # 三个分区共用 2 次调用的预算，而不是每个分区各 2 次
+    assert sum(r["llm_calls"] for r in res.values()) == 2
+    assert res["db_0"]["success"] and not res["db_2"]["success"] and res["db_2"]["llm_calls"] == 0
+    # 缓存与断点都在根 workdir（db_2 未开始，没有断点）
+    assert dirs == ["wd"] * 3
+    assert sorted(p.name for p in (tmp_path / "wd" / "augment_state").iterdir()) == ["db_0.json", "db_1.json"]
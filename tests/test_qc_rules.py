@@ -0,0 +1,85 @@
+import sqlite3
+import pytest
+from dataflow.qc_rules import base
+from dataflow.qc_rules.base import AggregateRule, connect_ro, run_fused, wilson_interval
+from dataflow.qc_rules.basic import ForeignKeyRule, NullRateRule, RowCountRule, VarcharLengthRule
+
+def _db(path, n=0):
+    conn = sqlite3.connect(path, isolation_level=None)
+    conn.executescript("""
+        CREATE TABLE parent (id INTEGER PRIMARY KEY, name VARCHAR(3));
+        CREATE TABLE codes (code TEXT);
+        CREATE TABLE child (id INTEGER PRIMARY KEY, pid INTEGER REFERENCES parent(id),
+                            code TEXT REFERENCES codes(code), note TEXT);
+        INSERT INTO parent VALUES (1, 'a'), (2, 'toolong'), (3, NULL);
+        INSERT INTO codes VALUES ('x'), ('y');
+        INSERT INTO child VALUES (1, 1, 'x', 'n'), (2, 9, 'y', NULL), (3, NULL, 'z', ''), (4, 2, NULL, 'm');
+    """)
+    conn.close()
+    return str(path)
+
+def _rules():
+    return [RowCountRule(3), NullRateRule(0.3), ForeignKeyRule(), VarcharLengthRule()]
+
+def test_fused_scan_matches_rules_run_alone(tmp_path, monkeypatch):
+    conn = connect_ro(_db(tmp_path / "db.sqlite"))
+    tables = ["parent", "codes", "child"]
+    alone = [run_fused([(r, tables)], conn)[0] for r in _rules()]
+
+    selects = []
+    conn.set_trace_callback(selects.append)
+    fused = run_fused([(r, tables) for r in _rules()], conn)
+    conn.set_trace_callback(None)
+    assert fused == alone
+    # 每表一条聚合 SELECT，多条规则共用的 COUNT(*) 只算一次；无索引外键另走一次反连接
+    for t in tables:
+        scans = [s for s in selects if s.endswith(f'FROM "{t}"')]
+        assert len(scans) == 1 and scans[0].count("COUNT(*)") == 1
+    assert sum("LEFT JOIN" in s for s in selects) == 1
+    assert [it["passed"] for it in fused[2]] == [False, False]   # child.pid -> 9、child.code -> 'z' 均违规
+
+    # 表达式超过单条 SELECT 上限时分段扫描，结果不变
+    monkeypatch.setattr(base, "MAX_EXPRS_PER_SCAN", 2)
+    assert run_fused([(r, tables) for r in _rules()], conn) == alone
+    conn.close()
+
+def test_wilson_interval_and_verdict():
+    lo, hi = wilson_interval(0, 100, 0.95)
+    assert lo == 0.0 and hi == pytest.approx(0.037, abs=1e-3)
+    lo, hi = wilson_interval(50, 100, 0.95)
+    assert lo == pytest.approx(1 - hi) and lo < 0.5 < hi
+    rule = AggregateRule()
+    assert rule.verdict(0, 1000, 0.05)[0] is True
+    assert rule.verdict(300, 1000, 0.05)[0] is False
+    assert rule.verdict(50, 1000, 0.05)[0] is None
+    assert rule.verdict(0, 0, 0.05) == (None, (0.0, 1.0))
+
+def test_uncertain_sample_escalates_to_exact_check(tmp_path):
+    path = tmp_path / "big.sqlite"
+    conn = sqlite3.connect(path, isolation_level=None)
+    conn.executescript("CREATE TABLE clear (id INTEGER PRIMARY KEY, v TEXT);"
+                       "CREATE TABLE edge (id INTEGER PRIMARY KEY, v TEXT);"
+                       "CREATE TABLE small (id INTEGER PRIMARY KEY, v TEXT);")
+    conn.executemany("INSERT INTO clear VALUES (?, 'x')", [(i,) for i in range(5000)])
+    # 空值率正好落在阈值附近：样本区间跨过 0.3，无法下结论
+    conn.executemany("INSERT INTO edge VALUES (?, ?)", [(i, None if i % 10 < 3 else "x") for i in range(5000)])
+    conn.executemany("INSERT INTO small VALUES (?, 'x')", [(i,) for i in range(150)])
+    conn.close()
+
+    rule = NullRateRule(0.3)
+    rule.sample_size = 100
+    tables = ["clear", "edge", "small"]
+    ro = connect_ro(str(path))
+    try:
+        approx = run_fused([(rule, tables)], ro, approx=True)[0]
+        exact = run_fused([(rule, tables)], ro)[0]
+    finally:
+        ro.close()
+    by_table = {}
+    for it in approx:
+        by_table.setdefault(it["table"], []).append(it)
+    assert all(it["details"].get("approximate") and it["passed"] for it in by_table["clear"])
+    assert all(it["details"]["sampled"] == 100 for it in by_table["clear"])
+    # 不确定的表与不比样本大多少的表都给精确结果
+    assert by_table["edge"] == [it for it in exact if it["table"] == "edge"]
+    assert by_table["small"] == [it for it in exact if it["table"] == "small"]
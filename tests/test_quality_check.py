@@ -0,0 +1,69 @@
+import sqlite3
+from dataflow.operators import quality_check
+from dataflow.operators.quality_check import QCSession
+
+RULES = [("dataflow.qc_rules.basic.RowCountRule", {"min_records_per_table": 2}),
+         ("dataflow.qc_rules.basic.ForeignKeyRule", {})]
+
+def _db(path):
+    conn = sqlite3.connect(path, isolation_level=None)
+    conn.executescript("""
+        CREATE TABLE parent (id INTEGER PRIMARY KEY);
+        CREATE TABLE other (id INTEGER PRIMARY KEY);
+        CREATE TABLE child (id INTEGER PRIMARY KEY, pid INTEGER REFERENCES parent(id));
+        CREATE TABLE big (id INTEGER PRIMARY KEY, oid INTEGER REFERENCES other(id));
+        INSERT INTO parent VALUES (1);
+        INSERT INTO other VALUES (1), (2);
+        INSERT INTO child VALUES (1, 1), (2, 1);
+        INSERT INTO big VALUES (1, 1), (2, 2), (3, 1);
+    """)
+    return conn
+
+def test_incremental_session_leaves_no_objects_and_rechecks(tmp_path, monkeypatch):
+    db = str(tmp_path / "work.sqlite")
+    conn = _db(db)
+    scanned = []
+    fused = quality_check.run_fused
+    def spy(plan, *a, **kw):
+        scanned.append({r.id: set(ts) for r, ts in plan})
+        return fused(plan, *a, **kw)
+    monkeypatch.setattr(quality_check, "run_fused", spy)
+
+    qc = QCSession(db, RULES)
+    try:
+        ok, report, _ = qc.check()
+        assert not ok   # parent 只有 1 行
+        # 检查不向库内写任何对象（触发器 / 版本表）
+        assert conn.execute("SELECT type, name FROM sqlite_master WHERE type='trigger' OR name LIKE '_dataflow%'").fetchall() == []
+
+        # 只有 child 变化：big 不重扫；仍未通过的 parent 每次都重查
+        scanned.clear()
+        conn.execute("INSERT INTO child VALUES (3, 1)")
+        ok, _, _ = qc.check()
+        assert not ok and scanned[-1]["row_count"] == {"child", "parent"}
+
+        # 修好 parent 的同时原地 UPDATE 弄坏 big 的外键：行数与最大 rowid 不变，增量看不到，
+        # 但增量全部通过后的整库复查会发现
+        scanned.clear()
+        conn.execute("BEGIN")
+        conn.execute("INSERT INTO parent VALUES (2)")
+        conn.execute("UPDATE big SET oid = 99 WHERE id = 2")
+        conn.execute("COMMIT")
+        ok, report, _ = qc.check()
+        assert "big" not in scanned[0]["fk_integrity"] and "big" in scanned[-1]["fk_integrity"]
+        assert not ok and any(r["rule_id"] == "fk_integrity" and r["table"] == "big" and not r["passed"] for r in report)
+
+        conn.execute("UPDATE big SET oid = 2 WHERE id = 2")
+        assert qc.check()[0]
+    finally:
+        qc.close()
+        conn.close()
+
+def test_session_strips_legacy_tracking_objects(tmp_path):
+    db = str(tmp_path / "work.sqlite")
+    conn = _db(db)
+    conn.execute(f"CREATE TABLE {quality_check.TRACK_TABLE} (tbl TEXT PRIMARY KEY, version INTEGER NOT NULL)")
+    conn.execute("CREATE TRIGGER _dataflow_qc_child_ai AFTER INSERT ON child BEGIN SELECT 1; END")
+    QCSession(db, RULES).close()
+    assert conn.execute("SELECT name FROM sqlite_master WHERE name LIKE '_dataflow%'").fetchall() == []
+    conn.close()
@@ -0,0 +1,54 @@
+import json, sqlite3, threading, time, urllib.request
+import pytest
+from dataflow.core.serve import ConnectionPool, DatabaseRegistry, QueryServer, QueryTimeout
+
+SLOW = "WITH RECURSIVE c(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM c) SELECT COUNT(*) FROM c"
+
+def _db(tmp_path, n=5):
+    path = tmp_path / "db_0.sqlite"
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE t (id INTEGER PRIMARY KEY)")
+    conn.executemany("INSERT INTO t VALUES (?)", [(i,) for i in range(n)])
+    conn.commit()
+    conn.close()
+    return path
+
+def test_deadline_includes_wait_for_connection(tmp_path):
+    pool = ConnectionPool(str(_db(tmp_path)), size=1)
+    held = threading.Event()
+    def hold():
+        with pool.connection(5):
+            held.set()
+            time.sleep(0.3)
+    threading.Thread(target=hold).start()
+    held.wait()
+    t0 = time.monotonic()
+    # 排队 0.3s 后拿到连接：查询只剩约 0.1s，而不是完整的 0.4s
+    with pytest.raises(sqlite3.OperationalError, match="interrupted"):
+        with pool.connection(0.4) as conn:
+            conn.execute(SLOW).fetchall()
+    assert time.monotonic() - t0 < 0.6
+    with pool.connection(0.1):
+        with pytest.raises(QueryTimeout):
+            with pool.connection(0.1):
+                pass
+    pool.close()
+
+def _query(port, **req):
+    body = json.dumps({"db": "db_0", "sql": "SELECT id FROM t", **req}).encode()
+    with urllib.request.urlopen(urllib.request.Request(f"http://127.0.0.1:{port}/query", data=body)) as r:
+        return [json.loads(line) for line in r.read().splitlines()]
+
+def test_truncated_only_when_rows_remain(tmp_path):
+    path = _db(tmp_path, n=5)
+    (tmp_path / "agent_ready_metadata.json").write_text(json.dumps({"db_0": {"sqlite_path": str(path)}}), "utf-8")
+    server = QueryServer(("127.0.0.1", 0), DatabaseRegistry(str(tmp_path)), batch_rows=2)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        port = server.server_address[1]
+        assert _query(port, max_rows=5)[-1]["truncated"] is False
+        out = _query(port, max_rows=4)
+        assert out[-1] == {**out[-1], "rows": 4, "truncated": True} and len(out) == 6
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,20 @@
+import pytest
+from dataflow.utils.sqlite_exec import SandboxPool
+
+def _outputs(preload, code, n=3):
+    pool = SandboxPool(size=1, preload=preload)
+    try:
+        return [pool.run(code, {}, timeout=30)[0] for _ in range(n)]
+    finally:
+        pool.close()
+
+def test_forked_children_do_not_share_numpy_random_state():
+    pytest.importorskip("numpy")
+    # numpy 2.x 的 numpy.random 是惰性子模块：预导入它，全局 RandomState 才会在 zygote 中建好并被 fork 继承
+    out = _outputs(["numpy.random"], "import numpy; print(numpy.random.randint(1 << 30), numpy.random.rand())")
+    assert all(out) and len(set(out)) == len(out)
+
+def test_forked_children_do_not_share_faker_random_state():
+    pytest.importorskip("faker")
+    out = _outputs(["faker"], "from faker import Faker; f = Faker(); print(f.name(), f.pyint(0, 1 << 30))")
+    assert all(out) and len(set(out)) == len(out)
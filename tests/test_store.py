@@ -0,0 +1,14 @@
+import json
+from dataflow.core.artifact import Artifact
+from dataflow.core.store import ArtifactStore
+
+def test_spill_is_store_owned_and_keeps_types(tmp_path):
+    store = ArtifactStore(tmp_path / "spill")
+    cmap = Artifact(kind="ClusterMap", data={0: ["a", "b"], 1: ["c"]}).save_json(str(tmp_path / "cluster_map.json"))
+    store["ClusterMap"] = cmap
+    store.spill("ClusterMap")
+    assert cmap.data is None and store.resident() == []
+    # 生产者之后改写了自己的 JSON 文件：不影响已落盘的产物
+    (tmp_path / "cluster_map.json").write_text(json.dumps({"9": ["z"]}), "utf-8")
+    assert store["ClusterMap"].data == {0: ["a", "b"], 1: ["c"]}
+    assert store.resident() == ["ClusterMap"]
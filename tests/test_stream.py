@@ -0,0 +1,64 @@
+import threading, time
+import numpy as np
+from dataflow.core.artifact import Artifact
+from dataflow.core.operator import Operator
+from dataflow.core.registry import OP_REGISTRY
+from dataflow.core.stream import run_stream
+from dataflow.ir.schema import new_ir
+from dataflow.operators.embed import EmbedTables
+from dataflow.providers.embedding import DummyEmbedding
+
+N = 20
+produced = []
+release = threading.Event()
+
+class _Source(Operator):
+    def stream(self, upstream, ir, **_):
+        ir.update(new_ir("ds"))
+        for i in range(N):
+            produced.append(i)
+            yield f"t{i}", {"header": ["id"], "content": {"row_count": i}}
+
+class _Slow(Operator):
+    input_kinds = ["IR"]
+
+    def stream(self, upstream, ir, **_):
+        release.wait(5)
+        for item in upstream:
+            yield item
+
+def test_bounded_queue_applies_backpressure(tmp_path, monkeypatch):
+    monkeypatch.setitem(OP_REGISTRY, "_Source", _Source)
+    monkeypatch.setitem(OP_REGISTRY, "_Slow", _Slow)
+    produced.clear()
+    release.clear()
+    box = {}
+    th = threading.Thread(target=lambda: box.update(out=run_stream([{"op": "_Source"}, {"op": "_Slow"}], {},
+                                                                   str(tmp_path), buffer=2)))
+    th.start()
+    time.sleep(0.3)
+    # 下游未消费：源算子只能填满队列（2 张）再多产出 1 张阻塞在 put 上
+    assert len(produced) == 3
+    release.set()
+    th.join(5)
+    ir, _, stats = box["out"]
+    assert list(ir["table_header"]) == [f"t{i}" for i in range(N)]
+    assert [s["tables"] for s in stats] == [N, N] and stats[0]["rows"] == sum(range(N))
+
+def test_dummy_embedding_is_deterministic_per_text():
+    texts = ["a", "b", "c"]
+    whole = DummyEmbedding().embed(texts)
+    assert np.array_equal(whole, np.vstack([DummyEmbedding().embed([t]) for t in texts]))
+    assert np.array_equal(whole[:1], DummyEmbedding().embed(["a"])) and not np.array_equal(whole[0], whole[1])
+
+def test_embedding_independent_of_batching(tmp_path):
+    ir = new_ir("ds")
+    for i in range(7):
+        ir["table_header"][f"t{i}"] = ["id", f"c{i}"]
+    vecs = []
+    for batch_size in (1, 3, 8):
+        out = EmbedTables().run({"IR": Artifact(kind="IR", data=ir)}, batch_size=batch_size, parallelism=4,
+                                workdir=str(tmp_path))
+        assert out["Embeddings"].data["ids"] == list(ir["table_header"])
+        vecs.append(out["Embeddings"].data["vectors"])
+    assert vecs[0] == vecs[1] == vecs[2]
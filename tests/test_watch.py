@@ -0,0 +1,56 @@
+import os
+from pathlib import Path
+import pytest
+import yaml
+from dataflow.core.watch import Watcher
+
+ROOT = Path(__file__).resolve().parents[1]
+
+def _write(tmp_path):
+    inp = tmp_path / "input"
+    inp.mkdir()
+    (inp / "customers.csv").write_text("id,name\n" + "".join(f"{i},c{i}\n" for i in range(1, 301)), encoding="utf-8")
+    (inp / "orders.csv").write_text("id,customer_id\n" + "".join(f"{i},{1 + i % 300}\n" for i in range(1, 501)),
+                                    encoding="utf-8")
+    (inp / "orders.json").write_text('[{"id": 9001, "customer_id": 5}]', encoding="utf-8")
+    (inp / "misc.csv").write_text("a,b\n1,2\n3,4\n", encoding="utf-8")
+    cfg = {"workdir": "wd", "partition_workers": 1, "steps": [
+        {"op": "IngestFiles", "params": {"input_globs": ["input/*.csv", "input/*.json"], "dataset_id": "ds"}},
+        {"op": "Deduplicate"},
+        {"op": "EmbedTables", "params": {"provider": "dummy"}},
+        {"op": "DiscoverKeys", "params": {"workers": 1}},
+        {"op": "AdaptiveCluster", "params": {"initial_k": 1, "max_cluster_size": 5}}]}
+    (tmp_path / "cfg.yaml").write_text(yaml.safe_dump(cfg), encoding="utf-8")
+
+def test_shipped_configs():
+    w = Watcher(str(ROOT / "configs" / "watch.yaml"))
+    w.load_config()
+    assert [s["op"] for s in w.replay] == ["Deduplicate", "EmbedTables", "DiscoverKeys"]
+    w.pl.close()
+    # pipeline.yaml 的 IngestDB 在 IngestFiles 之后整体替换 IR：启动时明确报错并指向 watch.yaml
+    with pytest.raises(ValueError, match="watch.yaml"):
+        Watcher(str(ROOT / "configs" / "pipeline.yaml")).load_config()
+
+def test_update_replays_keys_for_changed_tables_only(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    _write(tmp_path)
+    w = Watcher("cfg.yaml")
+    w.load_config()
+    try:
+        w.full()
+        assert w.pl.ctx["IR"].data["meta"]["key_discovery"]["sketched_tables"] == 3
+        # orders 由两个文件变为一个：旧的 part_1.parquet 不能被再次读入
+        os.remove("input/orders.json")
+        with open("input/orders.csv", "a", encoding="utf-8") as f:
+            f.write("501,7\n")
+        w.update(w.scan())
+        ir = w.pl.ctx["IR"].data
+        assert ir["table_content"]["orders"]["row_count"] == 501
+        assert sorted(os.listdir("wd/staging/ds/orders")) == ["part_0.parquet"]
+        # DiscoverKeys 被重放，且只重新草图变化的表
+        assert ir["meta"]["key_discovery"]["sketched_tables"] == 1
+        assert [(fk["column"], fk["ref_table"]) for fk in ir["table_schema"]["orders"]["foreign_keys"]] == [
+            ("customer_id", "customers")]
+        assert ir["table_schema"]["orders"]["primary_key"] == ["id"]
+    finally:
+        w.pl.close()